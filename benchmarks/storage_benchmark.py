@@ -0,0 +1,318 @@
+"""
+Benchmarks Storage operations against any StorageClient.
+
+Every operation is run for each object size and concurrency level, and the
+throughput, latency percentiles and network round trips per call are
+written as JSON, one file per run, so results can be compared between
+releases:
+
+    python -m benchmarks.storage_benchmark --backend inmemory \
+        --sizes 1024,1048576 --concurrency 1,8 --output results.json
+
+The s3 and gcs backends are configured from the environment like the test
+suites, e.g. against the docker compose MinIO and fake-gcs-server.
+"""
+import argparse
+import json
+import platform
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from io import BytesIO
+from math import ceil
+from tempfile import TemporaryDirectory
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Dict, List, Optional
+from uuid import uuid4
+
+from multicloud_storage import (
+    GCS,
+    InMemory,
+    LocalFS,
+    S3,
+    Storage,
+    StorageObserver,
+    __version__,
+)
+from multicloud_storage.client import StorageClient
+from multicloud_storage.http import HttpMethod
+
+OPERATIONS = (
+    "put_object",
+    "get_object",
+    "list_objects",
+    "copy_object",
+    "concat_objects",
+    "get_presigned_url",
+)
+# operations whose cost does not depend on the object size run for the
+# first size only
+SIZE_INDEPENDENT = ("list_objects", "get_presigned_url")
+# objects below the listed prefix, so listings span several pages
+LIST_OBJECTS = 2500
+
+
+class RoundTripCounter(StorageObserver):
+    """
+    Counts the requests a client sends, as reported to the Storage observer.
+    The local file system makes none.
+    """
+
+    def __init__(self) -> None:
+        self._count = 0
+        self._lock = Lock()
+
+    def on_request(
+        self,
+        backend: str,
+        method: str,
+        status: Optional[int],
+        seconds: float,
+    ) -> None:
+        with self._lock:
+            self._count += 1
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+
+def _percentile(samples: List[float], percentile: float) -> float:
+    ordered = sorted(samples)
+    return ordered[max(0, ceil(percentile / 100 * len(ordered)) - 1)]
+
+
+def _measure(
+    call: Callable[[int], int],
+    iterations: int,
+    concurrency: int,
+    counter: RoundTripCounter,
+) -> Dict:
+    """
+    Runs call(i) for every iteration on concurrency threads. call returns
+    the number of payload bytes it moved.
+    """
+    latencies: List[float] = []
+
+    def _timed(iteration: int) -> int:
+        started = perf_counter()
+        moved = call(iteration)
+        latencies.append(perf_counter() - started)
+        return moved
+
+    requests = counter.count
+    started = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        moved = sum(executor.map(_timed, range(iterations)))
+    elapsed = perf_counter() - started
+    return {
+        "iterations": iterations,
+        "seconds": elapsed,
+        "ops_per_sec": iterations / elapsed,
+        "bytes_per_sec": moved / elapsed,
+        "latency_ms": {
+            "mean": sum(latencies) / len(latencies) * 1000,
+            "p50": _percentile(latencies, 50) * 1000,
+            "p90": _percentile(latencies, 90) * 1000,
+            "p99": _percentile(latencies, 99) * 1000,
+            "max": max(latencies) * 1000,
+        },
+        "round_trips_per_call": (counter.count - requests) / iterations,
+    }
+
+
+def _put(storage: Storage, bucket_name: str, name: str, payload: bytes) -> int:
+    storage.put_object(bucket_name, name, BytesIO(payload), len(payload))
+    return len(payload)
+
+
+def _operation(
+    operation: str,
+    storage: Storage,
+    bucket_name: str,
+    prefix: str,
+    payload: bytes,
+) -> Callable[[int], int]:
+    """
+    Prepares the objects an operation reads and returns the call to time.
+    """
+    size = len(payload)
+    source = prefix + "source"
+    if operation == "put_object":
+        return lambda i: _put(
+            storage, bucket_name, "{0}put/{1}".format(prefix, i), payload
+        )
+    if operation == "get_object":
+        _put(storage, bucket_name, source, payload)
+        return lambda _: len(
+            storage.get_object(bucket_name, source).getbuffer()
+        )
+    if operation == "list_objects":
+        for i in range(LIST_OBJECTS):
+            _put(storage, bucket_name, "{0}list/{1}".format(prefix, i), b"")
+
+        def _list(_: int) -> int:
+            list(
+                storage.list_objects(
+                    bucket_name, prefix + "list/", compact=True
+                )
+            )
+            return 0
+
+        return _list
+    if operation == "copy_object":
+        _put(storage, bucket_name, source, payload)
+
+        def _copy(i: int) -> int:
+            storage.copy_object(
+                bucket_name,
+                source,
+                bucket_name,
+                "{0}copy/{1}".format(prefix, i),
+            )
+            return size
+
+        return _copy
+    if operation == "concat_objects":
+        _put(storage, bucket_name, source, payload)
+
+        def _concat(i: int) -> int:
+            storage.concat_objects(
+                bucket_name,
+                "{0}concat/{1}".format(prefix, i),
+                [source, source],
+            )
+            return 2 * size
+
+        return _concat
+    if operation == "get_presigned_url":
+        _put(storage, bucket_name, source, payload)
+
+        def _sign(_: int) -> int:
+            storage.get_presigned_url(bucket_name, source, HttpMethod.GET)
+            return 0
+
+        return _sign
+    raise ValueError("unknown operation {0}".format(operation))
+
+
+def _client(backend: str, root: str, latency: float) -> StorageClient:
+    if backend == "inmemory":
+        return InMemory(latency=latency)
+    if backend == "localfs":
+        return LocalFS(root)
+    if backend == "s3":
+        return S3()
+    if backend == "gcs":
+        return GCS()
+    raise ValueError("unknown backend {0}".format(backend))
+
+
+def run(
+    backend: str,
+    sizes: List[int],
+    concurrency_levels: List[int],
+    iterations: int,
+    operations: List[str],
+    latency: float = 0.0,
+) -> Dict:
+    with TemporaryDirectory() as root:
+        counter = RoundTripCounter()
+        storage = Storage(_client(backend, root, latency), observer=counter)
+        bucket_name = "benchmark-{0}".format(uuid4().hex[:12])
+        storage.make_bucket(bucket_name)
+        results = []
+        try:
+            for operation in operations:
+                for size in (
+                    sizes[:1] if operation in SIZE_INDEPENDENT else sizes
+                ):
+                    payload = bytes(size)
+                    for concurrency in concurrency_levels:
+                        prefix = "{0}/{1}/{2}/".format(
+                            operation, size, concurrency
+                        )
+                        call = _operation(
+                            operation, storage, bucket_name, prefix, payload
+                        )
+                        result = _measure(
+                            call, iterations, concurrency, counter
+                        )
+                        result.update(
+                            operation=operation,
+                            size=size,
+                            concurrency=concurrency,
+                        )
+                        print(
+                            "{0:<18} {1:>10} B x{2:<3} {3:>10.1f} ops/s"
+                            " p50 {4:.2f} ms p99 {5:.2f} ms"
+                            " {6:.2f} round trips".format(
+                                operation,
+                                size,
+                                concurrency,
+                                result["ops_per_sec"],
+                                result["latency_ms"]["p50"],
+                                result["latency_ms"]["p99"],
+                                result["round_trips_per_call"],
+                            ),
+                            file=sys.stderr,
+                        )
+                        results.append(result)
+                        storage.delete_prefix(bucket_name, prefix)
+        finally:
+            storage.remove_bucket(bucket_name, force=True)
+    return {
+        "backend": backend,
+        "version": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "started": datetime.now(timezone.utc).isoformat(),
+        "results": results,
+    }
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--backend",
+        choices=("inmemory", "localfs", "s3", "gcs"),
+        default="inmemory",
+    )
+    parser.add_argument("--sizes", type=_int_list, default=[1024, 1048576])
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 8])
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument(
+        "--operations",
+        type=lambda value: value.split(","),
+        default=list(OPERATIONS),
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="seconds of injected latency per request (inmemory only)",
+    )
+    parser.add_argument("--output", help="JSON file, stdout by default")
+    args = parser.parse_args(argv)
+    report = run(
+        args.backend,
+        args.sizes,
+        args.concurrency,
+        args.iterations,
+        args.operations,
+        args.latency,
+    )
+    if args.output:
+        with open(args.output, "w") as outfile:
+            json.dump(report, outfile, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
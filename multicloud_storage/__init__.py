@@ -2,10 +2,42 @@
 
 __version__ = "0.8.0"
 
+from .async_storage import AsyncStorage
+from .disk_cache import DiskCache
 from .gcs import GCS
+from .inmemory import InMemory
+from .limiter import AdaptiveLimiter
+from .localfs import LocalFS
+from .memory_cache import MemoryCache
+from .metrics import Metrics, StorageObserver
 from .minio import S3
+from .pool import PoolConfig
+from .retry import RetryBudget, RetryPolicy
 from .storage import Storage
-from .exception import StorageException
+from .exception import StorageException, TransferError
 from .http import HttpMethod
+from .transfer import TransferConfig
+from .transfer_manager import TransferManager, TransferResult
 
-__all__ = ["GCS", "S3", "Storage", "HttpMethod", "StorageException"]
+__all__ = [
+    "AdaptiveLimiter",
+    "AsyncStorage",
+    "DiskCache",
+    "GCS",
+    "InMemory",
+    "LocalFS",
+    "MemoryCache",
+    "Metrics",
+    "PoolConfig",
+    "RetryBudget",
+    "RetryPolicy",
+    "S3",
+    "Storage",
+    "HttpMethod",
+    "StorageException",
+    "StorageObserver",
+    "TransferConfig",
+    "TransferError",
+    "TransferManager",
+    "TransferResult",
+]
@@ -0,0 +1,370 @@
+from asyncio import Semaphore, gather, get_running_loop
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+from io import BytesIO
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Union,
+)
+
+from .client import DEFAULT_CHUNK_SIZE, StorageClient
+from .disk_cache import ObjectData
+from .exception import StorageException
+from .http import HttpMethod
+from .object import ListPage, StorageObject
+from .storage import Storage
+
+DEFAULT_MAX_CONCURRENCY = 32
+
+
+class AsyncStorage:
+    """
+    AsyncStorage.
+
+    Exposes the Storage operations as coroutines. Calls run on a thread pool
+    owned by this instance and a semaphore caps how many are in flight, so any
+    number of concurrent callers share one event loop and a bounded set of
+    threads. The requests get_many and put_many fan out also wait for the
+    bucket's adaptive limiter, the one the client's own parallel transfers
+    share, and so start at its initial limit and ramp up. Other calls are
+    only bounded by max_concurrency.
+    """
+
+    def __init__(
+        self,
+        storage: Union[Storage, StorageClient],
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    ) -> None:
+        if max_concurrency <= 0:
+            raise StorageException("max_concurrency must be positive")
+        self._storage = (
+            storage if isinstance(storage, Storage) else Storage(storage)
+        )
+        self._max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency,
+            thread_name_prefix="multicloud-storage",
+        )
+        # created on first use so it binds to the loop that awaits it
+        self._semaphore: Optional[Semaphore] = None
+
+    @property
+    def storage(self) -> Storage:
+        return self._storage
+
+    async def __aenter__(self) -> "AsyncStorage":
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    async def _run(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        if self._semaphore is None:
+            self._semaphore = Semaphore(self._max_concurrency)
+        async with self._semaphore:
+            return await get_running_loop().run_in_executor(
+                self._executor, partial(func, *args, **kwargs)
+            )
+
+    async def _run_limited(
+        self, bucket_name: str, name: str, func: Callable, *args: Any
+    ) -> Any:
+        limiter = self._storage._client._limiter(bucket_name, name)
+        return await self._run(limiter.call, partial(func, *args))
+
+    async def bucket_exists(self, name: str) -> bool:
+        return await self._run(self._storage.bucket_exists, name)
+
+    async def make_bucket(self, name: str) -> None:
+        return await self._run(self._storage.make_bucket, name)
+
+    async def remove_bucket(self, name: str, force: bool = False) -> None:
+        return await self._run(self._storage.remove_bucket, name, force)
+
+    async def put_object(
+        self,
+        bucket_name: str,
+        name: str,
+        data: BytesIO,
+        size: int,
+    ) -> None:
+        return await self._run(
+            self._storage.put_object, bucket_name, name, data, size
+        )
+
+    async def get_object(
+        self, bucket_name: str, name: str
+    ) -> ObjectData:
+        return await self._run(self._storage.get_object, bucket_name, name)
+
+    async def get_object_range(
+        self,
+        bucket_name: str,
+        name: str,
+        offset: int,
+        length: Optional[int] = None,
+    ) -> BytesIO:
+        return await self._run(
+            self._storage.get_object_range,
+            bucket_name,
+            name,
+            offset,
+            length,
+        )
+
+    async def iter_object(
+        self,
+        bucket_name: str,
+        name: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> AsyncIterator[bytes]:
+        chunks = await self._run(
+            self._storage.iter_object, bucket_name, name, chunk_size
+        )
+        try:
+            while True:
+                chunk = await self._run(next, chunks, None)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            # a consumer that breaks out or is cancelled leaves the stream,
+            # and its pooled connection, to be released here
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                try:
+                    await self._run(close)
+                except RuntimeError:
+                    # the executor was shut down before the generator was
+                    # finalized
+                    close()
+
+    async def object_exists(self, bucket_name: str, name: str) -> bool:
+        return await self._run(self._storage.object_exists, bucket_name, name)
+
+    async def stat_object(
+        self, bucket_name: str, name: str
+    ) -> StorageObject:
+        return await self._run(self._storage.stat_object, bucket_name, name)
+
+    async def download_to_path(
+        self,
+        bucket_name: str,
+        name: str,
+        path: str,
+        concurrency: Optional[int] = None,
+        part_size: Optional[int] = None,
+    ) -> None:
+        return await self._run(
+            self._storage.download_to_path,
+            bucket_name,
+            name,
+            path,
+            concurrency,
+            part_size,
+        )
+
+    async def delete_object(self, bucket_name: str, name: str) -> None:
+        return await self._run(self._storage.delete_object, bucket_name, name)
+
+    async def delete_objects(
+        self, bucket_name: str, names: Iterable[str]
+    ) -> Dict[str, StorageException]:
+        return await self._run(
+            self._storage.delete_objects, bucket_name, list(names)
+        )
+
+    async def delete_prefix(
+        self,
+        bucket_name: str,
+        prefix: Optional[str],
+        concurrency: Optional[int] = None,
+    ) -> Dict[str, StorageException]:
+        return await self._run(
+            self._storage.delete_prefix, bucket_name, prefix, concurrency
+        )
+
+    async def get_presigned_url(
+        self,
+        bucket_name: str,
+        name: str,
+        method: Union[str, HttpMethod],
+        expires: Optional[timedelta] = timedelta(days=1),
+        content_type: Optional[str] = None,
+        use_hostname: Optional[str] = None,
+        secure: Optional[bool] = None,
+    ) -> str:
+        return await self._run(
+            self._storage.get_presigned_url,
+            bucket_name,
+            name,
+            method,
+            expires,
+            content_type,
+            use_hostname,
+            secure,
+        )
+
+    async def get_presigned_urls(
+        self,
+        bucket_name: str,
+        names: Iterable[str],
+        method: Union[str, HttpMethod],
+        expires: Optional[timedelta] = timedelta(days=1),
+        content_type: Optional[str] = None,
+        use_hostname: Optional[str] = None,
+        secure: Optional[bool] = None,
+        verify: bool = False,
+    ) -> Dict[str, str]:
+        return await self._run(
+            self._storage.get_presigned_urls,
+            bucket_name,
+            list(names),
+            method,
+            expires,
+            content_type,
+            use_hostname,
+            secure,
+            verify=verify,
+        )
+
+    async def list_objects(
+        self,
+        bucket_name: str,
+        prefix: Optional[str] = None,
+        compact: bool = False,
+    ) -> List[StorageObject]:
+        # listing pages are fetched while iterating, so drain it off the loop
+        return await self._run(
+            lambda: list(
+                self._storage.list_objects(bucket_name, prefix, compact)
+            )
+        )
+
+    async def list_objects_page(
+        self,
+        bucket_name: str,
+        prefix: Optional[str] = None,
+        page_token: Optional[str] = None,
+        start_after: Optional[str] = None,
+        max_keys: Optional[int] = None,
+        delimiter: Optional[str] = None,
+        compact: bool = False,
+    ) -> ListPage:
+        return await self._run(
+            self._storage.list_objects_page,
+            bucket_name,
+            prefix,
+            page_token,
+            start_after,
+            max_keys,
+            delimiter,
+            compact,
+        )
+
+    async def copy_object(
+        self,
+        source_bucket_name: str,
+        source_name: str,
+        destination_bucket_name: str,
+        destination_name: str,
+    ) -> None:
+        return await self._run(
+            self._storage.copy_object,
+            source_bucket_name,
+            source_name,
+            destination_bucket_name,
+            destination_name,
+        )
+
+    async def rename_object(
+        self,
+        bucket_name: str,
+        name: str,
+        new_name: str,
+    ) -> None:
+        return await self._run(
+            self._storage.rename_object,
+            bucket_name,
+            name,
+            new_name,
+        )
+
+    async def concat_objects(
+        self,
+        bucket_name: str,
+        destination_object: str,
+        source_objects: List[str],
+    ) -> None:
+        return await self._run(
+            self._storage.concat_objects,
+            bucket_name,
+            destination_object,
+            source_objects,
+        )
+
+    async def md5_checksum(self, bucket_name: str, name: str) -> str:
+        return await self._run(self._storage.md5_checksum, bucket_name, name)
+
+    async def get_many(
+        self, bucket_name: str, names: Iterable[str]
+    ) -> List[ObjectData]:
+        """
+        Fetches the objects concurrently, returning them in the order of
+        names.
+        """
+        return list(
+            await gather(
+                *(
+                    self._run_limited(
+                        bucket_name,
+                        name,
+                        self._storage.get_object,
+                        bucket_name,
+                        name,
+                    )
+                    for name in names
+                )
+            )
+        )
+
+    async def put_many(
+        self, bucket_name: str, objects: Dict[str, BytesIO]
+    ) -> None:
+        """
+        Uploads the buffers concurrently, keyed by object name.
+        """
+        await gather(
+            *(
+                self._put_limited(
+                    bucket_name, name, data, data.getbuffer().nbytes
+                )
+                for name, data in objects.items()
+            )
+        )
+
+    async def _put_limited(
+        self, bucket_name: str, name: str, data: BytesIO, size: int
+    ) -> None:
+        if self._storage._client._transfer_config.use_multipart(size):
+            # the parts wait for the limiter on their own
+            return await self.put_object(bucket_name, name, data, size)
+        return await self._run_limited(
+            bucket_name,
+            name,
+            self._storage.put_object,
+            bucket_name,
+            name,
+            data,
+            size,
+        )
@@ -0,0 +1,42 @@
+from threading import Lock
+from time import monotonic
+from typing import Dict
+
+
+class BucketCache:
+    """
+    BucketCache.
+
+    Remembers buckets that were recently seen to exist so the existence guard
+    in front of most operations does not cost a round trip on every call.
+    Only positive answers are cached and a ttl of zero disables the cache.
+    """
+
+    def __init__(self, ttl: float = 0.0) -> None:
+        self.ttl = ttl
+        self._expires_at: Dict[str, float] = {}
+        self._lock = Lock()
+
+    def exists(self, name: str) -> bool:
+        with self._lock:
+            expires_at = self._expires_at.get(name)
+            if expires_at is None:
+                return False
+            if expires_at <= monotonic():
+                del self._expires_at[name]
+                return False
+            return True
+
+    def add(self, name: str) -> None:
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._expires_at[name] = monotonic() + self.ttl
+
+    def discard(self, name: str) -> None:
+        with self._lock:
+            self._expires_at.pop(name, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._expires_at.clear()
@@ -5,11 +5,40 @@ from abc import (
     ABC,
     abstractmethod,
 )
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
-from multicloud_storage.object import StorageObject
-from typing import Iterator, List, Optional, Union
-from io import BytesIO
+from functools import partial
+from multicloud_storage.object import ListPage, StorageObject
+from threading import Lock
+from time import perf_counter
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+from io import BufferedIOBase, BytesIO
+from .bucket_cache import BucketCache
+from .config import to_float, to_int
+from .exception import StorageException
 from .http import HttpMethod
+from .limiter import AdaptiveLimiter, shared_limiter
+from .log import logger
+from .metrics import StorageObserver
+from .retry import RetryPolicy
+from .transfer import TransferConfig
+from .url_cache import SignedUrlCache
+
+DEFAULT_BUCKET_CACHE_TTL = 60.0
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+DEFAULT_SIGNED_URL_WINDOW = 0.0
+DEFAULT_SIGNED_URL_CACHE_SIZE = 10000
 
 
 class StorageClient(ABC):
@@ -23,6 +52,196 @@ class StorageClient(ABC):
     level operations based on those primitives.
     """
 
+    def __init__(
+        self,
+        bucket_cache_ttl: Optional[float] = None,
+        transfer_config: Optional[TransferConfig] = None,
+        signed_url_window: Optional[float] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+    ) -> None:
+        self._bucket_cache_ttl = bucket_cache_ttl
+        self._bucket_cache = BucketCache()
+        self._transfer_config_override = transfer_config
+        self._transfer_config = transfer_config or TransferConfig()
+        self._signed_url_window = signed_url_window
+        self._signed_url_cache = SignedUrlCache()
+        self._retry_policy_override = retry_policy
+        self._retry_policy = retry_policy or RetryPolicy()
+        # replaced rather than changed, so requests can iterate it unlocked
+        self._observers: Tuple[StorageObserver, ...] = ()
+        self._observers_lock = Lock()
+
+    @staticmethod
+    def _check_range(offset: int, length: Optional[int]) -> None:
+        if offset < 0 or (length is not None and length <= 0):
+            raise StorageException(
+                "invalid byte range (offset: {0}, length: {1})".format(
+                    offset, length
+                )
+            )
+
+    @staticmethod
+    def _changed(bucket_name: str, name: str) -> StorageException:
+        return StorageException(
+            "object {0} in bucket {1} has changed".format(name, bucket_name),
+            code="PreconditionFailed",
+        )
+
+    @property
+    def observers(self) -> Tuple[StorageObserver, ...]:
+        return self._observers
+
+    def add_observer(self, observer: StorageObserver) -> None:
+        """
+        Reports every request the client sends to observer, in addition to
+        the observers already added. Every Storage sharing the client adds
+        its own, so each sees all of the client's requests.
+        """
+        with self._observers_lock:
+            if observer not in self._observers:
+                self._observers = self._observers + (observer,)
+
+    def _on_request(
+        self, method: str, status: Optional[int], seconds: float
+    ) -> None:
+        backend = type(self).__name__
+        for observer in self._observers:
+            observer.on_request(backend, method, status, seconds)
+
+    def _observe_transport(self, transport: Any, send: str) -> None:
+        """
+        Wraps the send method of the backend's HTTP transport so every
+        request reaches the observer, including the existence checks the
+        client makes on its own and retries made by the transport.
+        """
+        request = getattr(transport, send)
+
+        def _observed(*args: Any, **kwargs: Any) -> Any:
+            if not self._observers:
+                return request(*args, **kwargs)
+            method = args[0] if args else kwargs.get("method")
+            started = perf_counter()
+            status = None
+            try:
+                response = request(*args, **kwargs)
+                # urllib3 responses carry status, requests ones status_code
+                status = getattr(
+                    response, "status", getattr(response, "status_code", None)
+                )
+                return response
+            finally:
+                self._on_request(str(method), status, perf_counter() - started)
+
+        setattr(transport, send, _observed)
+
+    def _limiter_scope(self) -> Hashable:
+        """
+        Identifies the service this client talks to. Clients with the same
+        scope share their concurrency limiters.
+        """
+        return type(self).__name__
+
+    def _limiter(self, bucket_name: str, name: str = "") -> AdaptiveLimiter:
+        """
+        Returns the limiter shared by every parallel request to the bucket,
+        or to the prefix of name when limits are kept per prefix.
+        """
+        transfer_config = self._transfer_config
+        prefix = (
+            name[: name.rfind("/") + 1]
+            if transfer_config.limit_per_prefix
+            else ""
+        )
+        return shared_limiter(
+            (self._limiter_scope(), bucket_name, prefix),
+            transfer_config.concurrency,
+            transfer_config.max_concurrency,
+        )
+
+    def _parallel_map(
+        self,
+        limiter: AdaptiveLimiter,
+        func: Callable[..., Any],
+        *iterables: Iterable,
+    ) -> List:
+        """
+        Maps func over iterables on a thread pool, as many calls at once as
+        limiter allows, and returns the results in order. A single call is
+        made on the calling thread.
+        """
+        calls = list(zip(*iterables))
+        if len(calls) <= 1:
+            return [limiter.call(func, *args) for args in calls]
+        with ThreadPoolExecutor(
+            max_workers=min(len(calls), self._transfer_config.max_concurrency)
+        ) as executor:
+            return list(
+                executor.map(partial(limiter.call, func), *zip(*calls))
+            )
+
+    def _retry_part(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Calls func(*args), which sends one request of a multipart upload,
+        copy or compose, retrying it on transient errors as the retry policy
+        allows. Every part is written to its own slot, so sending it again
+        is safe, and a failed part does not cost the whole transfer.
+        """
+        return self._retry_policy.call(
+            "upload_part", partial(func, *args), on_retry=self._on_part_retry
+        )
+
+    def _on_part_retry(self, attempt: int, error: BaseException) -> None:
+        logger.debug(
+            "retrying a part after attempt %i failed: %s", attempt, error
+        )
+        backend = type(self).__name__
+        for observer in self._observers:
+            observer.on_retry(backend, "upload_part", attempt, error)
+
+    def _configure_bucket_cache(self, ttl: Optional[str]) -> None:
+        """
+        Applies the bucket cache ttl, preferring the constructor argument over
+        the STORAGE_BUCKET_CACHE_TTL env variable. The cache lives on the
+        client so every Storage wrapping it shares the same entries.
+        """
+        self._bucket_cache.ttl = (
+            self._bucket_cache_ttl
+            if self._bucket_cache_ttl is not None
+            else to_float(ttl, DEFAULT_BUCKET_CACHE_TTL)
+        )
+        if self._bucket_cache.ttl <= 0:
+            self._bucket_cache.clear()
+
+    def _configure_signed_url_cache(self, values: Dict) -> None:
+        """
+        Applies the signing window, preferring the constructor argument over
+        the STORAGE_SIGNED_URL_WINDOW env variable.
+        """
+        self._signed_url_cache.window = (
+            self._signed_url_window
+            if self._signed_url_window is not None
+            else to_float(
+                values.get("STORAGE_SIGNED_URL_WINDOW"),
+                DEFAULT_SIGNED_URL_WINDOW,
+            )
+        )
+        self._signed_url_cache.max_entries = to_int(
+            values.get("STORAGE_SIGNED_URL_CACHE_SIZE"),
+            DEFAULT_SIGNED_URL_CACHE_SIZE,
+        )
+        self._signed_url_cache.clear()
+
+    def _configure_transfer(self, values: Dict) -> None:
+        self._transfer_config = (
+            self._transfer_config_override
+            or TransferConfig.from_config(values)
+        )
+
+    def _configure_retry(self, values: Dict) -> None:
+        self._retry_policy = (
+            self._retry_policy_override or RetryPolicy.from_config(values)
+        )
+
     @abstractmethod
     def configure(cls) -> None:
         pass
@@ -36,7 +255,7 @@ class StorageClient(ABC):
         pass
 
     @abstractmethod
-    def remove_bucket(self, name: str) -> None:
+    def remove_bucket(self, name: str, force: bool) -> None:
         pass
 
     @abstractmethod
@@ -47,6 +266,39 @@ class StorageClient(ABC):
     ) -> BytesIO:
         pass
 
+    @abstractmethod
+    def get_object_range(
+        self,
+        bucket_name: str,
+        name: str,
+        offset: int,
+        length: Optional[int],
+        version: Optional[str] = None,
+    ) -> BytesIO:
+        """
+        Reads a byte range of the object. With version, the etag or GCS
+        generation of a stat, the read fails with a PreconditionFailed
+        StorageException once the object was written since.
+        """
+        pass
+
+    @abstractmethod
+    def open_object(
+        self,
+        bucket_name: str,
+        name: str,
+    ) -> BufferedIOBase:
+        pass
+
+    @abstractmethod
+    def iter_object(
+        self,
+        bucket_name: str,
+        name: str,
+        chunk_size: int,
+    ) -> Iterator[bytes]:
+        pass
+
     @abstractmethod
     def list_objects(
         self,
@@ -55,6 +307,18 @@ class StorageClient(ABC):
     ) -> Iterator[StorageObject]:
         pass
 
+    @abstractmethod
+    def list_objects_page(
+        self,
+        bucket_name: str,
+        prefix: Optional[str],
+        page_token: Optional[str],
+        start_after: Optional[str],
+        max_keys: Optional[int],
+        delimiter: Optional[str],
+    ) -> ListPage:
+        pass
+
     @abstractmethod
     def put_object(
         self,
@@ -97,10 +361,29 @@ class StorageClient(ABC):
     def object_exists(self, bucket_name: str, name: str) -> bool:
         pass
 
+    @abstractmethod
+    def stat_object(self, bucket_name: str, name: str) -> StorageObject:
+        pass
+
     @abstractmethod
     def delete_object(self, bucket_name: str, name: str) -> None:
         pass
 
+    @abstractmethod
+    def delete_objects(
+        self, bucket_name: str, names: Iterable[str]
+    ) -> Dict[str, StorageException]:
+        pass
+
+    @abstractmethod
+    def delete_prefix(
+        self,
+        bucket_name: str,
+        prefix: Optional[str],
+        concurrency: Optional[int],
+    ) -> Dict[str, StorageException]:
+        pass
+
     @abstractmethod
     def get_presigned_url(
         self,
@@ -114,6 +397,20 @@ class StorageClient(ABC):
     ) -> str:
         pass
 
+    @abstractmethod
+    def get_presigned_urls(
+        self,
+        bucket_name: str,
+        names: Iterable[str],
+        method: Union[str, HttpMethod],
+        expires: Optional[timedelta],
+        content_type: Optional[str],
+        use_hostname: Optional[str],
+        secure: Optional[bool],
+        verify: bool,
+    ) -> Dict[str, str]:
+        pass
+
     @abstractmethod
     def md5_checksum(self, bucket_name: str, name: str) -> str:
         pass
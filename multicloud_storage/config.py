@@ -1,5 +1,5 @@
 from os import getenv, getcwd, path
-from typing import Dict
+from typing import Dict, Optional
 from dotenv import load_dotenv
 
 env_dirname = path.realpath(getcwd())
@@ -21,4 +21,71 @@ def config() -> Dict:
         "STORAGE_EXTERNAL_HOSTNAME": getenv(
             "STORAGE_EXTERNAL_HOSTNAME", default=None
         ),
+        "STORAGE_BUCKET_CACHE_TTL": getenv(
+            "STORAGE_BUCKET_CACHE_TTL", default=None
+        ),
+        "STORAGE_OPTIMISTIC": getenv("STORAGE_OPTIMISTIC", default=None),
+        "STORAGE_MULTIPART_THRESHOLD": getenv(
+            "STORAGE_MULTIPART_THRESHOLD", default=None
+        ),
+        "STORAGE_MULTIPART_PART_SIZE": getenv(
+            "STORAGE_MULTIPART_PART_SIZE", default=None
+        ),
+        "STORAGE_MULTIPART_CONCURRENCY": getenv(
+            "STORAGE_MULTIPART_CONCURRENCY", default=None
+        ),
+        "STORAGE_MULTIPART_MAX_MEMORY": getenv(
+            "STORAGE_MULTIPART_MAX_MEMORY", default=None
+        ),
+        "STORAGE_MAX_CONCURRENCY": getenv(
+            "STORAGE_MAX_CONCURRENCY", default=None
+        ),
+        "STORAGE_CONCURRENCY_PER_PREFIX": getenv(
+            "STORAGE_CONCURRENCY_PER_PREFIX", default=None
+        ),
+        "STORAGE_SIGNED_URL_WINDOW": getenv(
+            "STORAGE_SIGNED_URL_WINDOW", default=None
+        ),
+        "STORAGE_SIGNED_URL_CACHE_SIZE": getenv(
+            "STORAGE_SIGNED_URL_CACHE_SIZE", default=None
+        ),
+        "STORAGE_LOCAL_ROOT": getenv("STORAGE_LOCAL_ROOT", default=None),
+        "STORAGE_RETRY_MAX_ATTEMPTS": getenv(
+            "STORAGE_RETRY_MAX_ATTEMPTS", default=None
+        ),
+        "STORAGE_RETRY_BASE_DELAY": getenv(
+            "STORAGE_RETRY_BASE_DELAY", default=None
+        ),
+        "STORAGE_RETRY_MAX_DELAY": getenv(
+            "STORAGE_RETRY_MAX_DELAY", default=None
+        ),
+        "STORAGE_HTTP_POOL_SIZE": getenv(
+            "STORAGE_HTTP_POOL_SIZE", default=None
+        ),
+        "STORAGE_HTTP_CONNECT_TIMEOUT": getenv(
+            "STORAGE_HTTP_CONNECT_TIMEOUT", default=None
+        ),
+        "STORAGE_HTTP_READ_TIMEOUT": getenv(
+            "STORAGE_HTTP_READ_TIMEOUT", default=None
+        ),
+        "STORAGE_HTTP_KEEPALIVE": getenv(
+            "STORAGE_HTTP_KEEPALIVE", default=None
+        ),
+        "STORAGE_HTTP_KEEPALIVE_IDLE": getenv(
+            "STORAGE_HTTP_KEEPALIVE_IDLE", default=None
+        ),
     }
+
+
+def to_float(value: Optional[str], default: float) -> float:
+    return float(value) if value not in (None, "") else default
+
+
+def to_int(value: Optional[str], default: int) -> int:
+    return int(value) if value not in (None, "") else default
+
+
+def to_bool(value: Optional[str], default: bool) -> bool:
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
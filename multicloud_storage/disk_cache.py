@@ -0,0 +1,339 @@
+from collections import OrderedDict
+from hashlib import sha256
+from io import SEEK_SET, BufferedIOBase, BytesIO
+from json import dump, load
+from mmap import ACCESS_READ, mmap
+from os import listdir, makedirs, remove, replace, stat
+from os.path import exists, join
+from threading import Lock
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+from uuid import uuid4
+
+from .client import DEFAULT_CHUNK_SIZE, StorageClient
+from .exception import StorageException
+from .log import logger
+from .object import version
+
+METADATA_SUFFIX = ".json"
+DOWNLOAD_SUFFIX = ".download"
+
+
+class MappedObject(BufferedIOBase):
+    """
+    Read-only file object over a memory map of a cached file. getbuffer
+    exposes the mapped pages without copying them.
+    """
+
+    def __init__(self, mapped: mmap) -> None:
+        super().__init__()
+        self._mapped = mapped
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        if size is None or size < 0:
+            return self._mapped.read()
+        return self._mapped.read(size)
+
+    def read1(self, size: int = -1) -> bytes:
+        return self.read(size)
+
+    def readinto(self, buffer) -> int:
+        position = self._mapped.tell()
+        length = min(len(buffer), len(self._mapped) - position)
+        with memoryview(self._mapped) as view:
+            buffer[:length] = view[position : position + length]
+        self._mapped.seek(position + length)
+        return length
+
+    def seek(self, offset: int, whence: int = SEEK_SET) -> int:
+        self._mapped.seek(offset, whence)
+        return self._mapped.tell()
+
+    def tell(self) -> int:
+        return self._mapped.tell()
+
+    def getbuffer(self) -> memoryview:
+        return memoryview(self._mapped)
+
+    def getvalue(self) -> bytes:
+        return self._mapped[:]
+
+    def close(self) -> None:
+        if not self.closed:
+            try:
+                self._mapped.close()
+            except BufferError:
+                # a view from getbuffer is still alive, the map is released
+                # once it is garbage collected
+                pass
+        super().close()
+
+
+# what get_object returns: a BytesIO, or a MappedObject for objects read
+# from local disk, which offers the same reads, seeks, getbuffer and
+# getvalue but cannot be written to
+ObjectData = Union[BytesIO, MappedObject]
+
+
+class _Entry(NamedTuple):
+    key: str
+    size: int
+    version: Optional[str]
+
+
+def map_file(path: str) -> ObjectData:
+    with open(path, "rb") as infile:
+        # an empty file cannot be mapped
+        if stat(path).st_size == 0:
+            return BytesIO()
+        return MappedObject(mmap(infile.fileno(), 0, access=ACCESS_READ))
+
+
+def _remove(path: str) -> None:
+    try:
+        remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class DiskCache:
+    """
+    DiskCache.
+
+    Read-through cache that keeps fetched objects in a local directory and
+    serves hits from a memory map of the cached file. The least recently used
+    objects are evicted once the cached files exceed max_bytes. With
+    revalidate set every hit first compares the cached version, the etag or
+    GCS generation, with the current one, which costs a metadata request
+    but never a download of an unchanged object. Objects whose version
+    cannot be told are fetched on every read and not cached. Entries found
+    in the directory on start up are kept.
+
+    As in MemoryCache, a discard during a fill bumps the key's generation
+    and the fetched file is then not cached, so data read before a write
+    is not served after it.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int,
+        revalidate: bool = False,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> None:
+        if max_bytes <= 0 or chunk_size <= 0:
+            raise StorageException("max_bytes and chunk_size must be positive")
+        makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.revalidate = revalidate
+        self._chunk_size = chunk_size
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._size = 0
+        # fills in flight per key, as [count, generation]
+        self._fills: Dict[Tuple[str, str], List[int]] = {}
+        self._lock = Lock()
+        self._load()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def get_object(
+        self, client: StorageClient, bucket_name: str, name: str
+    ) -> ObjectData:
+        entry = self._lookup(bucket_name, name)
+        if entry is not None and self.revalidate:
+            current = self._version(client, bucket_name, name)
+            if current is None or entry.version != current:
+                self.discard(bucket_name, name)
+                entry = None
+        if entry is not None:
+            try:
+                return map_file(self._path(entry.key))
+            except FileNotFoundError:
+                # evicted by another thread since the lookup
+                self.discard(bucket_name, name)
+        return self._fill(client, bucket_name, name)
+
+    def discard(self, bucket_name: str, name: str) -> None:
+        key = (bucket_name, name)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._evict(entry)
+            fill = self._fills.get(key)
+            if fill is not None:
+                fill[1] += 1
+
+    def discard_prefix(self, bucket_name: str, prefix: Optional[str]) -> None:
+        with self._lock:
+            for key in [
+                key
+                for key in self._entries
+                if key[0] == bucket_name and key[1].startswith(prefix or "")
+            ]:
+                self._evict(self._entries.pop(key))
+            for key, fill in self._fills.items():
+                if key[0] == bucket_name and key[1].startswith(prefix or ""):
+                    fill[1] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            while self._entries:
+                self._evict(self._entries.popitem()[1])
+            for fill in self._fills.values():
+                fill[1] += 1
+
+    def _path(self, key: str) -> str:
+        return join(self.directory, key)
+
+    def _lookup(self, bucket_name: str, name: str) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._entries.get((bucket_name, name))
+            if entry is not None:
+                self._entries.move_to_end((bucket_name, name))
+            return entry
+
+    @staticmethod
+    def _version(
+        client: StorageClient, bucket_name: str, name: str
+    ) -> Optional[str]:
+        return version(client.stat_object(bucket_name, name))
+
+    def _fill(
+        self, client: StorageClient, bucket_name: str, name: str
+    ) -> ObjectData:
+        generation = self._reserve((bucket_name, name))
+        try:
+            return self._download(client, bucket_name, name, generation)
+        finally:
+            self._release((bucket_name, name))
+
+    def _reserve(self, name: Tuple[str, str]) -> int:
+        with self._lock:
+            fill = self._fills.setdefault(name, [0, 0])
+            fill[0] += 1
+            return fill[1]
+
+    def _release(self, name: Tuple[str, str]) -> None:
+        with self._lock:
+            fill = self._fills[name]
+            fill[0] -= 1
+            if fill[0] == 0:
+                del self._fills[name]
+
+    def _download(
+        self,
+        client: StorageClient,
+        bucket_name: str,
+        name: str,
+        generation: int,
+    ) -> ObjectData:
+        # the version is read before the data, so a concurrent overwrite
+        # makes the entry stale rather than wrongly valid
+        current = (
+            self._version(client, bucket_name, name)
+            if self.revalidate
+            else None
+        )
+        # an entry that could never be revalidated is not worth keeping
+        cacheable = current is not None or not self.revalidate
+        key = sha256("{0}/{1}".format(bucket_name, name).encode()).hexdigest()
+        path = self._path(key)
+        temporary_path = "{0}.{1}{2}".format(
+            path, uuid4().hex, DOWNLOAD_SUFFIX
+        )
+        size = 0
+        try:
+            with open(temporary_path, "wb") as outfile:
+                for chunk in client.iter_object(
+                    bucket_name, name, self._chunk_size
+                ):
+                    outfile.write(chunk)
+                    size += len(chunk)
+            # the map stays valid once the file is moved or removed
+            mapped = map_file(temporary_path)
+            if size > self.max_bytes or not cacheable:
+                remove(temporary_path)
+                return mapped
+            with self._lock:
+                # discarded since the fill started, the data may predate a
+                # write
+                if generation != self._fills[(bucket_name, name)][1]:
+                    remove(temporary_path)
+                    return mapped
+                with open(path + METADATA_SUFFIX, "w") as outfile:
+                    dump(
+                        {
+                            "bucket_name": bucket_name,
+                            "name": name,
+                            "version": current,
+                        },
+                        outfile,
+                    )
+                replace(temporary_path, path)
+                self._insert((bucket_name, name), _Entry(key, size, current))
+        except BaseException:
+            _remove(temporary_path)
+            raise
+        return mapped
+
+    def _add(self, name: Tuple[str, str], entry: _Entry) -> None:
+        with self._lock:
+            self._insert(name, entry)
+
+    def _insert(self, name: Tuple[str, str], entry: _Entry) -> None:
+        # callers hold the lock
+        previous = self._entries.pop(name, None)
+        if previous is not None:
+            self._size -= previous.size
+        self._entries[name] = entry
+        self._size += entry.size
+        while self._size > self.max_bytes:
+            self._evict(self._entries.popitem(last=False)[1])
+
+    def _evict(self, entry: _Entry) -> None:
+        self._size -= entry.size
+        _remove(self._path(entry.key))
+        _remove(self._path(entry.key) + METADATA_SUFFIX)
+
+    def _load(self) -> None:
+        entries: List[Tuple[float, Tuple[str, str], _Entry]] = []
+        for filename in listdir(self.directory):
+            path = join(self.directory, filename)
+            if filename.endswith(DOWNLOAD_SUFFIX):
+                _remove(path)
+            elif filename.endswith(METADATA_SUFFIX):
+                key = filename[: -len(METADATA_SUFFIX)]
+                if not exists(self._path(key)):
+                    _remove(path)
+                    continue
+                with open(path) as infile:
+                    metadata = load(infile)
+                status = stat(self._path(key))
+                entries.append(
+                    (
+                        status.st_mtime,
+                        (metadata["bucket_name"], metadata["name"]),
+                        _Entry(
+                            key, status.st_size, metadata.get("version")
+                        ),
+                    )
+                )
+            elif not exists(path + METADATA_SUFFIX):
+                _remove(path)
+        # without access times, the oldest files are the first to go
+        for _, name, entry in sorted(entries, key=lambda item: item[0]):
+            self._add(name, entry)
+        logger.debug(
+            "loaded %i cached objects (%i bytes) from %s",
+            len(self._entries),
+            self._size,
+            self.directory,
+        )
@@ -1,2 +1,24 @@
+from typing import Dict, Optional
+
+
 class StorageException(Exception):
-    """Base Storage exception."""
+    """
+    Base Storage exception. code holds the backend error code, such as
+    NoSuchKey, when the error came from the backend.
+    """
+
+    def __init__(self, *args, code: Optional[str] = None) -> None:
+        super().__init__(*args)
+        self.code = code
+
+
+class TransferError(StorageException):
+    """Raised when some objects of a bulk transfer failed."""
+
+    def __init__(self, failed: Dict[str, BaseException]) -> None:
+        super().__init__(
+            "{0} transfers failed: {1}".format(
+                len(failed), ", ".join(sorted(failed)[:10])
+            )
+        )
+        self.failed = failed
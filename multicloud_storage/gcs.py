@@ -1,16 +1,74 @@
 from base64 import b64decode
 from binascii import hexlify
-from datetime import timedelta
-from io import BytesIO
-from typing import Iterator, List, Optional, Union
+from datetime import datetime, timedelta
+from functools import partial
+from hashlib import md5
+from io import BufferedIOBase, BytesIO
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional, Union
+from uuid import uuid4
 
+from google.api_core.exceptions import (
+    Conflict,
+    GoogleAPICallError,
+    NotFound,
+    PreconditionFailed,
+    RequestRangeNotSatisfiable,
+    from_http_response,
+)
 from google.cloud.storage import Client, Blob
+from google.cloud.storage.batch import Batch
 
-from .client import StorageClient
-from .config import config
+from .client import DEFAULT_CHUNK_SIZE, StorageClient
+from .config import config, to_bool
 from .exception import StorageException
 from .http import HttpMethod
 from .log import logger
+from .object import ListPage
+from .pool import PoolConfig, TunedAdapter
+from .retry import RetryPolicy
+from .transfer import TransferConfig, delete_in_batches, upload_parts
+
+# GCS composes at most 32 source objects per request
+MAX_COMPOSE_SOURCES = 32
+# parallel uploads keep the number of composed parts within this limit
+MAX_PARTS = 1024
+# a batch request should carry at most 100 calls
+MAX_BATCH_SIZE = 100
+# composite objects have no md5 hash, so parallel uploads record it here
+MD5_METADATA_KEY = "md5-checksum"
+
+
+def _not_found(bucket_name: str, name: str) -> StorageException:
+    return StorageException(
+        "object {0} does not exist in bucket {1}".format(name, bucket_name),
+        code=NotFound.__name__,
+    )
+
+
+def _api_error(err: GoogleAPICallError) -> StorageException:
+    return StorageException(
+        "Google Cloud Error: {0}".format(err.message),
+        code=type(err).__name__,
+    )
+
+
+def _read_chunks(reader: BufferedIOBase, chunk_size: int) -> Iterator[bytes]:
+    with reader:
+        while True:
+            chunk = reader.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+class _DeleteBatch(Batch):
+    """
+    Batch that keeps every sub-response instead of raising on the first
+    failure, so each deletion can be reported on its own.
+    """
+
+    def _finish_futures(self, responses) -> None:
+        self.responses = responses
 
 
 class GCS(StorageClient):
@@ -18,14 +76,27 @@ class GCS(StorageClient):
     GCS.
     """
 
-    def __init__(self, project: str = None) -> None:
-        super().__init__()
+    def __init__(
+        self,
+        project: str = None,
+        bucket_cache_ttl: Optional[float] = None,
+        transfer_config: Optional[TransferConfig] = None,
+        signed_url_window: Optional[float] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        pool_config: Optional[PoolConfig] = None,
+    ) -> None:
+        super().__init__(
+            bucket_cache_ttl, transfer_config, signed_url_window, retry_policy
+        )
+        self._pool_config_override = pool_config
+        self._pool_config = pool_config or PoolConfig()
         self._gcs_client: Client = None
         self._use_public_urls: Optional[bool] = None
         self._emulator_hostname: Optional[str] = None
         self._external_hostname: Optional[str] = None
         self._secure: bool = True
         self._gcs_project = project
+        self._optimistic: bool = False
 
     def _project(cls):
         if cls._gcs_project is None:
@@ -49,8 +120,27 @@ class GCS(StorageClient):
                 "STORAGE_EMULATOR_HOST",
                 "GOOGLE_CLOUD_PROJECT",
                 "STORAGE_EXTERNAL_HOSTNAME",
+                "STORAGE_BUCKET_CACHE_TTL",
+                "STORAGE_OPTIMISTIC",
+                "STORAGE_MULTIPART_THRESHOLD",
+                "STORAGE_MULTIPART_PART_SIZE",
+                "STORAGE_MULTIPART_CONCURRENCY",
+                "STORAGE_MULTIPART_MAX_MEMORY",
+                "STORAGE_MAX_CONCURRENCY",
+                "STORAGE_CONCURRENCY_PER_PREFIX",
+                "STORAGE_SIGNED_URL_WINDOW",
+                "STORAGE_SIGNED_URL_CACHE_SIZE",
+                "STORAGE_RETRY_MAX_ATTEMPTS",
+                "STORAGE_RETRY_BASE_DELAY",
+                "STORAGE_RETRY_MAX_DELAY",
+                "STORAGE_HTTP_POOL_SIZE",
+                "STORAGE_HTTP_CONNECT_TIMEOUT",
+                "STORAGE_HTTP_READ_TIMEOUT",
+                "STORAGE_HTTP_KEEPALIVE",
+                "STORAGE_HTTP_KEEPALIVE_IDLE",
             )
         }
+        self._optimistic = to_bool(gcs_config["STORAGE_OPTIMISTIC"], False)
 
         self._gcs_project = (
             gcs_config["GOOGLE_CLOUD_PROJECT"]
@@ -76,22 +166,61 @@ class GCS(StorageClient):
             )
             self._use_public_urls = True
 
+        self._configure_transfer(gcs_config)
+        self._pool_config = self._pool_config_override or (
+            PoolConfig.from_config(gcs_config)
+        )
         self._gcs_client = Client(project=self._gcs_project)
+        # the client's AuthorizedSession is a requests session, so a tuned
+        # adapter replaces its default pool of 10 connections
+        session = self._gcs_client._http
+        adapter = TunedAdapter(
+            self._pool_config, self._transfer_config.max_concurrency
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        self._observe_transport(session, "request")
+        self._configure_bucket_cache(gcs_config["STORAGE_BUCKET_CACHE_TTL"])
+        self._configure_signed_url_cache(gcs_config)
+        self._configure_retry(gcs_config)
+
+    def _limiter_scope(self) -> Hashable:
+        return type(self).__name__, self._emulator_hostname
 
     def bucket_exists(self, name: str) -> bool:
+        if self._bucket_cache.exists(name):
+            return True
         bucket = self._client().bucket(name)
-        return bucket.exists()
+        exists = bucket.exists()
+        if exists:
+            self._bucket_cache.add(name)
+        return exists
 
     def make_bucket(self, name: str) -> None:
         if self.bucket_exists(name):
             raise StorageException("bucket {0} already exists".format(name))
         self._client().create_bucket(name)
+        self._bucket_cache.add(name)
 
-    def remove_bucket(self, name: str) -> None:
+    def remove_bucket(self, name: str, force: bool = False) -> None:
         if not self.bucket_exists(name):
             raise StorageException("bucket {0} does not exist".format(name))
+        self._bucket_cache.discard(name)
+        if force:
+            errors = self.delete_prefix(name, None)
+            if errors:
+                raise StorageException(
+                    "could not empty bucket {0}: {1} objects were not"
+                    " deleted".format(name, len(errors))
+                )
         bucket = self._client().bucket(name)
-        bucket.delete()
+        try:
+            bucket.delete()
+        except Conflict:
+            raise StorageException(
+                "bucket {0} is not empty".format(name),
+                code=Conflict.__name__,
+            ) from None
 
     def delete_object(self, bucket_name: str, name: str) -> None:
         if not self.bucket_exists(bucket_name):
@@ -100,17 +229,175 @@ class GCS(StorageClient):
             )
         self._client().bucket(bucket_name).blob(name).delete()
 
+    def delete_objects(
+        self, bucket_name: str, names: Iterable[str]
+    ) -> Dict[str, StorageException]:
+        if not self.bucket_exists(bucket_name):
+            raise StorageException(
+                "bucket {0} does not exist".format(bucket_name)
+            )
+        return delete_in_batches(
+            names,
+            MAX_BATCH_SIZE,
+            self._transfer_config.max_concurrency,
+            lambda batch: self._delete_chunk(bucket_name, batch),
+            self._limiter(bucket_name),
+        )
+
+    def delete_prefix(
+        self,
+        bucket_name: str,
+        prefix: Optional[str],
+        concurrency: Optional[int] = None,
+    ) -> Dict[str, StorageException]:
+        if not self.bucket_exists(bucket_name):
+            raise StorageException(
+                "bucket {0} does not exist".format(bucket_name)
+            )
+        return delete_in_batches(
+            (
+                blob.name
+                for blob in self._client().list_blobs(
+                    bucket_name,
+                    prefix=prefix,
+                    fields="items(name),nextPageToken",
+                )
+            ),
+            MAX_BATCH_SIZE,
+            concurrency or self._transfer_config.max_concurrency,
+            lambda batch: self._delete_chunk(bucket_name, batch),
+            self._limiter(bucket_name, prefix or ""),
+        )
+
+    def _delete_chunk(
+        self, bucket_name: str, names: List[str]
+    ) -> Dict[str, StorageException]:
+        bucket = self._client().bucket(bucket_name)
+        # batches are tracked per thread, so chunks can be sent concurrently
+        batch = _DeleteBatch(self._client())
+        try:
+            with batch:
+                for name in names:
+                    bucket.delete_blob(name)
+        except GoogleAPICallError as err:
+            return {name: _api_error(err) for name in names}
+        # a missing object counts as deleted, as it does on S3
+        return {
+            name: _api_error(from_http_response(response))
+            for name, response in zip(names, batch.responses)
+            if not 200 <= response.status_code < 300
+            and response.status_code != 404
+        }
+
     def put_object(
         self,
         bucket_name: str,
         name: str,
         data: BytesIO,
-        _: int = 0,
+        size: int = 0,
     ) -> None:
+        if self._transfer_config.use_multipart(size):
+            self._composite_upload(bucket_name, name, data, size)
+            return
         blob = self._client().bucket(bucket_name).blob(name)
         with blob.open("wb") as outfile:
             outfile.write(data.getbuffer())
 
+    def _composite_upload(
+        self,
+        bucket_name: str,
+        name: str,
+        data: BytesIO,
+        size: int,
+    ) -> None:
+        """
+        Uploads the parts as temporary objects in parallel and composes them
+        into the destination, removing the parts afterwards.
+        """
+        part_size = self._transfer_config.part_size_for(size, MAX_PARTS)
+        logger.debug(
+            "uploading %s/%s in %i byte parts", bucket_name, name, part_size
+        )
+        bucket = self._client().bucket(bucket_name)
+        prefix = "{0}.upload-{1}".format(name, uuid4().hex)
+        uploaded: List[Blob] = []
+        hasher = md5()
+
+        def _upload_part(part_number: int, chunk: bytes) -> Blob:
+            part = bucket.blob("{0}/{1:05d}".format(prefix, part_number))
+            self._retry_part(
+                partial(
+                    part.upload_from_string,
+                    chunk,
+                    content_type="application/octet-stream",
+                )
+            )
+            uploaded.append(part)
+            return part
+
+        try:
+            parts = upload_parts(
+                data,
+                size,
+                part_size,
+                self._transfer_config,
+                _upload_part,
+                hasher,
+                self._limiter(bucket_name, name),
+            )
+            blob = bucket.blob(name)
+            blob.metadata = {MD5_METADATA_KEY: hasher.hexdigest()}
+            self._compose(blob, parts)
+        finally:
+            self._delete_temporary(uploaded)
+
+    def _compose(self, destination: Blob, sources: List[Blob]) -> None:
+        """
+        Composes any number of sources into destination. Sources are grouped
+        in batches of MAX_COMPOSE_SOURCES that are composed concurrently into
+        temporary objects, level by level, until a single compose remains.
+        The temporary objects are removed afterwards.
+        """
+        bucket = destination.bucket
+        prefix = "{0}.compose-{1}".format(destination.name, uuid4().hex)
+        intermediates: List[Blob] = []
+
+        def _compose_group(level: int, index: int, group: List[Blob]) -> Blob:
+            if len(group) == 1:
+                return group[0]
+            target = bucket.blob(
+                "{0}/{1}/{2:05d}".format(prefix, level, index)
+            )
+            intermediates.append(target)
+            self._retry_part(target.compose, group)
+            return target
+
+        limiter = self._limiter(bucket.name, destination.name)
+        try:
+            level = 0
+            while len(sources) > MAX_COMPOSE_SOURCES:
+                groups = [
+                    sources[i : i + MAX_COMPOSE_SOURCES]
+                    for i in range(0, len(sources), MAX_COMPOSE_SOURCES)
+                ]
+                sources = self._parallel_map(
+                    limiter,
+                    partial(_compose_group, level),
+                    range(len(groups)),
+                    groups,
+                )
+                level += 1
+            self._retry_part(destination.compose, sources)
+        finally:
+            self._delete_temporary(intermediates)
+
+    def _delete_temporary(self, blobs: List[Blob]) -> None:
+        for blob in blobs:
+            try:
+                blob.delete()
+            except NotFound:
+                pass
+
     def object_exists(self, bucket_name: str, name: str) -> bool:
         if not self.bucket_exists(bucket_name):
             raise StorageException(
@@ -118,16 +405,76 @@ class GCS(StorageClient):
             )
         return self._client().bucket(bucket_name).blob(name).exists()
 
+    def stat_object(self, bucket_name: str, name: str) -> Blob:
+        blob = self._client().bucket(bucket_name).get_blob(name)
+        if blob is None:
+            raise _not_found(bucket_name, name)
+        return blob
+
     def get_object(self, bucket_name: str, name: str) -> BytesIO:
-        if not self.object_exists(bucket_name, name):
-            raise StorageException(
-                "object {0} does not exist in bucket {1}".format(
-                    name, bucket_name
-                )
-            )
+        if not self._optimistic and not self.object_exists(bucket_name, name):
+            raise _not_found(bucket_name, name)
         bucket = self._client().bucket(bucket_name)
         blob = bucket.blob(name)
-        return BytesIO(blob.download_as_bytes())
+        try:
+            return BytesIO(blob.download_as_bytes())
+        except NotFound:
+            raise _not_found(bucket_name, name) from None
+
+    def get_object_range(
+        self,
+        bucket_name: str,
+        name: str,
+        offset: int,
+        length: Optional[int] = None,
+        version: Optional[str] = None,
+    ) -> BytesIO:
+        self._check_range(offset, length)
+        blob = self._client().bucket(bucket_name).blob(name)
+        # the end of a gcs range is inclusive
+        end = offset + length - 1 if length is not None else None
+        # version is the generation, or the etag of a blob without one
+        pinned = {}
+        if version is not None and version.isdigit():
+            pinned["if_generation_match"] = int(version)
+        elif version is not None:
+            pinned["if_etag_match"] = version
+        try:
+            return BytesIO(
+                blob.download_as_bytes(start=offset, end=end, **pinned)
+            )
+        except NotFound:
+            raise _not_found(bucket_name, name) from None
+        except PreconditionFailed:
+            raise self._changed(bucket_name, name) from None
+        except RequestRangeNotSatisfiable:
+            raise StorageException(
+                "invalid byte range (offset: {0}, length: {1})".format(
+                    offset, length
+                )
+            ) from None
+
+    def open_object(
+        self,
+        bucket_name: str,
+        name: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> BufferedIOBase:
+        # fetching the metadata first pins the generation so every ranged
+        # read made by the reader sees the same version of the object
+        blob = self.stat_object(bucket_name, name)
+        return blob.open(
+            "rb", chunk_size=chunk_size, if_generation_match=blob.generation
+        )
+
+    def iter_object(
+        self,
+        bucket_name: str,
+        name: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> Iterator[bytes]:
+        reader = self.open_object(bucket_name, name, chunk_size)
+        return _read_chunks(reader, chunk_size)
 
     def get_presigned_url(  # pylint: disable=keyword-arg-before-vararg
         self,
@@ -139,33 +486,82 @@ class GCS(StorageClient):
         use_hostname: Optional[str] = None,
         *_,
     ) -> str:
-        if not self.bucket_exists(bucket_name):
-            raise StorageException(
-                "bucket {0} does not exist".format(bucket_name)
-            )
-        bucket = self._client().get_bucket(bucket_name)
-        blob = bucket.blob(name)
+        return self.get_presigned_urls(
+            bucket_name,
+            [name],
+            method,
+            expires,
+            content_type,
+            use_hostname,
+            verify=True,
+        )[name]
+
+    def get_presigned_urls(  # pylint: disable=keyword-arg-before-vararg
+        self,
+        bucket_name: str,
+        names: Iterable[str],
+        method: Union[str, HttpMethod],
+        expires: Optional[timedelta],
+        content_type: Optional[str] = None,
+        use_hostname: Optional[str] = None,
+        *_,
+        verify: bool = False,
+    ) -> Dict[str, str]:
+        names = list(names)
         _method = method.value if not isinstance(method, str) else method
-        if not blob.exists() and _method == "GET":
-            raise StorageException(
-                "object {0} does not exist in bucket {1}".format(
-                    name, bucket_name
+        if verify:
+            if not self.bucket_exists(bucket_name):
+                raise StorageException(
+                    "bucket {0} does not exist".format(bucket_name)
                 )
-            )
+            if _method == "GET":
+                self._check_objects_exist(bucket_name, names)
+        # a bucket reference is local, the signature only needs its name
+        bucket = self._client().bucket(bucket_name)
         if self._use_public_urls:
             _scheme = "http" if not self._secure else "https"
             _hostname = (
                 use_hostname if use_hostname else self._external_hostname
             )
-            public_url = blob.public_url.replace(
-                "https://storage.googleapis.com",
-                f"{_scheme}://{_hostname}",
+            return {
+                name: bucket.blob(name).public_url.replace(
+                    "https://storage.googleapis.com",
+                    f"{_scheme}://{_hostname}",
+                )
+                for name in names
+            }
+        if expires is None:
+            raise StorageException("expires must be defined")
+
+        def _sign(name: str, signed_at: datetime) -> str:
+            # an absolute expiration makes the v2 signature depend only on
+            # the signing window, not on the moment of the call
+            return bucket.blob(name).generate_signed_url(
+                expiration=signed_at + expires,
+                method=_method,
+                content_type=content_type,
+            )
+
+        return {
+            name: self._signed_url_cache.sign(
+                (bucket_name, name, _method, content_type, expires),
+                expires,
+                partial(_sign, name),
             )
-            return public_url
-        url = blob.generate_signed_url(
-            expiration=expires, method=_method, content_type=content_type
+            for name in names
+        }
+
+    def _check_objects_exist(
+        self, bucket_name: str, names: List[str]
+    ) -> None:
+        exists = self._parallel_map(
+            self._limiter(bucket_name),
+            lambda name: self.object_exists(bucket_name, name),
+            names,
         )
-        return url
+        for name, found in zip(names, exists):
+            if not found:
+                raise _not_found(bucket_name, name)
 
     def copy_object(
         self,
@@ -174,12 +570,10 @@ class GCS(StorageClient):
         destination_bucket_name: str,
         destination_name: str,
     ) -> None:
-        if not self.object_exists(source_bucket_name, source_name):
-            raise StorageException(
-                "object {0} does not exist in bucket {1}".format(
-                    source_name, source_bucket_name
-                )
-            )
+        if not self._optimistic and not self.object_exists(
+            source_bucket_name, source_name
+        ):
+            raise _not_found(source_bucket_name, source_name)
         storage_client = self._client()
 
         source_bucket = storage_client.bucket(source_bucket_name)
@@ -195,11 +589,14 @@ class GCS(StorageClient):
         )
         rewrite_token = False
         while True:
-            (
-                rewrite_token,
-                bytes_rewritten,
-                bytes_to_rewrite,
-            ) = destination_blob.rewrite(source_blob, token=rewrite_token)
+            try:
+                (
+                    rewrite_token,
+                    bytes_rewritten,
+                    bytes_to_rewrite,
+                ) = destination_blob.rewrite(source_blob, token=rewrite_token)
+            except NotFound:
+                raise _not_found(source_bucket_name, source_name) from None
             logger.debug(
                 "...progress so far: %s/%s bytes...",
                 bytes_rewritten,
@@ -208,7 +605,6 @@ class GCS(StorageClient):
             if not rewrite_token:
                 break
 
-    # TODO Pagination
     def list_objects(
         self, bucket_name: str, prefix: Optional[str]
     ) -> Iterator[Blob]:
@@ -218,31 +614,56 @@ class GCS(StorageClient):
             )
         return self._client().list_blobs(bucket_name, prefix=prefix)
 
+    def list_objects_page(
+        self,
+        bucket_name: str,
+        prefix: Optional[str],
+        page_token: Optional[str],
+        start_after: Optional[str],
+        max_keys: Optional[int],
+        delimiter: Optional[str],
+    ) -> ListPage:
+        iterator = self._client().list_blobs(
+            bucket_name,
+            prefix=prefix,
+            delimiter=delimiter,
+            start_offset=start_after,
+            page_size=max_keys,
+            page_token=page_token,
+        )
+        try:
+            page = next(iterator.pages, None)
+        except NotFound:
+            raise StorageException(
+                "bucket {0} does not exist".format(bucket_name)
+            ) from None
+        if page is None:
+            return ListPage(objects=[], prefixes=[], next_token=None)
+        # start_offset is inclusive, start_after is not
+        return ListPage(
+            objects=[blob for blob in page if blob.name != start_after],
+            prefixes=sorted(page.prefixes),
+            next_token=iterator.next_page_token,
+        )
+
     def concat_objects(
         self,
         bucket_name: str,
         destination_object: str,
         source_objects: List[str],
     ) -> None:
-        if not self.object_exists(bucket_name, destination_object):
-            raise StorageException(
-                "object {0} does not exist in bucket {1}".format(
-                    destination_object, bucket_name
-                )
+        bucket = self._client().bucket(bucket_name)
+        try:
+            self._compose(
+                bucket.blob(destination_object),
+                [bucket.blob(obj) for obj in source_objects],
             )
-        for obj in source_objects:
-            if not self.object_exists(bucket_name, obj):
-                raise StorageException(
-                    "object {0} does not exist in bucket {1}".format(
-                        obj, bucket_name
-                    )
-                )
-        blob = self._client().bucket(bucket_name).blob(destination_object)
-        blobs: List[Blob] = list()
-        for obj in source_objects:
-            blobs.append(self._client().bucket(bucket_name).blob(obj))
-        blob.compose(blobs)
-        return
+        except NotFound:
+            # only pay for existence checks once the compose has failed
+            for obj in source_objects:
+                if not self.object_exists(bucket_name, obj):
+                    raise _not_found(bucket_name, obj) from None
+            raise
 
     def rename_object(
         self,
@@ -261,12 +682,17 @@ class GCS(StorageClient):
         bucket.rename_blob(blob, new_name)
 
     def md5_checksum(self, bucket_name: str, name: str) -> str:
-        if not self.object_exists(bucket_name, name):
-            raise StorageException(
-                "object {0} does not exist in bucket {1}".format(
-                    name, bucket_name
+        if not self._optimistic and not self.object_exists(bucket_name, name):
+            raise _not_found(bucket_name, name)
+        blob = self.stat_object(bucket_name, name)
+        if blob.md5_hash is None:
+            # composite objects carry no md5 hash of their own
+            checksum = (blob.metadata or {}).get(MD5_METADATA_KEY)
+            if checksum is None:
+                raise StorageException(
+                    "object {0} in bucket {1} has no md5 checksum".format(
+                        name, bucket_name
+                    )
                 )
-            )
-        bucket = self._client().bucket(bucket_name)
-        blob = bucket.get_blob(name)
+            return checksum
         return hexlify(b64decode(blob.md5_hash)).decode("utf-8")
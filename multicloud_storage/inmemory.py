@@ -0,0 +1,412 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from hashlib import md5
+from io import BufferedIOBase, BytesIO
+from mimetypes import guess_type
+from random import Random
+from threading import Lock
+from time import sleep
+from typing import (
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Union,
+)
+from urllib.parse import quote
+
+from .client import DEFAULT_CHUNK_SIZE, StorageClient
+from .exception import StorageException
+from .http import HttpMethod
+from .object import ListPage, ObjectInfo, page_names
+from .retry import RetryPolicy
+from .transfer import TransferConfig
+
+# a list request returns at most 1,000 keys, as on S3
+MAX_LIST_KEYS = 1000
+
+
+class _StoredObject(NamedTuple):
+    data: bytes
+    info: ObjectInfo
+
+
+def _not_found(bucket_name: str, name: str) -> StorageException:
+    return StorageException(
+        "object {0} does not exist in bucket {1}".format(name, bucket_name),
+        code="NoSuchKey",
+    )
+
+
+def _store(name: str, data: bytes) -> _StoredObject:
+    return _StoredObject(
+        data,
+        ObjectInfo(
+            name=name,
+            size=len(data),
+            etag=md5(data).hexdigest(),
+            last_modified=datetime.now(timezone.utc),
+            content_type=guess_type(name)[0],
+        ),
+    )
+
+
+class InMemory(StorageClient):
+    """
+    InMemory.
+
+    Keeps buckets and objects in process memory, for unit tests and
+    benchmarks that should not depend on a network. Every operation counts
+    as one request: it waits latency seconds and then fails with probability
+    error_rate, drawn from a generator seeded with seed so runs can be
+    repeated. Injected errors look like a backend that is shedding load, so
+    they are retried like one. The number of requests per operation is kept
+    in requests and every request is reported to the observers.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+        transfer_config: Optional[TransferConfig] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+    ) -> None:
+        if latency < 0 or not 0 <= error_rate <= 1:
+            raise StorageException(
+                "latency must not be negative and error_rate must be"
+                " between 0 and 1"
+            )
+        super().__init__(
+            transfer_config=transfer_config, retry_policy=retry_policy
+        )
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests: Counter = Counter()
+        self._random = Random(seed)
+        self._buckets: Dict[str, Dict[str, _StoredObject]] = {}
+        self._lock = Lock()
+
+    def configure(self) -> None:
+        pass
+
+    def _request(self, operation: str) -> None:
+        with self._lock:
+            self.requests[operation] += 1
+            failed = self._random.random() < self.error_rate
+        if self.latency > 0:
+            sleep(self.latency)
+        # reported like an HTTP request named after the operation
+        self._on_request(operation, 503 if failed else 200, self.latency)
+        if failed:
+            raise StorageException(
+                "injected error in {0}".format(operation),
+                code="ServiceUnavailable",
+            )
+
+    def _bucket(self, bucket_name: str) -> Dict[str, _StoredObject]:
+        # callers hold the lock
+        bucket = self._buckets.get(bucket_name)
+        if bucket is None:
+            raise StorageException(
+                "bucket {0} does not exist".format(bucket_name)
+            )
+        return bucket
+
+    def _object(self, bucket_name: str, name: str) -> _StoredObject:
+        with self._lock:
+            stored = self._bucket(bucket_name).get(name)
+        if stored is None:
+            raise _not_found(bucket_name, name)
+        return stored
+
+    def _limiter_scope(self) -> Hashable:
+        # every instance holds its own buckets
+        return type(self).__name__, id(self)
+
+    def bucket_exists(self, name: str) -> bool:
+        self._request("bucket_exists")
+        with self._lock:
+            return name in self._buckets
+
+    def make_bucket(self, name: str) -> None:
+        self._request("make_bucket")
+        with self._lock:
+            if name in self._buckets:
+                raise StorageException(
+                    "bucket {0} already exists".format(name)
+                )
+            self._buckets[name] = {}
+
+    def remove_bucket(self, name: str, force: bool = False) -> None:
+        self._request("remove_bucket")
+        with self._lock:
+            if self._bucket(name) and not force:
+                raise StorageException("bucket {0} is not empty".format(name))
+            del self._buckets[name]
+
+    def get_object(
+        self,
+        bucket_name: str,
+        name: str,
+    ) -> BytesIO:
+        self._request("get_object")
+        # BytesIO shares the immutable bytes until it is written to
+        return BytesIO(self._object(bucket_name, name).data)
+
+    def get_object_range(
+        self,
+        bucket_name: str,
+        name: str,
+        offset: int,
+        length: Optional[int] = None,
+        version: Optional[str] = None,
+    ) -> BytesIO:
+        self._check_range(offset, length)
+        self._request("get_object_range")
+        stored = self._object(bucket_name, name)
+        if version is not None and stored.info.etag != version:
+            raise self._changed(bucket_name, name)
+        data = stored.data
+        if offset >= len(data):
+            raise StorageException(
+                "invalid byte range (offset: {0}, length: {1})".format(
+                    offset, length
+                )
+            )
+        end = len(data) if length is None else offset + length
+        return BytesIO(data[offset:end])
+
+    def open_object(
+        self,
+        bucket_name: str,
+        name: str,
+    ) -> BufferedIOBase:
+        self._request("open_object")
+        return BytesIO(self._object(bucket_name, name).data)
+
+    def iter_object(
+        self,
+        bucket_name: str,
+        name: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> Iterator[bytes]:
+        self._request("iter_object")
+        data = self._object(bucket_name, name).data
+        return (
+            data[offset : offset + chunk_size]
+            for offset in range(0, len(data), chunk_size)
+        )
+
+    def _names(self, bucket_name: str, prefix: Optional[str]) -> List[str]:
+        with self._lock:
+            return sorted(
+                name
+                for name in self._bucket(bucket_name)
+                if name.startswith(prefix or "")
+            )
+
+    def list_objects(
+        self, bucket_name: str, prefix: Optional[str]
+    ) -> Iterator[ObjectInfo]:
+        self._request("list_objects")
+        names = self._names(bucket_name, prefix)
+        with self._lock:
+            bucket = self._bucket(bucket_name)
+            return iter(
+                [bucket[name].info for name in names if name in bucket]
+            )
+
+    def list_objects_page(
+        self,
+        bucket_name: str,
+        prefix: Optional[str],
+        page_token: Optional[str],
+        start_after: Optional[str],
+        max_keys: Optional[int],
+        delimiter: Optional[str],
+    ) -> ListPage:
+        self._request("list_objects_page")
+        names, prefixes, next_token = page_names(
+            self._names(bucket_name, prefix),
+            prefix,
+            page_token,
+            start_after,
+            min(max_keys or MAX_LIST_KEYS, MAX_LIST_KEYS),
+            delimiter,
+        )
+        with self._lock:
+            bucket = self._bucket(bucket_name)
+            objects = [bucket[name].info for name in names if name in bucket]
+        return ListPage(objects, prefixes, next_token)
+
+    def put_object(
+        self,
+        bucket_name: str,
+        name: str,
+        data: BytesIO,
+        size: int,
+    ) -> None:
+        self._request("put_object")
+        content = data.read(size)
+        if len(content) != size:
+            raise StorageException(
+                "stream ended after {0} of {1} bytes".format(
+                    len(content), size
+                )
+            )
+        stored = _store(name, content)
+        with self._lock:
+            self._bucket(bucket_name)[name] = stored
+
+    def concat_objects(
+        self,
+        bucket_name: str,
+        destination_object: str,
+        source_objects: List[str],
+    ) -> None:
+        self._request("concat_objects")
+        with self._lock:
+            bucket = self._bucket(bucket_name)
+            for obj in source_objects:
+                if obj not in bucket:
+                    raise _not_found(bucket_name, obj)
+            bucket[destination_object] = _store(
+                destination_object,
+                b"".join(bucket[obj].data for obj in source_objects),
+            )
+
+    def copy_object(
+        self,
+        source_bucket_name: str,
+        source_name: str,
+        destination_bucket_name: str,
+        destination_name: str,
+    ) -> None:
+        self._request("copy_object")
+        with self._lock:
+            stored = self._bucket(source_bucket_name).get(source_name)
+            if stored is None:
+                raise _not_found(source_bucket_name, source_name)
+            self._bucket(destination_bucket_name)[destination_name] = _store(
+                destination_name, stored.data
+            )
+
+    def rename_object(
+        self,
+        bucket_name: str,
+        name: str,
+        new_name: str,
+    ) -> None:
+        self._request("rename_object")
+        with self._lock:
+            bucket = self._bucket(bucket_name)
+            stored = bucket.pop(name, None)
+            if stored is None:
+                raise _not_found(bucket_name, name)
+            bucket[new_name] = _StoredObject(
+                stored.data, stored.info._replace(name=new_name)
+            )
+
+    def object_exists(self, bucket_name: str, name: str) -> bool:
+        self._request("object_exists")
+        with self._lock:
+            return name in self._buckets.get(bucket_name, {})
+
+    def stat_object(self, bucket_name: str, name: str) -> ObjectInfo:
+        self._request("stat_object")
+        return self._object(bucket_name, name).info
+
+    def delete_object(self, bucket_name: str, name: str) -> None:
+        self._request("delete_object")
+        with self._lock:
+            # deleting a missing object succeeds, as on S3
+            self._bucket(bucket_name).pop(name, None)
+
+    def delete_objects(
+        self, bucket_name: str, names: Iterable[str]
+    ) -> Dict[str, StorageException]:
+        self._request("delete_objects")
+        with self._lock:
+            bucket = self._bucket(bucket_name)
+            for name in names:
+                bucket.pop(name, None)
+        return {}
+
+    def delete_prefix(
+        self,
+        bucket_name: str,
+        prefix: Optional[str],
+        concurrency: Optional[int] = None,
+    ) -> Dict[str, StorageException]:
+        self._request("delete_prefix")
+        names = self._names(bucket_name, prefix)
+        with self._lock:
+            bucket = self._bucket(bucket_name)
+            for name in names:
+                bucket.pop(name, None)
+        return {}
+
+    def get_presigned_url(
+        self,
+        bucket_name: str,
+        name: str,
+        method: Union[str, HttpMethod],
+        expires: Optional[timedelta],
+        content_type: Optional[str] = None,
+        use_hostname: Optional[str] = None,
+        secure: Optional[bool] = None,
+    ) -> str:
+        return self.get_presigned_urls(
+            bucket_name,
+            [name],
+            method,
+            expires,
+            content_type,
+            use_hostname,
+            secure,
+            verify=True,
+        )[name]
+
+    def get_presigned_urls(
+        self,
+        bucket_name: str,
+        names: Iterable[str],
+        method: Union[str, HttpMethod],
+        expires: Optional[timedelta],
+        content_type: Optional[str] = None,
+        use_hostname: Optional[str] = None,
+        secure: Optional[bool] = None,
+        verify: bool = False,
+    ) -> Dict[str, str]:
+        """
+        Returns memory:// URLs. They only identify the object and cannot be
+        fetched.
+        """
+        if expires is None:
+            raise StorageException("expires must be defined")
+        names = list(names)
+        _method = method.value if not isinstance(method, str) else method
+        if verify:
+            self._request("get_presigned_urls")
+            with self._lock:
+                bucket = self._bucket(bucket_name)
+                missing = [name for name in names if name not in bucket]
+            if missing and _method in ("GET", "HEAD"):
+                raise _not_found(bucket_name, missing[0])
+        return {
+            name: "memory://{0}/{1}?method={2}&expires={3}".format(
+                bucket_name,
+                quote(name),
+                _method,
+                int(expires.total_seconds()),
+            )
+            for name in names
+        }
+
+    def md5_checksum(self, bucket_name: str, name: str) -> str:
+        self._request("md5_checksum")
+        return self._object(bucket_name, name).info.etag
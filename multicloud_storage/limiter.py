@@ -0,0 +1,134 @@
+from threading import Condition, Lock
+from time import monotonic, perf_counter
+from typing import Any, Callable, Dict, Hashable, Optional, TypeVar
+
+from .exception import StorageException
+from .retry import is_throttled
+
+T = TypeVar("T")
+
+# weight of the newest sample in the average request latency
+LATENCY_WEIGHT = 0.1
+
+
+class AdaptiveLimiter:
+    """
+    AdaptiveLimiter.
+
+    Caps the requests in flight with additive increase and multiplicative
+    decrease (AIMD). A request that succeeds while the limit is in use, in
+    no more than latency_tolerance times the average latency, raises the
+    limit by 1/limit, so by about one per round of requests, up to
+    max_limit. A throttled request cuts the limit by decrease, down to
+    min_limit, at most once per average latency so a burst of throttled
+    responses counts as one signal. Other errors and slow responses leave
+    the limit alone.
+    """
+
+    def __init__(
+        self,
+        initial: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        decrease: float = 0.5,
+        latency_tolerance: float = 2.0,
+    ) -> None:
+        if not 1 <= min_limit <= initial <= max_limit or not 0 < decrease < 1:
+            raise StorageException(
+                "limits must satisfy 1 <= min_limit <= initial <= max_limit"
+                " and decrease must be between 0 and 1"
+            )
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._latency: Optional[float] = None
+        self._decreased_at = 0.0
+        self._condition = Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def acquire(self) -> None:
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+
+    def release(
+        self, seconds: float, error: Optional[BaseException] = None
+    ) -> None:
+        """
+        Frees the slot of a request that took seconds and failed with error,
+        if any, and adjusts the limit.
+        """
+        with self._condition:
+            saturated = self._in_flight >= int(self._limit)
+            self._in_flight -= 1
+            if error is None:
+                self._succeeded(seconds, saturated)
+            elif is_throttled(error):
+                self._throttled()
+            self._condition.notify_all()
+
+    def _succeeded(self, seconds: float, saturated: bool) -> None:
+        # callers hold the lock
+        average = self._latency
+        self._latency = (
+            seconds
+            if average is None
+            else average + LATENCY_WEIGHT * (seconds - average)
+        )
+        if saturated and (
+            average is None or seconds <= average * self.latency_tolerance
+        ):
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+
+    def _throttled(self) -> None:
+        # callers hold the lock
+        now = monotonic()
+        if now - self._decreased_at < (self._latency or 0.0):
+            return
+        self._decreased_at = now
+        self._limit = max(self.min_limit, self._limit * self.decrease)
+
+    def call(self, func: Callable[..., T], *args: Any) -> T:
+        """
+        Calls func(*args) once a slot is free, holding it until func returns.
+        """
+        self.acquire()
+        started = perf_counter()
+        try:
+            result = func(*args)
+        except Exception as err:
+            self.release(perf_counter() - started, err)
+            raise
+        self.release(perf_counter() - started)
+        return result
+
+
+_limiters: Dict[Hashable, AdaptiveLimiter] = {}
+_limiters_lock = Lock()
+
+
+def shared_limiter(
+    key: Hashable, initial: int, max_limit: int
+) -> AdaptiveLimiter:
+    """
+    Returns the process-wide limiter for key, created with the given limits
+    by its first user.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = AdaptiveLimiter(
+                initial=initial, max_limit=max_limit
+            )
+        return limiter
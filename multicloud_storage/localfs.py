@@ -0,0 +1,616 @@
+import os
+from datetime import datetime, timedelta, timezone
+from errno import ENOENT, errorcode
+from hashlib import md5
+from io import BufferedIOBase, BytesIO
+from mimetypes import guess_type
+from os import makedirs, remove, replace, rmdir, stat, walk
+from os.path import dirname, isdir, isfile, join, relpath, sep
+from pathlib import Path
+from shutil import copyfileobj, rmtree
+from typing import (
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Union,
+)
+from uuid import uuid4
+
+from .client import DEFAULT_CHUNK_SIZE, StorageClient
+from .config import config
+from .disk_cache import ObjectData, map_file
+from .exception import StorageException
+from .http import HttpMethod
+from .log import logger
+from .object import ListPage, ObjectInfo, page_names
+from .retry import RetryPolicy
+from .transfer import TransferConfig
+
+# temporary files and checksums live next to the buckets, under a name that
+# is not a valid bucket name
+INTERNAL_DIRECTORY = ".multicloud-storage"
+MD5_XATTR = "user.multicloud_storage.md5"
+# a list request returns at most 1,000 keys, as on S3
+MAX_LIST_KEYS = 1000
+
+
+def _not_found(bucket_name: str, name: str) -> StorageException:
+    return StorageException(
+        "object {0} does not exist in bucket {1}".format(name, bucket_name),
+        code=errorcode[ENOENT],
+    )
+
+
+def _local_error(err: OSError) -> StorageException:
+    return StorageException(
+        "Local Storage Error: {0}".format(err),
+        code=errorcode.get(err.errno),
+    )
+
+
+def _etag(status: os.stat_result) -> str:
+    # cheap to compute and changes whenever the file is rewritten
+    return "{0:x}-{1:x}".format(status.st_mtime_ns, status.st_size)
+
+
+def _read_chunks(reader: BufferedIOBase, chunk_size: int) -> Iterator[bytes]:
+    with reader:
+        while True:
+            chunk = reader.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _copy_file(source: str, destination, chunk_size: int) -> None:
+    """
+    Appends the file at source to the unbuffered destination file, letting
+    the kernel move the bytes with copy_file_range or sendfile where the
+    platform supports it.
+    """
+    with open(source, "rb", buffering=0) as infile:
+        remaining = os.fstat(infile.fileno()).st_size
+        copy_range = getattr(os, "copy_file_range", None)
+        try:
+            while remaining > 0:
+                if copy_range is not None:
+                    copied = copy_range(
+                        infile.fileno(), destination.fileno(), remaining
+                    )
+                else:
+                    copied = os.sendfile(
+                        destination.fileno(), infile.fileno(), None, remaining
+                    )
+                if copied == 0:
+                    break
+                remaining -= copied
+        except OSError:
+            # file systems or platforms without in-kernel copies, carry on
+            # from wherever the kernel stopped
+            pass
+        if remaining > 0:
+            copyfileobj(infile, destination, chunk_size)
+
+
+def _prune(directory: str, stop: str) -> None:
+    """
+    Removes directory and its parents up to stop while they are empty.
+    """
+    while directory != stop and directory.startswith(stop):
+        try:
+            rmdir(directory)
+        except OSError:
+            return
+        directory = dirname(directory)
+
+
+class LocalFS(StorageClient):
+    """
+    LocalFS.
+
+    Stores every bucket as a directory below root and every object as a file
+    within it, object names split into directories at each slash. Writes go
+    to a temporary file that is renamed into place, so readers never see a
+    partial object. Reads are served from memory maps and md5 checksums are
+    kept in an extended attribute, or a sidecar file where those are not
+    supported, until the file changes.
+    """
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        transfer_config: Optional[TransferConfig] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+    ) -> None:
+        super().__init__(
+            transfer_config=transfer_config, retry_policy=retry_policy
+        )
+        self._root = root
+
+    def configure(self) -> None:
+        local_config = {
+            key: value
+            for key, value in config().items()
+            if key
+            in (
+                "STORAGE_LOCAL_ROOT",
+                "STORAGE_MULTIPART_THRESHOLD",
+                "STORAGE_MULTIPART_PART_SIZE",
+                "STORAGE_MULTIPART_CONCURRENCY",
+                "STORAGE_MULTIPART_MAX_MEMORY",
+                "STORAGE_MAX_CONCURRENCY",
+                "STORAGE_CONCURRENCY_PER_PREFIX",
+                "STORAGE_RETRY_MAX_ATTEMPTS",
+                "STORAGE_RETRY_BASE_DELAY",
+                "STORAGE_RETRY_MAX_DELAY",
+            )
+        }
+        self._root = (
+            local_config["STORAGE_LOCAL_ROOT"]
+            if self._root is None
+            else self._root
+        )
+        if self._root is None:
+            raise StorageException(
+                "local storage requires that the STORAGE_LOCAL_ROOT env"
+                " variable is present or an option is passed"
+            )
+        makedirs(join(self._root, INTERNAL_DIRECTORY, "tmp"), exist_ok=True)
+        self._configure_transfer(local_config)
+        self._configure_retry(local_config)
+
+    def _bucket_path(self, bucket_name: str) -> str:
+        if (
+            not bucket_name
+            or bucket_name.startswith(".")
+            or "/" in bucket_name
+            or sep in bucket_name
+        ):
+            raise StorageException(
+                "invalid bucket name {0}".format(bucket_name)
+            )
+        return join(self._root, bucket_name)
+
+    def _object_path(self, bucket_name: str, name: str) -> str:
+        parts = name.split("/")
+        if any(part in ("", ".", "..") or sep in part for part in parts):
+            raise StorageException("invalid object name {0}".format(name))
+        return join(self._bucket_path(bucket_name), *parts)
+
+    def _md5_path(self, bucket_name: str, name: str) -> str:
+        return join(
+            self._root,
+            INTERNAL_DIRECTORY,
+            "md5",
+            bucket_name,
+            *name.split("/"),
+        )
+
+    def _temporary_path(self) -> str:
+        return join(self._root, INTERNAL_DIRECTORY, "tmp", uuid4().hex)
+
+    def _check_bucket(self, bucket_name: str) -> None:
+        if not self.bucket_exists(bucket_name):
+            raise StorageException(
+                "bucket {0} does not exist".format(bucket_name)
+            )
+
+    def _missing(self, bucket_name: str, name: str) -> StorageException:
+        if not self.bucket_exists(bucket_name):
+            return StorageException(
+                "bucket {0} does not exist".format(bucket_name)
+            )
+        return _not_found(bucket_name, name)
+
+    def _limiter_scope(self) -> Hashable:
+        return type(self).__name__, self._root
+
+    def bucket_exists(self, name: str) -> bool:
+        return isdir(self._bucket_path(name))
+
+    def make_bucket(self, name: str) -> None:
+        if self.bucket_exists(name):
+            raise StorageException("bucket {0} already exists".format(name))
+        makedirs(self._bucket_path(name))
+
+    def remove_bucket(self, name: str, force: bool = False) -> None:
+        self._check_bucket(name)
+        if force:
+            rmtree(self._bucket_path(name))
+            rmtree(
+                join(self._root, INTERNAL_DIRECTORY, "md5", name),
+                ignore_errors=True,
+            )
+            return
+        try:
+            rmdir(self._bucket_path(name))
+        except OSError:
+            raise StorageException(
+                "bucket {0} is not empty".format(name)
+            ) from None
+
+    def get_object(
+        self,
+        bucket_name: str,
+        name: str,
+    ) -> ObjectData:
+        try:
+            return map_file(self._object_path(bucket_name, name))
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            raise self._missing(bucket_name, name) from None
+
+    def get_object_range(
+        self,
+        bucket_name: str,
+        name: str,
+        offset: int,
+        length: Optional[int] = None,
+        version: Optional[str] = None,
+    ) -> BytesIO:
+        self._check_range(offset, length)
+        with self.open_object(bucket_name, name) as infile:
+            status = os.fstat(infile.fileno())
+            if version is not None and _etag(status) != version:
+                raise self._changed(bucket_name, name)
+            if offset >= status.st_size:
+                raise StorageException(
+                    "invalid byte range (offset: {0}, length: {1})".format(
+                        offset, length
+                    )
+                )
+            infile.seek(offset)
+            return BytesIO(infile.read(-1 if length is None else length))
+
+    def open_object(
+        self,
+        bucket_name: str,
+        name: str,
+    ) -> BufferedIOBase:
+        try:
+            return open(self._object_path(bucket_name, name), "rb")
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            raise self._missing(bucket_name, name) from None
+
+    def iter_object(
+        self,
+        bucket_name: str,
+        name: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> Iterator[bytes]:
+        return _read_chunks(self.open_object(bucket_name, name), chunk_size)
+
+    def _names(self, bucket_name: str, prefix: Optional[str]) -> List[str]:
+        bucket_path = self._bucket_path(bucket_name)
+        prefix = prefix or ""
+        # only walk the directory the prefix points into
+        parents = prefix.split("/")[:-1]
+        if any(part in (".", "..") for part in parents):
+            return []
+        names = []
+        for root, _, filenames in walk(join(bucket_path, *parents)):
+            base = relpath(root, bucket_path).replace(sep, "/")
+            for filename in filenames:
+                name = filename if base == "." else base + "/" + filename
+                if name.startswith(prefix):
+                    names.append(name)
+        return sorted(names)
+
+    def _info(self, name: str, path: str) -> ObjectInfo:
+        status = stat(path)
+        return ObjectInfo(
+            name=name,
+            size=status.st_size,
+            etag=_etag(status),
+            last_modified=datetime.fromtimestamp(
+                status.st_mtime, timezone.utc
+            ),
+            content_type=guess_type(name)[0],
+        )
+
+    def list_objects(
+        self, bucket_name: str, prefix: Optional[str]
+    ) -> Iterator[ObjectInfo]:
+        self._check_bucket(bucket_name)
+        names = self._names(bucket_name, prefix)
+        return (
+            self._info(name, self._object_path(bucket_name, name))
+            for name in names
+        )
+
+    def list_objects_page(
+        self,
+        bucket_name: str,
+        prefix: Optional[str],
+        page_token: Optional[str],
+        start_after: Optional[str],
+        max_keys: Optional[int],
+        delimiter: Optional[str],
+    ) -> ListPage:
+        self._check_bucket(bucket_name)
+        names, prefixes, next_token = page_names(
+            self._names(bucket_name, prefix),
+            prefix,
+            page_token,
+            start_after,
+            min(max_keys or MAX_LIST_KEYS, MAX_LIST_KEYS),
+            delimiter,
+        )
+        return ListPage(
+            [
+                self._info(name, self._object_path(bucket_name, name))
+                for name in names
+            ],
+            prefixes,
+            next_token,
+        )
+
+    def put_object(
+        self,
+        bucket_name: str,
+        name: str,
+        data: BytesIO,
+        size: int,
+    ) -> None:
+        path = self._object_path(bucket_name, name)
+        self._check_bucket(bucket_name)
+        temporary_path = self._temporary_path()
+        hasher = md5()
+        try:
+            with open(temporary_path, "wb") as outfile:
+                remaining = size
+                while remaining > 0:
+                    chunk = data.read(min(remaining, DEFAULT_CHUNK_SIZE))
+                    if not chunk:
+                        raise StorageException(
+                            "stream ended after {0} of {1} bytes".format(
+                                size - remaining, size
+                            )
+                        )
+                    hasher.update(chunk)
+                    outfile.write(chunk)
+                    remaining -= len(chunk)
+            self._move_into_place(temporary_path, path)
+        except BaseException:
+            if isfile(temporary_path):
+                remove(temporary_path)
+            raise
+        self._write_md5(bucket_name, name, path, hasher.hexdigest())
+
+    def _move_into_place(self, temporary_path: str, path: str) -> None:
+        try:
+            makedirs(dirname(path), exist_ok=True)
+            replace(temporary_path, path)
+        except OSError as err:
+            raise _local_error(err) from None
+
+    def concat_objects(
+        self,
+        bucket_name: str,
+        destination_object: str,
+        source_objects: List[str],
+    ) -> None:
+        path = self._object_path(bucket_name, destination_object)
+        sources = [
+            self._object_path(bucket_name, obj) for obj in source_objects
+        ]
+        for source, obj in zip(sources, source_objects):
+            if not isfile(source):
+                raise self._missing(bucket_name, obj)
+        temporary_path = self._temporary_path()
+        try:
+            with open(temporary_path, "wb", buffering=0) as outfile:
+                for source in sources:
+                    _copy_file(source, outfile, DEFAULT_CHUNK_SIZE)
+            self._move_into_place(temporary_path, path)
+        except BaseException:
+            if isfile(temporary_path):
+                remove(temporary_path)
+            raise
+        # the checksum is computed on first use
+        self._remove_md5(bucket_name, destination_object)
+
+    def copy_object(
+        self,
+        source_bucket_name: str,
+        source_name: str,
+        destination_bucket_name: str,
+        destination_name: str,
+    ) -> None:
+        source = self._object_path(source_bucket_name, source_name)
+        path = self._object_path(destination_bucket_name, destination_name)
+        if not isfile(source):
+            raise self._missing(source_bucket_name, source_name)
+        self._check_bucket(destination_bucket_name)
+        checksum = self._read_md5(source_bucket_name, source_name, source)
+        temporary_path = self._temporary_path()
+        try:
+            with open(temporary_path, "wb", buffering=0) as outfile:
+                _copy_file(source, outfile, DEFAULT_CHUNK_SIZE)
+            self._move_into_place(temporary_path, path)
+        except BaseException:
+            if isfile(temporary_path):
+                remove(temporary_path)
+            raise
+        if checksum is None:
+            self._remove_md5(destination_bucket_name, destination_name)
+        else:
+            self._write_md5(
+                destination_bucket_name, destination_name, path, checksum
+            )
+
+    def rename_object(
+        self,
+        bucket_name: str,
+        name: str,
+        new_name: str,
+    ) -> None:
+        source = self._object_path(bucket_name, name)
+        path = self._object_path(bucket_name, new_name)
+        if not isfile(source):
+            raise self._missing(bucket_name, name)
+        checksum = self._read_md5(bucket_name, name, source)
+        self._move_into_place(source, path)
+        self._remove_md5(bucket_name, name)
+        _prune(dirname(source), self._bucket_path(bucket_name))
+        if checksum is not None:
+            self._write_md5(bucket_name, new_name, path, checksum)
+
+    def object_exists(self, bucket_name: str, name: str) -> bool:
+        return isfile(self._object_path(bucket_name, name))
+
+    def stat_object(self, bucket_name: str, name: str) -> ObjectInfo:
+        try:
+            return self._info(name, self._object_path(bucket_name, name))
+        except (FileNotFoundError, NotADirectoryError):
+            raise self._missing(bucket_name, name) from None
+
+    def delete_object(self, bucket_name: str, name: str) -> None:
+        self._check_bucket(bucket_name)
+        path = self._object_path(bucket_name, name)
+        try:
+            remove(path)
+        except (FileNotFoundError, NotADirectoryError):
+            # deleting a missing object succeeds, as on S3
+            return
+        except OSError as err:
+            raise _local_error(err) from None
+        self._remove_md5(bucket_name, name)
+        _prune(dirname(path), self._bucket_path(bucket_name))
+
+    def delete_objects(
+        self, bucket_name: str, names: Iterable[str]
+    ) -> Dict[str, StorageException]:
+        self._check_bucket(bucket_name)
+        errors = {}
+        for name in names:
+            try:
+                self.delete_object(bucket_name, name)
+            except StorageException as err:
+                errors[name] = err
+        return errors
+
+    def delete_prefix(
+        self,
+        bucket_name: str,
+        prefix: Optional[str],
+        concurrency: Optional[int] = None,
+    ) -> Dict[str, StorageException]:
+        self._check_bucket(bucket_name)
+        return self.delete_objects(
+            bucket_name, self._names(bucket_name, prefix)
+        )
+
+    def get_presigned_url(
+        self,
+        bucket_name: str,
+        name: str,
+        method: Union[str, HttpMethod],
+        expires: Optional[timedelta],
+        content_type: Optional[str] = None,
+        use_hostname: Optional[str] = None,
+        secure: Optional[bool] = None,
+    ) -> str:
+        return self.get_presigned_urls(
+            bucket_name,
+            [name],
+            method,
+            expires,
+            content_type,
+            use_hostname,
+            secure,
+            verify=True,
+        )[name]
+
+    def get_presigned_urls(
+        self,
+        bucket_name: str,
+        names: Iterable[str],
+        method: Union[str, HttpMethod],
+        expires: Optional[timedelta],
+        content_type: Optional[str] = None,
+        use_hostname: Optional[str] = None,
+        secure: Optional[bool] = None,
+        verify: bool = False,
+    ) -> Dict[str, str]:
+        """
+        Returns file URLs. They carry no signature and never expire.
+        """
+        names = list(names)
+        _method = method.value if not isinstance(method, str) else method
+        if verify:
+            self._check_bucket(bucket_name)
+            if _method in ("GET", "HEAD"):
+                for name in names:
+                    if not self.object_exists(bucket_name, name):
+                        raise _not_found(bucket_name, name)
+        return {
+            name: Path(self._object_path(bucket_name, name))
+            .absolute()
+            .as_uri()
+            for name in names
+        }
+
+    def md5_checksum(self, bucket_name: str, name: str) -> str:
+        path = self._object_path(bucket_name, name)
+        if not isfile(path):
+            raise self._missing(bucket_name, name)
+        checksum = self._read_md5(bucket_name, name, path)
+        if checksum is None:
+            logger.debug("computing the md5 checksum of %s", path)
+            hasher = md5()
+            for chunk in self.iter_object(bucket_name, name):
+                hasher.update(chunk)
+            checksum = hasher.hexdigest()
+            self._write_md5(bucket_name, name, path, checksum)
+        return checksum
+
+    def _read_md5(
+        self, bucket_name: str, name: str, path: str
+    ) -> Optional[str]:
+        """
+        Returns the recorded checksum if the file has not changed since it
+        was recorded.
+        """
+        try:
+            record = os.getxattr(path, MD5_XATTR).decode()
+        except (AttributeError, OSError):
+            try:
+                with open(self._md5_path(bucket_name, name)) as infile:
+                    record = infile.read()
+            except OSError:
+                return None
+        status = stat(path)
+        version, _, checksum = record.rpartition(":")
+        if version != "{0}:{1}".format(status.st_size, status.st_mtime_ns):
+            return None
+        return checksum
+
+    def _write_md5(
+        self, bucket_name: str, name: str, path: str, checksum: str
+    ) -> None:
+        status = stat(path)
+        record = "{0}:{1}:{2}".format(
+            status.st_size, status.st_mtime_ns, checksum
+        )
+        try:
+            os.setxattr(path, MD5_XATTR, record.encode())
+            return
+        except (AttributeError, OSError):
+            pass
+        md5_path = self._md5_path(bucket_name, name)
+        makedirs(dirname(md5_path), exist_ok=True)
+        with open(md5_path, "w") as outfile:
+            outfile.write(record)
+
+    def _remove_md5(self, bucket_name: str, name: str) -> None:
+        # extended attributes go away with their file
+        md5_path = self._md5_path(bucket_name, name)
+        if isfile(md5_path):
+            remove(md5_path)
+            _prune(
+                dirname(md5_path),
+                join(self._root, INTERNAL_DIRECTORY, "md5", bucket_name),
+            )
@@ -0,0 +1,134 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .exception import StorageException
+
+
+class _Entry(NamedTuple):
+    data: bytes
+    expires_at: float
+
+
+class MemoryCache:
+    """
+    MemoryCache.
+
+    Keeps the contents of small objects in process memory, keyed by bucket
+    and object name. Entries expire ttl seconds after they were stored and
+    the least recently used ones are dropped once their total size exceeds
+    max_bytes. Objects larger than max_object_size are never cached.
+
+    A read that misses reserves the key before fetching the object and
+    passes the returned generation to add. A discard in the meantime bumps
+    the generation, so data fetched before a write is not cached after it.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl: float,
+        max_object_size: Optional[int] = None,
+    ) -> None:
+        if max_bytes <= 0 or ttl <= 0:
+            raise StorageException("max_bytes and ttl must be positive")
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_object_size = (
+            max_bytes if max_object_size is None else max_object_size
+        )
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._size = 0
+        # fills in flight per key, as [count, generation]
+        self._fills: Dict[Tuple[str, str], List[int]] = {}
+        self._lock = Lock()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def get(self, bucket_name: str, name: str) -> Optional[bytes]:
+        key = (bucket_name, name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= monotonic():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry.data
+
+    def reserve(self, bucket_name: str, name: str) -> int:
+        """
+        Registers a fill of the object and returns its generation. Every
+        reserve must be followed by a release.
+        """
+        with self._lock:
+            fill = self._fills.setdefault((bucket_name, name), [0, 0])
+            fill[0] += 1
+            return fill[1]
+
+    def release(self, bucket_name: str, name: str) -> None:
+        key = (bucket_name, name)
+        with self._lock:
+            fill = self._fills[key]
+            fill[0] -= 1
+            if fill[0] == 0:
+                del self._fills[key]
+
+    def add(
+        self,
+        bucket_name: str,
+        name: str,
+        data: bytes,
+        generation: Optional[int] = None,
+    ) -> None:
+        """
+        Stores data, unless generation is given and the key was discarded
+        since it was reserved.
+        """
+        if len(data) > self.max_object_size or len(data) > self.max_bytes:
+            return
+        key = (bucket_name, name)
+        with self._lock:
+            if generation is not None and generation != self._fills[key][1]:
+                return
+            self._pop(key)
+            self._entries[key] = _Entry(data, monotonic() + self.ttl)
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    def discard(self, bucket_name: str, name: str) -> None:
+        key = (bucket_name, name)
+        with self._lock:
+            self._pop(key)
+            fill = self._fills.get(key)
+            if fill is not None:
+                fill[1] += 1
+
+    def discard_prefix(self, bucket_name: str, prefix: Optional[str]) -> None:
+        with self._lock:
+            for key in [
+                key
+                for key in self._entries
+                if key[0] == bucket_name and key[1].startswith(prefix or "")
+            ]:
+                self._pop(key)
+            for key, fill in self._fills.items():
+                if key[0] == bucket_name and key[1].startswith(prefix or ""):
+                    fill[1] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            for fill in self._fills.values():
+                fill[1] += 1
+
+    def _pop(self, key: Tuple[str, str]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry.data)
@@ -0,0 +1,286 @@
+from bisect import bisect_left
+from collections import defaultdict
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# the Prometheus client's default latency buckets, in seconds
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+# content type of the Prometheus text exposition format render returns
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def error_code(err: BaseException) -> str:
+    """
+    Returns the backend error code of err, else the HTTP status of an error
+    response without one, else its class name.
+    """
+    code = getattr(err, "code", None)
+    if code is None:
+        code = getattr(err, "status_code", None)
+    return str(code) if code is not None else type(err).__name__
+
+
+class StorageObserver:
+    """
+    StorageObserver.
+
+    Receives a callback for every Storage operation, for the bytes it moved
+    and for every request the backend sent on its behalf, existence checks
+    included. Every method does nothing by default, so observers override
+    only what they need. Callbacks run on the calling thread, often several
+    at once, and should return quickly.
+    """
+
+    def on_operation(
+        self,
+        backend: str,
+        operation: str,
+        seconds: float,
+        error: Optional[BaseException],
+    ) -> None:
+        """
+        Called when a Storage operation returned, or raised error.
+        """
+
+    def on_bytes(
+        self, backend: str, operation: str, direction: str, count: int
+    ) -> None:
+        """
+        Called with the number of object bytes an operation read or wrote;
+        direction is "read" or "write".
+        """
+
+    def on_request(
+        self,
+        backend: str,
+        method: str,
+        status: Optional[int],
+        seconds: float,
+    ) -> None:
+        """
+        Called for every request sent to the backend. status is None when
+        no response was received.
+        """
+
+    def on_retry(
+        self,
+        backend: str,
+        operation: str,
+        attempt: int,
+        error: BaseException,
+    ) -> None:
+        """
+        Called before an operation is retried after attempt failed.
+        """
+
+
+class _Histogram:
+    def __init__(self, buckets: Sequence[float]) -> None:
+        # the last count holds observations above the largest bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    return ",".join(
+        '{0}="{1}"'.format(
+            name,
+            str(value)
+            .replace("\\", "\\\\")
+            .replace('"', '\\"')
+            .replace("\n", "\\n"),
+        )
+        for name, value in zip(names, values)
+    )
+
+
+def _format(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics(StorageObserver):
+    """
+    Metrics.
+
+    Default observer that keeps latency histograms of operations and
+    requests, byte counters and error and retry counts by backend error code
+    in memory, and renders them in the Prometheus text format for a /metrics
+    endpoint.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self._operations: Dict[Tuple[str, ...], _Histogram] = {}
+        self._requests: Dict[Tuple[str, ...], _Histogram] = {}
+        self._errors: Dict[Tuple[str, ...], int] = defaultdict(int)
+        self._bytes: Dict[Tuple[str, ...], int] = defaultdict(int)
+        self._retries: Dict[Tuple[str, ...], int] = defaultdict(int)
+        self._lock = Lock()
+
+    def _observe(
+        self,
+        histograms: Dict[Tuple[str, ...], _Histogram],
+        key: Tuple[str, ...],
+        seconds: float,
+    ) -> None:
+        # callers hold the lock
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = _Histogram(self.buckets)
+        histogram.counts[bisect_left(self.buckets, seconds)] += 1
+        histogram.sum += seconds
+
+    def on_operation(
+        self,
+        backend: str,
+        operation: str,
+        seconds: float,
+        error: Optional[BaseException],
+    ) -> None:
+        with self._lock:
+            self._observe(self._operations, (backend, operation), seconds)
+            if error is not None:
+                self._errors[(backend, operation, error_code(error))] += 1
+
+    def on_bytes(
+        self, backend: str, operation: str, direction: str, count: int
+    ) -> None:
+        with self._lock:
+            self._bytes[(backend, operation, direction)] += count
+
+    def on_request(
+        self,
+        backend: str,
+        method: str,
+        status: Optional[int],
+        seconds: float,
+    ) -> None:
+        with self._lock:
+            self._observe(
+                self._requests,
+                (backend, method, "" if status is None else str(status)),
+                seconds,
+            )
+
+    def on_retry(
+        self,
+        backend: str,
+        operation: str,
+        attempt: int,
+        error: BaseException,
+    ) -> None:
+        with self._lock:
+            self._retries[(backend, operation, error_code(error))] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._operations.clear()
+            self._requests.clear()
+            self._errors.clear()
+            self._bytes.clear()
+            self._retries.clear()
+
+    def _render_histogram(
+        self,
+        lines: List[str],
+        name: str,
+        help_text: str,
+        label_names: Sequence[str],
+        histograms: Dict[Tuple[str, ...], _Histogram],
+    ) -> None:
+        lines.append("# HELP {0} {1}".format(name, help_text))
+        lines.append("# TYPE {0} histogram".format(name))
+        for key, histogram in sorted(histograms.items()):
+            labels = _labels(label_names, key)
+            count = 0
+            for bound, bucket_count in zip(
+                self.buckets + (float("inf"),), histogram.counts
+            ):
+                count += bucket_count
+                lines.append(
+                    '{0}_bucket{{{1},le="{2}"}} {3}'.format(
+                        name,
+                        labels,
+                        "+Inf" if bound == float("inf") else _format(bound),
+                        count,
+                    )
+                )
+            lines.append(
+                "{0}_sum{{{1}}} {2}".format(
+                    name, labels, _format(histogram.sum)
+                )
+            )
+            lines.append("{0}_count{{{1}}} {2}".format(name, labels, count))
+
+    @staticmethod
+    def _render_counter(
+        lines: List[str],
+        name: str,
+        help_text: str,
+        label_names: Sequence[str],
+        counters: Dict[Tuple[str, ...], int],
+    ) -> None:
+        lines.append("# HELP {0} {1}".format(name, help_text))
+        lines.append("# TYPE {0} counter".format(name))
+        for key, value in sorted(counters.items()):
+            lines.append(
+                "{0}{{{1}}} {2}".format(
+                    name, _labels(label_names, key), value
+                )
+            )
+
+    def render(self) -> str:
+        """
+        Returns every metric in the Prometheus text exposition format, see
+        CONTENT_TYPE.
+        """
+        lines: List[str] = []
+        with self._lock:
+            self._render_histogram(
+                lines,
+                "storage_operation_duration_seconds",
+                "Duration of Storage operations.",
+                ("backend", "operation"),
+                self._operations,
+            )
+            self._render_counter(
+                lines,
+                "storage_operation_errors_total",
+                "Storage operations that raised, by backend error code.",
+                ("backend", "operation", "code"),
+                self._errors,
+            )
+            self._render_counter(
+                lines,
+                "storage_retries_total",
+                "Retried Storage operations, by the error that failed them.",
+                ("backend", "operation", "code"),
+                self._retries,
+            )
+            self._render_counter(
+                lines,
+                "storage_bytes_total",
+                "Object bytes read and written by Storage operations.",
+                ("backend", "operation", "direction"),
+                self._bytes,
+            )
+            self._render_histogram(
+                lines,
+                "storage_request_duration_seconds",
+                "Duration of requests sent to the backend.",
+                ("backend", "method", "status"),
+                self._requests,
+            )
+        return "\n".join(lines) + "\n"
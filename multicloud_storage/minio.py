@@ -1,22 +1,57 @@
 from datetime import datetime, timedelta
+from functools import partial
 from json import dumps
-from typing import Iterator, List, Optional, Union
-from urllib.parse import urlsplit
-from io import SEEK_END, BytesIO
+from typing import (
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+from urllib.parse import quote, urlsplit
+from io import BufferedIOBase, BufferedReader, BytesIO, RawIOBase
+from os import environ
+import certifi
 from minio import Minio
 from minio.commonconfig import CopySource
 from minio.credentials import Credentials
 from minio.deleteobjects import DeleteObject
 from minio.error import S3Error
 from minio.signer import presign_v4
-from minio.datatypes import Object
-from .config import config
+from minio.datatypes import Object, Part, parse_list_objects
+from urllib3.util import Timeout
+from .config import config, to_bool
 from .exception import StorageException
 from .http import HttpMethod
+from .client import DEFAULT_CHUNK_SIZE
+from .object import ListPage
+from .pool import PoolConfig, pool_manager
+from .retry import RetryPolicy
 from .storage import StorageClient
+from .transfer import (
+    ByteBudget,
+    TransferConfig,
+    delete_in_batches,
+    upload_parts,
+)
 from .log import logger
-from tempfile import TemporaryDirectory
-from os.path import join
+
+# S3 limits a multipart upload to 10,000 parts
+MAX_PARTS = 10000
+# every part but the last must hold at least 5 MiB, copied parts at most 5 GiB
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_COPY_PART_SIZE = 5 * 1024 * 1024 * 1024
+# a multi-object delete request takes at most 1,000 keys
+MAX_DELETE_KEYS = 1000
+# a list request returns at most 1,000 keys
+MAX_LIST_KEYS = 1000
+# minio's own timeouts, kept unless the pool configuration sets others
+DEFAULT_TIMEOUT = Timeout(connect=300, read=300)
 
 
 def _credentials(
@@ -60,19 +95,139 @@ def _public_bucket_acl(bucket_name: str) -> str:
     )
 
 
+def _storage_exception(
+    err: S3Error, bucket_name: str, name: str
+) -> StorageException:
+    """
+    Translates a minio error raised by an object operation into the same
+    StorageException the pre-flight existence checks raise.
+    """
+    if err.code == "NoSuchBucket":
+        return StorageException(
+            "bucket {0} does not exist".format(
+                getattr(err, "bucket_name", None) or bucket_name
+            ),
+            code=err.code,
+        )
+    if err.code == "NoSuchKey":
+        return StorageException(
+            "object {0} does not exist in bucket {1}".format(
+                name, bucket_name
+            ),
+            code=err.code,
+        )
+    return StorageException(
+        "Minio Client Error: {0} (code: {1})".format(err.message, err.code),
+        code=err.code,
+    )
+
+
+class _ConcatPart(NamedTuple):
+    """
+    One part of a concatenation. Copied parts are a single source range the
+    server copies itself; the others are assembled from small source ranges
+    and uploaded by the client.
+    """
+
+    copy: bool
+    ranges: List[Tuple[str, int, int]]
+
+
+def _plan_concat(sources: List[Tuple[str, int]]) -> List[_ConcatPart]:
+    """
+    Splits the (name, size) sources into multipart upload parts. Sources of at
+    least MIN_PART_SIZE are copied server side; smaller ones are buffered
+    together, topped up from the head of the following source when needed,
+    until they are large enough to be uploaded as a part.
+    """
+    parts: List[_ConcatPart] = []
+    pending: List[Tuple[str, int, int]] = []
+    pending_size = 0
+    for name, size in sources:
+        offset = 0
+        if pending_size > 0 and size > 0:
+            offset = min(MIN_PART_SIZE - pending_size, size)
+            pending.append((name, 0, offset))
+            pending_size += offset
+            if pending_size < MIN_PART_SIZE:
+                continue
+            parts.append(_ConcatPart(False, pending))
+            pending, pending_size = [], 0
+        remaining = size - offset
+        if remaining < MIN_PART_SIZE:
+            if remaining > 0:
+                pending.append((name, offset, remaining))
+                pending_size += remaining
+            continue
+        while remaining > 0:
+            length = min(MAX_COPY_PART_SIZE, remaining)
+            if 0 < remaining - length < MIN_PART_SIZE:
+                length = remaining - MIN_PART_SIZE
+            parts.append(_ConcatPart(True, [(name, offset, length)]))
+            offset += length
+            remaining -= length
+    if pending:
+        parts.append(_ConcatPart(False, pending))
+    return parts
+
+
+class _ResponseReader(RawIOBase):
+    """
+    Raw reader over a minio response that hands the connection back to the
+    pool once it is closed.
+    """
+
+    def __init__(self, response) -> None:
+        super().__init__()
+        self._response = response
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        return self._response.readinto(buffer)
+
+    def close(self) -> None:
+        if not self.closed:
+            self._response.close()
+            self._response.release_conn()
+        super().close()
+
+
+def _stream(response, chunk_size: int) -> Iterator[bytes]:
+    try:
+        for chunk in response.stream(chunk_size):
+            yield chunk
+    finally:
+        response.close()
+        response.release_conn()
+
+
 class S3(StorageClient):
     """
     S3.
     """
 
-    def __init__(self) -> None:
-        super().__init__()
+    def __init__(
+        self,
+        bucket_cache_ttl: Optional[float] = None,
+        transfer_config: Optional[TransferConfig] = None,
+        signed_url_window: Optional[float] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        pool_config: Optional[PoolConfig] = None,
+    ) -> None:
+        super().__init__(
+            bucket_cache_ttl, transfer_config, signed_url_window, retry_policy
+        )
+        self._pool_config_override = pool_config
+        self._pool_config = pool_config or PoolConfig()
         self._secure: bool = False
         self._minio_client: Minio = None
         self._endpoint: Optional[str] = None
         self._external_hostname: Optional[str] = None
         self._credentials: Credentials = None
         self._region: str = "us-east-1"
+        self._optimistic: bool = False
 
     def configure(self) -> None:
         s3_config = {
@@ -86,9 +241,28 @@ class S3(StorageClient):
                 "AWS_REGION",
                 "S3_ENDPOINT",
                 "STORAGE_EXTERNAL_HOSTNAME",
+                "STORAGE_BUCKET_CACHE_TTL",
+                "STORAGE_OPTIMISTIC",
+                "STORAGE_MULTIPART_THRESHOLD",
+                "STORAGE_MULTIPART_PART_SIZE",
+                "STORAGE_MULTIPART_CONCURRENCY",
+                "STORAGE_MULTIPART_MAX_MEMORY",
+                "STORAGE_MAX_CONCURRENCY",
+                "STORAGE_CONCURRENCY_PER_PREFIX",
+                "STORAGE_SIGNED_URL_WINDOW",
+                "STORAGE_SIGNED_URL_CACHE_SIZE",
+                "STORAGE_RETRY_MAX_ATTEMPTS",
+                "STORAGE_RETRY_BASE_DELAY",
+                "STORAGE_RETRY_MAX_DELAY",
+                "STORAGE_HTTP_POOL_SIZE",
+                "STORAGE_HTTP_CONNECT_TIMEOUT",
+                "STORAGE_HTTP_READ_TIMEOUT",
+                "STORAGE_HTTP_KEEPALIVE",
+                "STORAGE_HTTP_KEEPALIVE_IDLE",
             )
         }
         self._endpoint = s3_config["S3_ENDPOINT"]
+        self._optimistic = to_bool(s3_config["STORAGE_OPTIMISTIC"], False)
         self._region = (
             s3_config["AWS_REGION"]
             if s3_config["AWS_REGION"] is not None
@@ -104,6 +278,10 @@ class S3(StorageClient):
             s3_config["AWS_SECRET_ACCESS_KEY"],
             None,
         )
+        self._configure_transfer(s3_config)
+        self._pool_config = self._pool_config_override or (
+            PoolConfig.from_config(s3_config)
+        )
         self._minio_client = Minio(
             self._endpoint,
             access_key=self._credentials.access_key,
@@ -111,10 +289,29 @@ class S3(StorageClient):
             session_token=None,
             secure=self._secure,
             region=s3_config["AWS_REGION"],
+            http_client=pool_manager(
+                self._pool_config,
+                self._transfer_config.max_concurrency,
+                DEFAULT_TIMEOUT,
+                cert_reqs="CERT_REQUIRED",
+                ca_certs=environ.get("SSL_CERT_FILE") or certifi.where(),
+            ),
         )
+        self._observe_transport(self._minio_client._http, "urlopen")
+        self._configure_bucket_cache(s3_config["STORAGE_BUCKET_CACHE_TTL"])
+        self._configure_signed_url_cache(s3_config)
+        self._configure_retry(s3_config)
+
+    def _limiter_scope(self) -> Hashable:
+        return type(self).__name__, self._endpoint
 
     def bucket_exists(self, name: str) -> bool:
-        return self._minio_client.bucket_exists(name)
+        if self._bucket_cache.exists(name):
+            return True
+        exists = self._minio_client.bucket_exists(name)
+        if exists:
+            self._bucket_cache.add(name)
+        return exists
 
     def make_bucket(self, name: str) -> None:
         if self.bucket_exists(name):
@@ -122,19 +319,27 @@ class S3(StorageClient):
 
         self._minio_client.make_bucket(name)
         self._minio_client.set_bucket_policy(name, _public_bucket_acl(name))
+        self._bucket_cache.add(name)
 
-    def remove_bucket(self, name: str) -> None:
+    def remove_bucket(self, name: str, force: bool = False) -> None:
         if not self.bucket_exists(name):
             raise StorageException("bucket {0} does not exist".format(name))
-        # Empty all objects
-        delete_object_list = map(
-            lambda x: DeleteObject(x.object_name),
-            self._minio_client.list_objects(name, "/", recursive=True),
-        )
-        errors = self._minio_client.remove_objects(name, delete_object_list)
-        for error in errors:
-            print("error occured when deleting object", error)
-        self._minio_client.remove_bucket(name)
+        self._bucket_cache.discard(name)
+        if force:
+            errors = self.delete_prefix(name, None)
+            if errors:
+                raise StorageException(
+                    "could not empty bucket {0}: {1} objects were not"
+                    " deleted".format(name, len(errors))
+                )
+        try:
+            self._minio_client.remove_bucket(name)
+        except S3Error as err:
+            if err.code == "BucketNotEmpty":
+                raise StorageException(
+                    "bucket {0} is not empty".format(name), code=err.code
+                ) from None
+            raise _storage_exception(err, name, "") from None
 
     def delete_object(self, bucket_name: str, name: str) -> None:
         if not self.bucket_exists(bucket_name):
@@ -143,6 +348,64 @@ class S3(StorageClient):
             )
         self._minio_client.remove_object(bucket_name, name)
 
+    def delete_objects(
+        self, bucket_name: str, names: Iterable[str]
+    ) -> Dict[str, StorageException]:
+        if not self.bucket_exists(bucket_name):
+            raise StorageException(
+                "bucket {0} does not exist".format(bucket_name)
+            )
+        return delete_in_batches(
+            names,
+            MAX_DELETE_KEYS,
+            self._transfer_config.max_concurrency,
+            lambda batch: self._delete_chunk(bucket_name, batch),
+            self._limiter(bucket_name),
+        )
+
+    def delete_prefix(
+        self,
+        bucket_name: str,
+        prefix: Optional[str],
+        concurrency: Optional[int] = None,
+    ) -> Dict[str, StorageException]:
+        if not self.bucket_exists(bucket_name):
+            raise StorageException(
+                "bucket {0} does not exist".format(bucket_name)
+            )
+        return delete_in_batches(
+            (
+                obj.object_name
+                for obj in self._minio_client.list_objects(
+                    bucket_name, prefix, recursive=True
+                )
+            ),
+            MAX_DELETE_KEYS,
+            concurrency or self._transfer_config.max_concurrency,
+            lambda batch: self._delete_chunk(bucket_name, batch),
+            self._limiter(bucket_name, prefix or ""),
+        )
+
+    def _delete_chunk(
+        self, bucket_name: str, names: List[str]
+    ) -> Dict[str, StorageException]:
+        try:
+            return {
+                error.name: StorageException(
+                    "Minio Client Error: {0} (code: {1})".format(
+                        error.message, error.code
+                    )
+                )
+                for error in self._minio_client.remove_objects(
+                    bucket_name, [DeleteObject(name) for name in names]
+                )
+            }
+        except S3Error as err:
+            return {
+                name: _storage_exception(err, bucket_name, name)
+                for name in names
+            }
+
     def put_object(
         self,
         bucket_name: str,
@@ -154,6 +417,9 @@ class S3(StorageClient):
             raise StorageException(
                 "bucket {0} does not exist".format(bucket_name)
             )
+        if self._transfer_config.use_multipart(size):
+            self._multipart_upload(bucket_name, name, data, size)
+            return
         self._minio_client.put_object(
             bucket_name,
             name,
@@ -161,6 +427,73 @@ class S3(StorageClient):
             size,
         )
 
+    def _multipart_upload(
+        self,
+        bucket_name: str,
+        name: str,
+        data: object,
+        size: int,
+    ) -> None:
+        part_size = self._transfer_config.part_size_for(size, MAX_PARTS)
+        logger.debug(
+            "uploading %s/%s in %i byte parts", bucket_name, name, part_size
+        )
+        self._multipart(
+            bucket_name,
+            name,
+            lambda upload_id: upload_parts(
+                data,
+                size,
+                part_size,
+                self._transfer_config,
+                lambda part_number, chunk: self._retry_part(
+                    self._minio_client._upload_part,
+                    bucket_name,
+                    name,
+                    chunk,
+                    None,
+                    upload_id,
+                    part_number,
+                ),
+                limiter=self._limiter(bucket_name, name),
+            ),
+        )
+
+    def _multipart(
+        self,
+        bucket_name: str,
+        name: str,
+        upload: Callable[[str], List[str]],
+    ) -> None:
+        """
+        Runs upload(upload_id), which returns the etags of the parts it
+        uploaded, inside a multipart upload that is completed on success and
+        aborted otherwise.
+        """
+        upload_id = self._retry_part(
+            self._minio_client._create_multipart_upload,
+            bucket_name,
+            name,
+            {"Content-Type": "application/octet-stream"},
+        )
+        try:
+            etags = upload(upload_id)
+            self._retry_part(
+                self._minio_client._complete_multipart_upload,
+                bucket_name,
+                name,
+                upload_id,
+                [
+                    Part(part_number, etag)
+                    for part_number, etag in enumerate(etags, start=1)
+                ],
+            )
+        except BaseException:
+            self._minio_client._abort_multipart_upload(
+                bucket_name, name, upload_id
+            )
+            raise
+
     def object_exists(self, bucket_name: str, name: str) -> bool:
         if not self.bucket_exists(bucket_name):
             raise StorageException(
@@ -175,25 +508,86 @@ class S3(StorageClient):
             )
             if err.code == "NoSuchKey":
                 return False
-            raise StorageException(msg) from None
+            raise StorageException(msg, code=err.code) from None
+
+    def stat_object(self, bucket_name: str, name: str) -> Object:
+        try:
+            return self._minio_client.stat_object(bucket_name, name)
+        except S3Error as err:
+            raise _storage_exception(err, bucket_name, name) from None
 
     def get_object(self, bucket_name: str, name: str) -> BytesIO:
-        if not self.object_exists(bucket_name, name):
+        response = self._get_response(bucket_name, name)
+        try:
+            # Read data from response.
+            data = response.data
+        finally:
+            response.close()
+            response.release_conn()
+        return BytesIO(data)
+
+    def _get_response(
+        self,
+        bucket_name: str,
+        name: str,
+        offset: int = 0,
+        length: Optional[int] = None,
+        version: Optional[str] = None,
+    ):
+        if not self._optimistic and not self.object_exists(bucket_name, name):
             raise StorageException(
                 "object {0} does not exist in bucket {1}".format(
                     name, bucket_name
                 )
             )
-        data = None
         try:
-            response = self._minio_client.get_object(bucket_name, name)
-            # Read data from response.
+            # minio reads to the end of the object when length is zero
+            return self._minio_client.get_object(
+                bucket_name,
+                name,
+                offset=offset,
+                length=length or 0,
+                request_headers={"If-Match": version} if version else None,
+            )
+        except S3Error as err:
+            if err.code == "PreconditionFailed":
+                raise self._changed(bucket_name, name) from None
+            raise _storage_exception(err, bucket_name, name) from None
+
+    def get_object_range(
+        self,
+        bucket_name: str,
+        name: str,
+        offset: int,
+        length: Optional[int] = None,
+        version: Optional[str] = None,
+    ) -> BytesIO:
+        self._check_range(offset, length)
+        response = self._get_response(
+            bucket_name, name, offset, length, version
+        )
+        try:
             data = response.data
         finally:
             response.close()
             response.release_conn()
         return BytesIO(data)
 
+    def open_object(self, bucket_name: str, name: str) -> BufferedIOBase:
+        response = self._get_response(bucket_name, name)
+        return BufferedReader(
+            _ResponseReader(response), buffer_size=DEFAULT_CHUNK_SIZE
+        )
+
+    def iter_object(
+        self,
+        bucket_name: str,
+        name: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> Iterator[bytes]:
+        response = self._get_response(bucket_name, name)
+        return _stream(response, chunk_size)
+
     def get_presigned_url(
         self,
         bucket_name: str,
@@ -204,49 +598,90 @@ class S3(StorageClient):
         use_hostname: str = None,
         secure: bool = None,
     ) -> str:
-        if not self.bucket_exists(bucket_name):
-            raise StorageException(
-                "bucket {0} does not exist".format(bucket_name)
-            )
+        return self.get_presigned_urls(
+            bucket_name,
+            [name],
+            method,
+            expires,
+            None,
+            use_hostname,
+            secure,
+            verify=True,
+        )[name]
+
+    def get_presigned_urls(
+        self,
+        bucket_name: str,
+        names: Iterable[str],
+        method: Union[str, HttpMethod],
+        expires: Optional[timedelta],
+        _: str = None,
+        use_hostname: str = None,
+        secure: bool = None,
+        verify: bool = False,
+    ) -> Dict[str, str]:
         if expires is None:
             raise StorageException("expires must be defined")
+        names = list(names)
+        _method = method.value if not isinstance(method, str) else method
+        if verify:
+            if not self.bucket_exists(bucket_name):
+                raise StorageException(
+                    "bucket {0} does not exist".format(bucket_name)
+                )
+            if _method in ("GET", "HEAD"):
+                self._check_objects_exist(bucket_name, names)
         _secure = secure if secure is not None else self._secure
         _hostname = (
             self._external_hostname if use_hostname is None else use_hostname
         )
-        _method = method.value if not isinstance(method, str) else method
         _scheme = "https" if _secure else "http"
-        if _method in ("GET", "HEAD") and not self.object_exists(
-            bucket_name, name
-        ):
-            raise StorageException(
-                "object {0} does not exist in bucket {1}".format(
-                    name, bucket_name
-                )
+
+        def _sign(name: str, signed_at: datetime) -> str:
+            url = urlsplit(
+                "{}://{}/{}/{}".format(
+                    _scheme,
+                    _hostname,
+                    bucket_name,
+                    name,
+                ),
             )
-        url = urlsplit(
-            "{}://{}/{}/{}".format(
-                _scheme,
-                _hostname,
-                bucket_name,
-                name,
-            ),
-        )
-        logger.debug("signing the url %s", url)
-        now = datetime.now()
-        signed_url = presign_v4(
-            _method,
-            url,
-            region=self._region,
-            credentials=self._credentials,
-            expires=int(expires.total_seconds()),
-            date=now,
-        )
+            logger.debug("signing the url %s", url)
+            # use the "external" hostname so that signed urls work properly
+            return presign_v4(
+                method=_method,
+                url=url,
+                region=self._region,
+                credentials=self._credentials,
+                expires=int(expires.total_seconds()),
+                date=signed_at,
+            ).geturl()
+
+        return {
+            name: self._signed_url_cache.sign(
+                (bucket_name, name, _method, _scheme, _hostname, expires),
+                expires,
+                partial(_sign, name),
+            )
+            for name in names
+        }
 
-        # use the "external" minio client so that signed urls work properly
-        return signed_url.geturl()
+    def _check_objects_exist(
+        self, bucket_name: str, names: List[str]
+    ) -> None:
+        exists = self._parallel_map(
+            self._limiter(bucket_name),
+            lambda name: self.object_exists(bucket_name, name),
+            names,
+        )
+        for name, found in zip(names, exists):
+            if not found:
+                raise StorageException(
+                    "object {0} does not exist in bucket {1}".format(
+                        name, bucket_name
+                    )
+                )
 
-    # TODO Pagination
     def list_objects(
         self, bucket_name: str, prefix: Optional[str]
     ) -> Iterator[Object]:
@@ -256,6 +691,40 @@ class S3(StorageClient):
             )
         return self._minio_client.list_objects(bucket_name, prefix)
 
+    def list_objects_page(
+        self,
+        bucket_name: str,
+        prefix: Optional[str],
+        page_token: Optional[str],
+        start_after: Optional[str],
+        max_keys: Optional[int],
+        delimiter: Optional[str],
+    ) -> ListPage:
+        # minio only exposes a listing generator, so issue ListObjectsV2
+        # directly to get at the continuation token of a single page
+        query = {
+            "list-type": "2",
+            "delimiter": delimiter or "",
+            "max-keys": str(min(max_keys or MAX_LIST_KEYS, MAX_LIST_KEYS)),
+            "prefix": prefix or "",
+        }
+        if page_token:
+            query["continuation-token"] = page_token
+        if start_after:
+            query["start-after"] = start_after
+        try:
+            response = self._minio_client._execute(
+                "GET", bucket_name, query_params=query
+            )
+        except S3Error as err:
+            raise _storage_exception(err, bucket_name, prefix or "") from None
+        objects, is_truncated, next_token, _ = parse_list_objects(response)
+        return ListPage(
+            objects=[obj for obj in objects if not obj.is_dir],
+            prefixes=[obj.object_name for obj in objects if obj.is_dir],
+            next_token=next_token if is_truncated else None,
+        )
+
     def copy_object(
         self,
         source_bucket_name: str,
@@ -263,17 +732,24 @@ class S3(StorageClient):
         destination_bucket_name: str,
         destination_name: str,
     ) -> None:
-        if not self.object_exists(source_bucket_name, source_name):
+        if not self._optimistic and not self.object_exists(
+            source_bucket_name, source_name
+        ):
             raise StorageException(
                 "object {0} does not exist in bucket {1}".format(
                     source_name, source_bucket_name
                 )
             )
-        self._minio_client.copy_object(
-            destination_bucket_name,
-            destination_name,
-            CopySource(source_bucket_name, source_name),
-        )
+        try:
+            self._minio_client.copy_object(
+                destination_bucket_name,
+                destination_name,
+                CopySource(source_bucket_name, source_name),
+            )
+        except S3Error as err:
+            raise _storage_exception(
+                err, source_bucket_name, source_name
+            ) from None
 
     def concat_objects(
         self,
@@ -281,36 +757,83 @@ class S3(StorageClient):
         destination_object: str,
         source_objects: List[str],
     ) -> None:
-        if not self.object_exists(bucket_name, destination_object):
+        stats = self._parallel_map(
+            self._limiter(bucket_name),
+            lambda obj: self.stat_object(bucket_name, obj),
+            source_objects,
+        )
+        etags = {obj: stat.etag for obj, stat in zip(source_objects, stats)}
+        parts = _plan_concat(
+            [(obj, stat.size) for obj, stat in zip(source_objects, stats)]
+        )
+        if len(parts) > MAX_PARTS:
             raise StorageException(
-                "object {0} does not exist in bucket {1}".format(
-                    destination_object, bucket_name
+                "cannot concat {0} objects into more than {1} parts".format(
+                    len(source_objects), MAX_PARTS
                 )
             )
-        for obj in source_objects:
-            if not self.object_exists(bucket_name, obj):
-                raise StorageException(
-                    "object {0} does not exist in bucket {1}".format(
-                        obj, bucket_name
+        if sum(stat.size for stat in stats) < MIN_PART_SIZE:
+            # everything is below the part minimum, a plain upload will do
+            data = b"".join(
+                self._read_ranges(bucket_name, part.ranges) for part in parts
+            )
+            self.put_object(
+                bucket_name, destination_object, BytesIO(data), len(data)
+            )
+            return
+        # parts assembled by the client are held in memory until uploaded
+        budget = ByteBudget(self._transfer_config.max_memory)
+
+        def _upload_part(upload_id: str, part_number: int, part) -> str:
+            if not part.copy:
+                size = sum(length for _, _, length in part.ranges)
+                budget.acquire(size)
+                try:
+                    return self._minio_client._upload_part(
+                        bucket_name,
+                        destination_object,
+                        self._read_ranges(bucket_name, part.ranges),
+                        None,
+                        upload_id,
+                        part_number,
                     )
-                )
+                finally:
+                    budget.release(size)
+            obj, offset, length = part.ranges[0]
+            etag, _ = self._minio_client._upload_part_copy(
+                bucket_name,
+                destination_object,
+                upload_id,
+                part_number,
+                {
+                    "x-amz-copy-source": quote(
+                        "/{0}/{1}".format(bucket_name, obj)
+                    ),
+                    "x-amz-copy-source-range": "bytes={0}-{1}".format(
+                        offset, offset + length - 1
+                    ),
+                    "x-amz-copy-source-if-match": etags[obj],
+                },
+            )
+            return etag
 
-        with TemporaryDirectory() as td:
-            filename = join(td, destination_object)
-
-            with open(filename, "wb") as tmp:
-                for obj in source_objects:
-                    data = self.get_object(bucket_name, obj)
-                    tmp.write(data.getbuffer())
-
-            with open(filename, "rb") as tmp:
-                data = BytesIO(tmp.read())
-                data.seek(0, SEEK_END)
-                num_bytes = data.tell()
-                data.seek(0)
-                self.put_object(
-                    bucket_name, destination_object, data, num_bytes
-                )
+        def _upload(upload_id: str) -> List[str]:
+            return self._parallel_map(
+                self._limiter(bucket_name, destination_object),
+                partial(self._retry_part, _upload_part, upload_id),
+                range(1, len(parts) + 1),
+                parts,
+            )
+
+        self._multipart(bucket_name, destination_object, _upload)
+
+    def _read_ranges(
+        self, bucket_name: str, ranges: List[Tuple[str, int, int]]
+    ) -> bytes:
+        return b"".join(
+            self.get_object_range(bucket_name, obj, offset, length).getvalue()
+            for obj, offset, length in ranges
+        )
 
     def rename_object(
         self,
@@ -327,11 +850,10 @@ class S3(StorageClient):
         self.delete_object(bucket_name, name)
 
     def md5_checksum(self, bucket_name: str, name: str) -> str:
-        if not self.object_exists(bucket_name, name):
+        if not self._optimistic and not self.object_exists(bucket_name, name):
             raise StorageException(
                 "object {0} does not exist in bucket {1}".format(
                     name, bucket_name
                 )
             )
-        metadata = self._minio_client.stat_object(bucket_name, name)
-        return metadata.etag
+        return self.stat_object(bucket_name, name).etag
@@ -1,31 +1,137 @@
-from typing import Union
+from typing import Iterable, List, NamedTuple, Optional, Tuple, Union
 from google.cloud.storage import Blob
 from minio.datatypes import Object
 from datetime import datetime
 from .exception import StorageException
 
-StorageObject = Union[Blob, Object]
+
+class ObjectInfo(NamedTuple):
+    """
+    Backend independent metadata of one object. Unlike a Blob or a minio
+    Object it holds no client or bucket reference, so large listings can be
+    kept in memory. Directory entries of a non recursive S3 listing have no
+    etag and a name ending in a slash.
+    """
+
+    name: str
+    size: Optional[int]
+    etag: Optional[str]
+    last_modified: Optional[datetime]
+    content_type: Optional[str]
+
+
+StorageObject = Union[Blob, Object, ObjectInfo]
+
+
+class ListPage(NamedTuple):
+    """
+    One page of a listing. Prefixes holds the common prefixes rolled up by
+    the delimiter and next_token resumes the listing, or is None once it is
+    exhausted.
+    """
+
+    objects: List[StorageObject]
+    prefixes: List[str]
+    next_token: Optional[str]
+
+
+def page_names(
+    names: Iterable[str],
+    prefix: Optional[str],
+    page_token: Optional[str],
+    start_after: Optional[str],
+    limit: int,
+    delimiter: Optional[str],
+) -> Tuple[List[str], List[str], Optional[str]]:
+    """
+    Cuts one page out of sorted object names for backends that list
+    locally, returning the object names, the common prefixes and the token
+    of the next page. The token is the last key or prefix of the page.
+    """
+    marker = page_token or start_after or ""
+    objects: List[str] = []
+    prefixes: List[str] = []
+    last = None
+    for name in names:
+        rest = name[len(prefix or "") :]
+        if delimiter and delimiter in rest:
+            end = rest.index(delimiter) + len(delimiter)
+            key = (prefix or "") + rest[:end]
+            if key <= marker or key == last:
+                continue
+        elif name <= marker:
+            continue
+        else:
+            key = name
+        if len(objects) + len(prefixes) == limit:
+            return objects, prefixes, last
+        if key == name:
+            objects.append(name)
+        else:
+            prefixes.append(key)
+        last = key
+    return objects, prefixes, None
+
+
+def to_info(obj: StorageObject) -> ObjectInfo:
+    if isinstance(obj, ObjectInfo):
+        return obj
+    if isinstance(obj, Blob):
+        return ObjectInfo(
+            obj.name, obj.size, obj.etag, obj.updated, obj.content_type
+        )
+    if isinstance(obj, Object):
+        return ObjectInfo(
+            obj.object_name,
+            obj.size,
+            obj.etag,
+            obj.last_modified,
+            obj.content_type,
+        )
+    raise StorageException("Invalid object type provided")
 
 
 def last_modified(obj: StorageObject) -> datetime:
-    if type(obj) == Blob:
-        return obj.updated
-    if type(obj) == Object:
+    if isinstance(obj, (ObjectInfo, Object)):
         return obj.last_modified
+    if isinstance(obj, Blob):
+        return obj.updated
+    raise StorageException("Invalid object type provided")
+
+
+def version(obj: StorageObject) -> Optional[str]:
+    """
+    Returns a token that changes whenever the object is written: the
+    generation of a Blob, else the etag. None when the backend has neither.
+    """
+    if isinstance(obj, Blob):
+        if obj.generation is not None:
+            return str(obj.generation)
+        return obj.etag
+    if isinstance(obj, (ObjectInfo, Object)):
+        return obj.etag
     raise StorageException("Invalid object type provided")
 
 
 def size(obj: StorageObject) -> int:
-    if type(obj) == Blob:
-        return obj.size
-    if type(obj) == Object:
+    if isinstance(obj, (ObjectInfo, Blob, Object)):
         return obj.size
     raise StorageException("Invalid object type provided")
 
 
 def name(obj: StorageObject) -> str:
-    if type(obj) == Blob:
+    if isinstance(obj, (ObjectInfo, Blob)):
         return obj.name
-    if type(obj) == Object:
+    if isinstance(obj, Object):
         return obj.object_name
     raise StorageException("Invalid object type provided")
+
+
+def is_dir(obj: StorageObject) -> bool:
+    if isinstance(obj, ObjectInfo):
+        return obj.etag is None and obj.name.endswith("/")
+    if isinstance(obj, Blob):
+        return False
+    if isinstance(obj, Object):
+        return obj.is_dir
+    raise StorageException("Invalid object type provided")
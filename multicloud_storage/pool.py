@@ -0,0 +1,169 @@
+import socket
+from typing import Dict, List, Optional, Tuple
+
+from requests.adapters import HTTPAdapter
+from urllib3 import PoolManager
+from urllib3.connection import HTTPConnection
+from urllib3.util import Retry, Timeout
+
+from .config import to_bool, to_float, to_int
+from .exception import StorageException
+
+# requests that failed to connect were never sent, so the transport may
+# repeat them for any operation
+CONNECT_RETRIES = 2
+
+
+class PoolConfig:
+    """
+    PoolConfig.
+
+    Controls the HTTP connections a backend keeps to its service. The pool
+    holds max_size connections per host, by default as many as the client
+    may send requests at once (TransferConfig.max_concurrency), so parallel
+    transfers neither wait for a connection nor open and drop extra ones.
+    Timeouts are in seconds; None keeps the library's own. With keepalive,
+    idle connections send TCP keep-alive probes after keepalive_idle
+    seconds, so ones silently dropped by a load balancer are detected
+    instead of hanging the next request.
+    """
+
+    def __init__(
+        self,
+        max_size: Optional[int] = None,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        keepalive: bool = True,
+        keepalive_idle: int = 60,
+    ) -> None:
+        if (
+            (max_size is not None and max_size <= 0)
+            or (connect_timeout is not None and connect_timeout <= 0)
+            or (read_timeout is not None and read_timeout <= 0)
+            or keepalive_idle <= 0
+        ):
+            raise StorageException(
+                "max_size, timeouts and keepalive_idle must be positive"
+            )
+        self.max_size = max_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.keepalive = keepalive
+        self.keepalive_idle = keepalive_idle
+
+    @classmethod
+    def from_config(cls, values: Dict) -> "PoolConfig":
+        default = cls()
+        max_size = to_int(values.get("STORAGE_HTTP_POOL_SIZE"), 0)
+        connect_timeout = to_float(
+            values.get("STORAGE_HTTP_CONNECT_TIMEOUT"), 0.0
+        )
+        read_timeout = to_float(values.get("STORAGE_HTTP_READ_TIMEOUT"), 0.0)
+        return cls(
+            max_size=max_size or None,
+            connect_timeout=connect_timeout or None,
+            read_timeout=read_timeout or None,
+            keepalive=to_bool(
+                values.get("STORAGE_HTTP_KEEPALIVE"), default.keepalive
+            ),
+            keepalive_idle=to_int(
+                values.get("STORAGE_HTTP_KEEPALIVE_IDLE"),
+                default.keepalive_idle,
+            ),
+        )
+
+    def pool_size(self, concurrency: int) -> int:
+        return self.max_size or concurrency
+
+    def timeout(self, default: Timeout) -> Timeout:
+        return Timeout(
+            connect=self.connect_timeout or default.connect_timeout,
+            read=self.read_timeout or default.read_timeout,
+        )
+
+    def socket_options(self) -> List[Tuple[int, int, int]]:
+        options = list(HTTPConnection.default_socket_options)
+        if not self.keepalive:
+            return options
+        options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+        # Linux calls the idle time TCP_KEEPIDLE, macOS TCP_KEEPALIVE, and
+        # Windows has neither
+        for name in ("TCP_KEEPIDLE", "TCP_KEEPALIVE"):
+            if hasattr(socket, name):
+                options.append(
+                    (
+                        socket.IPPROTO_TCP,
+                        getattr(socket, name),
+                        self.keepalive_idle,
+                    )
+                )
+                break
+        return options
+
+
+def transport_retry() -> Retry:
+    """
+    Retries failed connections only: error responses and broken reads are
+    left to the RetryPolicy, which knows whether the operation is safe to
+    repeat and backs off when the service throttles. It retries every
+    Storage operation and, within multipart uploads, copies and composes,
+    every part request on its own.
+    """
+    return Retry(
+        total=CONNECT_RETRIES,
+        connect=CONNECT_RETRIES,
+        read=0,
+        status=0,
+        backoff_factor=0.2,
+        raise_on_status=False,
+    )
+
+
+def pool_manager(
+    pool_config: PoolConfig,
+    concurrency: int,
+    default_timeout: Timeout,
+    **kwargs,
+) -> PoolManager:
+    """
+    Returns a urllib3 pool sized for concurrency requests at once; kwargs
+    are passed to every connection pool, e.g. the certificates to trust.
+    """
+    return PoolManager(
+        maxsize=pool_config.pool_size(concurrency),
+        timeout=pool_config.timeout(default_timeout),
+        retries=transport_retry(),
+        socket_options=pool_config.socket_options(),
+        **kwargs
+    )
+
+
+class TunedAdapter(HTTPAdapter):
+    """
+    requests adapter whose pool holds a connection for every concurrent
+    request and whose sockets use the pool configuration. Configured
+    timeouts replace the ones passed with each request.
+    """
+
+    def __init__(self, pool_config: PoolConfig, concurrency: int) -> None:
+        self._pool_config = pool_config
+        size = pool_config.pool_size(concurrency)
+        super().__init__(pool_maxsize=size, max_retries=transport_retry())
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        kwargs["socket_options"] = self._pool_config.socket_options()
+        super().init_poolmanager(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        pool_config = self._pool_config
+        if pool_config.connect_timeout or pool_config.read_timeout:
+            timeout = kwargs.get("timeout")
+            if isinstance(timeout, Timeout):
+                timeout = (timeout.connect_timeout, timeout.read_timeout)
+            elif not isinstance(timeout, tuple):
+                timeout = (timeout, timeout)
+            kwargs["timeout"] = (
+                pool_config.connect_timeout or timeout[0],
+                pool_config.read_timeout or timeout[1],
+            )
+        return super().send(request, **kwargs)
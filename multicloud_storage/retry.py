@@ -0,0 +1,256 @@
+from random import uniform
+from threading import Lock
+from time import monotonic, sleep
+from typing import Callable, Dict, Optional, TypeVar
+
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.exceptions import Timeout
+from urllib3.exceptions import HTTPError
+
+from .config import to_float, to_int
+from .exception import StorageException
+from .metrics import error_code
+
+T = TypeVar("T")
+
+# operations that can be repeated without changing the outcome
+IDEMPOTENT_OPERATIONS = frozenset(
+    (
+        "bucket_exists",
+        "get_object",
+        "get_object_range",
+        "open_object",
+        "iter_object",
+        "object_exists",
+        "stat_object",
+        "list_objects",
+        "list_objects_page",
+        "get_presigned_url",
+        "get_presigned_urls",
+        "md5_checksum",
+        "copy_object",
+        "delete_object",
+        "delete_objects",
+        "delete_prefix",
+        # a part of a multipart upload, copy or compose, which is written to
+        # its own slot of the transfer
+        "upload_part",
+    )
+)
+# operations a lost response makes unsafe to repeat blindly: they are only
+# retried when the backend rejected the request outright, and only if the
+# caller's precondition still holds
+CONDITIONAL_OPERATIONS = frozenset(
+    (
+        "make_bucket",
+        "remove_bucket",
+        "put_object",
+        "concat_objects",
+        "rename_object",
+    )
+)
+# error codes of requests the backend turned away without acting on them
+THROTTLING_CODES = frozenset(
+    (
+        "SlowDown",
+        "Throttling",
+        "ThrottlingException",
+        "RequestLimitExceeded",
+        "TooManyRequests",
+        "ServiceUnavailable",
+        "429",
+        "503",
+    )
+)
+# error codes of failures that may succeed when the request is repeated
+TRANSIENT_CODES = THROTTLING_CODES | frozenset(
+    (
+        "InternalError",
+        "RequestTimeout",
+        "InternalServerError",
+        "BadGateway",
+        "GatewayTimeout",
+        "500",
+        "502",
+        "504",
+    )
+)
+
+# raised by the HTTP clients when no response was received
+CONNECTION_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    HTTPError,
+    RequestsConnectionError,
+    Timeout,
+)
+
+
+def is_throttled(err: BaseException) -> bool:
+    return error_code(err) in THROTTLING_CODES
+
+
+def is_transient(err: BaseException) -> bool:
+    """
+    True for throttling, server errors and failed connections.
+    """
+    return error_code(err) in TRANSIENT_CODES or isinstance(
+        err, CONNECTION_ERRORS
+    )
+
+
+class RetryBudget:
+    """
+    RetryBudget.
+
+    Caps retries at ratio of the calls made, plus min_per_second so a
+    lightly used client can still retry. Every call deposits ratio tokens
+    and every retry takes one, so when a backend is down retries stop long
+    before they multiply its load. At most capacity tokens are saved up.
+    """
+
+    def __init__(
+        self,
+        ratio: float = 0.1,
+        min_per_second: float = 10.0,
+        capacity: float = 100.0,
+    ) -> None:
+        if ratio < 0 or min_per_second < 0 or capacity < 1:
+            raise StorageException(
+                "ratio and min_per_second must not be negative and"
+                " capacity must be at least 1"
+            )
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = capacity
+        self._balance = min(min_per_second, capacity)
+        self._updated = monotonic()
+        self._lock = Lock()
+
+    def _add(self, tokens: float) -> None:
+        # callers hold the lock
+        now = monotonic()
+        self._balance = min(
+            self.capacity,
+            self._balance
+            + tokens
+            + (now - self._updated) * self.min_per_second,
+        )
+        self._updated = now
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._add(self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            self._add(0.0)
+            if self._balance < 1:
+                return False
+            self._balance -= 1
+            return True
+
+
+# shared by every policy that is not given its own budget
+DEFAULT_RETRY_BUDGET = RetryBudget()
+
+
+class RetryPolicy:
+    """
+    RetryPolicy.
+
+    Retries failed Storage operations up to max_attempts calls in total,
+    waiting a random time between zero and an exponentially growing delay
+    (full jitter) before each retry. Idempotent operations are retried on
+    any transient error; conditional ones only when the request was
+    throttled and the caller's precondition holds. Every retry is paid from
+    the budget, by default one shared by the whole process. A max_attempts
+    of 1 disables retries.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.1,
+        max_delay: float = 5.0,
+        budget: Optional[RetryBudget] = None,
+    ) -> None:
+        if max_attempts < 1 or base_delay < 0 or max_delay < 0:
+            raise StorageException(
+                "max_attempts must be positive and delays must not be"
+                " negative"
+            )
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget or DEFAULT_RETRY_BUDGET
+
+    @classmethod
+    def from_config(cls, values: Dict) -> "RetryPolicy":
+        default = cls()
+        return cls(
+            max_attempts=to_int(
+                values.get("STORAGE_RETRY_MAX_ATTEMPTS"), default.max_attempts
+            ),
+            base_delay=to_float(
+                values.get("STORAGE_RETRY_BASE_DELAY"), default.base_delay
+            ),
+            max_delay=to_float(
+                values.get("STORAGE_RETRY_MAX_DELAY"), default.max_delay
+            ),
+        )
+
+    def retryable(self, operation: str, err: BaseException) -> bool:
+        if operation in IDEMPOTENT_OPERATIONS:
+            return is_transient(err)
+        if operation in CONDITIONAL_OPERATIONS:
+            return is_throttled(err)
+        return False
+
+    def delay(self, attempt: int) -> float:
+        """
+        Returns the time to wait before retrying after attempt failed.
+        """
+        return uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        )
+
+    def call(
+        self,
+        operation: str,
+        func: Callable[[], T],
+        precondition: Optional[Callable[[], bool]] = None,
+        on_retry: Optional[Callable[[int, BaseException], None]] = None,
+    ) -> T:
+        """
+        Calls func, retrying it as the policy allows. precondition is checked
+        before every retry and the error is raised when it does not hold;
+        on_retry is called with the failed attempt and its error.
+        """
+        if self.max_attempts > 1:
+            self.budget.deposit()
+        attempt = 1
+        while True:
+            try:
+                return func()
+            except Exception as err:
+                if (
+                    attempt >= self.max_attempts
+                    or not self.retryable(operation, err)
+                    or not _holds(precondition)
+                    or not self.budget.withdraw()
+                ):
+                    raise
+                if on_retry is not None:
+                    on_retry(attempt, err)
+                sleep(self.delay(attempt))
+                attempt += 1
+
+
+def _holds(precondition: Optional[Callable[[], bool]]) -> bool:
+    if precondition is None:
+        return True
+    try:
+        return precondition()
+    except Exception:
+        return False
@@ -1,12 +1,97 @@
 from datetime import timedelta
-from multicloud_storage.object import StorageObject
-from typing import Iterator, List, Optional, Union
-from io import BytesIO
+from multicloud_storage.object import (
+    ListPage,
+    StorageObject,
+    size as object_size,
+    to_info,
+    version as object_version,
+)
+from functools import partial, wraps
+from time import perf_counter
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    TypeVar,
+    Union,
+)
+from io import BufferedIOBase, BytesIO
 
 from multicloud_storage.http import HttpMethod
 
-from .client import StorageClient
+from .client import DEFAULT_CHUNK_SIZE, StorageClient
+from .disk_cache import DiskCache, ObjectData
+from .exception import StorageException
 from .log import logger
+from .memory_cache import MemoryCache
+from .metrics import StorageObserver
+from .transfer import download_ranges
+
+F = TypeVar("F", bound=Callable[..., Any])
+T = TypeVar("T")
+
+
+def _observed(method: F) -> F:
+    """
+    Reports the duration of a Storage operation, and the error it raised, to
+    the observer. Operations returning an iterator are timed until it is
+    returned.
+    """
+    operation = method.__name__
+
+    @wraps(method)
+    def _wrapper(self: "Storage", *args: Any, **kwargs: Any) -> Any:
+        observer = self._observer
+        if observer is None:
+            return method(self, *args, **kwargs)
+        started = perf_counter()
+        try:
+            result = method(self, *args, **kwargs)
+        except Exception as err:
+            observer.on_operation(
+                self._backend, operation, perf_counter() - started, err
+            )
+            raise
+        observer.on_operation(
+            self._backend, operation, perf_counter() - started, None
+        )
+        return result
+
+    return _wrapper  # type: ignore
+
+
+def _nbytes(data: ObjectData) -> int:
+    with data.getbuffer() as view:
+        return view.nbytes
+
+
+def _close(chunks: Iterator[bytes]) -> None:
+    close = getattr(chunks, "close", None)
+    if close is not None:
+        close()
+
+
+def _rewinder(data: Any) -> Callable[[], bool]:
+    """
+    Returns a precondition that seeks data back to where an upload started,
+    which fails for streams that cannot seek.
+    """
+    try:
+        start = data.tell() if data.seekable() else None
+    except (AttributeError, OSError):
+        start = None
+
+    def _rewind() -> bool:
+        if start is None:
+            return False
+        data.seek(start)
+        return True
+
+    return _rewind
 
 
 class Storage:
@@ -16,24 +101,101 @@ class Storage:
     The Storage defines the interface for the "control" part of the two
     class hierarchies. It maintains a reference to an object of the
     Implementation hierarchy and delegates all of the real work to this object.
+
+    An optional MemoryCache and DiskCache serve get_object from process
+    memory and local disk, in that order. Writes made through this Storage
+    drop the affected cache entries; writes made elsewhere are only noticed
+    once a memory cache entry expires or by a disk cache that revalidates.
+
+    Calls to the client are retried as its RetryPolicy allows. An optional
+    StorageObserver, such as Metrics, is told the duration, errors and
+    retries of every operation and the object bytes read and written. It is
+    also added to the client's observers, so it receives every request the
+    client sends, including those of other Storage instances sharing the
+    client.
     """
 
-    def __init__(self, client: StorageClient) -> None:
+    def __init__(
+        self,
+        client: StorageClient,
+        disk_cache: Optional[DiskCache] = None,
+        memory_cache: Optional[MemoryCache] = None,
+        observer: Optional[StorageObserver] = None,
+    ) -> None:
         self._client = client
         self._client.configure()
+        self._disk_cache = disk_cache
+        self._memory_cache = memory_cache
+        self._observer = observer
+        self._backend = type(client).__name__
+        if observer is not None:
+            self._client.add_observer(observer)
+
+    def _on_bytes(self, operation: str, direction: str, count: int) -> None:
+        if self._observer is not None:
+            self._observer.on_bytes(self._backend, operation, direction, count)
+
+    def _retry(
+        self,
+        operation: str,
+        func: Callable[..., T],
+        *args: Any,
+        precondition: Optional[Callable[[], bool]] = None,
+    ) -> T:
+        return self._client._retry_policy.call(
+            operation,
+            partial(func, *args),
+            precondition,
+            partial(self._on_retry, operation),
+        )
+
+    def _on_retry(
+        self, operation: str, attempt: int, error: BaseException
+    ) -> None:
+        logger.debug(
+            "retrying %s after attempt %i failed: %s",
+            operation,
+            attempt,
+            error,
+        )
+        if self._observer is not None:
+            self._observer.on_retry(self._backend, operation, attempt, error)
 
+    def _invalidate(self, bucket_name: str, name: str) -> None:
+        if self._memory_cache is not None:
+            self._memory_cache.discard(bucket_name, name)
+        if self._disk_cache is not None:
+            self._disk_cache.discard(bucket_name, name)
+
+    def _invalidate_prefix(
+        self, bucket_name: str, prefix: Optional[str]
+    ) -> None:
+        if self._memory_cache is not None:
+            self._memory_cache.discard_prefix(bucket_name, prefix)
+        if self._disk_cache is not None:
+            self._disk_cache.discard_prefix(bucket_name, prefix)
+
+    @_observed
     def bucket_exists(self, name: str) -> bool:
         logger.debug("bucket_exists(name='%s')", name)
-        return self._client.bucket_exists(name)
+        return self._retry("bucket_exists", self._client.bucket_exists, name)
 
+    @_observed
     def make_bucket(self, name: str) -> None:
         logger.debug("make_bucket(name='%s')", name)
-        return self._client.make_bucket(name)
+        return self._retry("make_bucket", self._client.make_bucket, name)
 
-    def remove_bucket(self, name: str) -> None:
-        logger.debug("remove_bucket(name='%s')", name)
-        return self._client.remove_bucket(name)
+    @_observed
+    def remove_bucket(self, name: str, force: bool = False) -> None:
+        logger.debug("remove_bucket(name='%s', force=%s)", name, force)
+        try:
+            return self._retry(
+                "remove_bucket", self._client.remove_bucket, name, force
+            )
+        finally:
+            self._invalidate_prefix(name, None)
 
+    @_observed
     def put_object(
         self,
         bucket_name: str,
@@ -47,30 +209,270 @@ class Storage:
             name,
             size,
         )
-        return self._client.put_object(bucket_name, name, data, size)
+        try:
+            self._retry(
+                "put_object",
+                self._client.put_object,
+                bucket_name,
+                name,
+                data,
+                size,
+                precondition=_rewinder(data),
+            )
+        finally:
+            self._invalidate(bucket_name, name)
+        self._on_bytes("put_object", "write", size)
 
+    @_observed
     def get_object(
         self,
         bucket_name: str,
         name: str,
-    ) -> BytesIO:
+    ) -> ObjectData:
         logger.debug(
             "get_object(bucket_name='%s',name='%s')", bucket_name, name
         )
+        result = self._retry(
+            "get_object", self._get_cached_object, bucket_name, name
+        )
+        if self._observer is not None:
+            self._on_bytes("get_object", "read", _nbytes(result))
+        return result
+
+    def _get_cached_object(
+        self, bucket_name: str, name: str
+    ) -> ObjectData:
+        if self._memory_cache is None:
+            return self._get_object(bucket_name, name)
+        data = self._memory_cache.get(bucket_name, name)
+        if data is not None:
+            # BytesIO shares the immutable bytes until it is written to
+            return BytesIO(data)
+        # a write that lands during the fetch discards the key, and with it
+        # this fill
+        generation = self._memory_cache.reserve(bucket_name, name)
+        try:
+            result = self._get_object(bucket_name, name)
+            if _nbytes(result) <= self._memory_cache.max_object_size:
+                self._memory_cache.add(
+                    bucket_name, name, result.getvalue(), generation
+                )
+        finally:
+            self._memory_cache.release(bucket_name, name)
+        return result
+
+    def _get_object(self, bucket_name: str, name: str) -> ObjectData:
+        if self._disk_cache is not None:
+            return self._disk_cache.get_object(self._client, bucket_name, name)
         return self._client.get_object(bucket_name, name)
 
+    @_observed
+    def get_object_range(
+        self,
+        bucket_name: str,
+        name: str,
+        offset: int,
+        length: Optional[int] = None,
+    ) -> BytesIO:
+        logger.debug(
+            "get_object_range(bucket_name='%s',name='%s',offset=%i,length=%s)",
+            bucket_name,
+            name,
+            offset,
+            length,
+        )
+        result = self._retry(
+            "get_object_range",
+            self._client.get_object_range,
+            bucket_name,
+            name,
+            offset,
+            length,
+        )
+        if self._observer is not None:
+            self._on_bytes("get_object_range", "read", _nbytes(result))
+        return result
+
+    @_observed
+    def open_object(
+        self,
+        bucket_name: str,
+        name: str,
+    ) -> BufferedIOBase:
+        logger.debug(
+            "open_object(bucket_name='%s',name='%s')", bucket_name, name
+        )
+        return self._retry(
+            "open_object", self._client.open_object, bucket_name, name
+        )
+
+    @_observed
+    def iter_object(
+        self,
+        bucket_name: str,
+        name: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> Iterator[bytes]:
+        logger.debug(
+            "iter_object(bucket_name='%s',name='%s',chunk_size=%i)",
+            bucket_name,
+            name,
+            chunk_size,
+        )
+        chunks = self._retry(
+            "iter_object",
+            self._client.iter_object,
+            bucket_name,
+            name,
+            chunk_size,
+        )
+        if self._observer is None:
+            return chunks
+        return self._count_chunks(chunks)
+
+    def _count_chunks(self, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        try:
+            for chunk in chunks:
+                self._on_bytes("iter_object", "read", len(chunk))
+                yield chunk
+        finally:
+            # a reader that stops early releases the backend's stream
+            _close(chunks)
+
+    @_observed
     def object_exists(self, bucket_name: str, name: str) -> bool:
         logger.debug(
             "object_exists(bucket_name='%s',name='%s')", bucket_name, name
         )
-        return self._client.object_exists(bucket_name, name)
+        return self._retry(
+            "object_exists", self._client.object_exists, bucket_name, name
+        )
 
+    @_observed
+    def stat_object(self, bucket_name: str, name: str) -> StorageObject:
+        logger.debug(
+            "stat_object(bucket_name='%s',name='%s')", bucket_name, name
+        )
+        return self._retry(
+            "stat_object", self._client.stat_object, bucket_name, name
+        )
+
+    @_observed
+    def download_to_path(
+        self,
+        bucket_name: str,
+        name: str,
+        path: str,
+        concurrency: Optional[int] = None,
+        part_size: Optional[int] = None,
+    ) -> None:
+        """
+        Downloads an object to a local file, fetching byte ranges in parallel
+        and writing each one at its offset. Part size defaults to the
+        client's transfer configuration; concurrency, when given, caps the
+        requests the bucket's adaptive limiter lets through.
+        """
+        logger.debug(
+            "download_to_path(bucket_name='%s',name='%s',path='%s',"
+            " concurrency=%s, part_size=%s)",
+            bucket_name,
+            name,
+            path,
+            concurrency,
+            part_size,
+        )
+        transfer_config = self._client._transfer_config
+        stat = self._retry(
+            "stat_object", self._client.stat_object, bucket_name, name
+        )
+        size = object_size(stat)
+        # every range is read from the version that was stat'ed, so an
+        # overwrite during the download fails it instead of mixing versions
+        version = object_version(stat)
+        download_ranges(
+            path,
+            size,
+            part_size or transfer_config.part_size,
+            concurrency or transfer_config.max_concurrency,
+            lambda offset, length: self._retry(
+                "get_object_range",
+                self._client.get_object_range,
+                bucket_name,
+                name,
+                offset,
+                length,
+                version,
+            ),
+            self._client._limiter(bucket_name, name),
+        )
+        self._on_bytes("download_to_path", "read", size)
+
+    @_observed
     def delete_object(self, bucket_name: str, name: str) -> None:
         logger.debug(
             "delete_object(bucket_name='%s',name='%s')", bucket_name, name
         )
-        return self._client.delete_object(bucket_name, name)
+        try:
+            return self._retry(
+                "delete_object", self._client.delete_object, bucket_name, name
+            )
+        finally:
+            self._invalidate(bucket_name, name)
 
+    @_observed
+    def delete_objects(
+        self, bucket_name: str, names: Iterable[str]
+    ) -> Dict[str, StorageException]:
+        """
+        Deletes many objects with batched requests and returns the errors of
+        the objects that could not be deleted, keyed by object name.
+        """
+        logger.debug(
+            "delete_objects(bucket_name='%s',names=[omitted])", bucket_name
+        )
+        # listed so a retry deletes the same names
+        names = list(names)
+        try:
+            return self._retry(
+                "delete_objects",
+                self._client.delete_objects,
+                bucket_name,
+                names,
+            )
+        finally:
+            for name in names:
+                self._invalidate(bucket_name, name)
+
+    @_observed
+    def delete_prefix(
+        self,
+        bucket_name: str,
+        prefix: Optional[str],
+        concurrency: Optional[int] = None,
+    ) -> Dict[str, StorageException]:
+        """
+        Deletes every object under prefix, deleting batches of the listing
+        while later pages are still being fetched. Returns the errors of the
+        objects that could not be deleted, keyed by object name.
+        """
+        logger.debug(
+            "delete_prefix(bucket_name='%s',prefix='%s',concurrency=%s)",
+            bucket_name,
+            prefix,
+            concurrency,
+        )
+        try:
+            return self._retry(
+                "delete_prefix",
+                self._client.delete_prefix,
+                bucket_name,
+                prefix,
+                concurrency,
+            )
+        finally:
+            self._invalidate_prefix(bucket_name, prefix)
+
+    @_observed
     def get_presigned_url(
         self,
         bucket_name: str,
@@ -92,7 +494,9 @@ class Storage:
             use_hostname,
             secure,
         )
-        return self._client.get_presigned_url(
+        return self._retry(
+            "get_presigned_url",
+            self._client.get_presigned_url,
             bucket_name,
             name,
             method,
@@ -102,18 +506,120 @@ class Storage:
             secure,
         )
 
+    @_observed
+    def get_presigned_urls(
+        self,
+        bucket_name: str,
+        names: Iterable[str],
+        method: Union[str, HttpMethod],
+        expires: Optional[timedelta] = timedelta(days=1),
+        content_type: Optional[str] = None,
+        use_hostname: Optional[str] = None,
+        secure: Optional[bool] = None,
+        verify: bool = False,
+    ) -> Dict[str, str]:
+        """
+        Signs a URL for every name, keyed by name. Signing is local, so
+        unless verify is set no request is made and URLs may be returned for
+        objects that do not exist. With verify the bucket and, for reads, every
+        object are checked first, as get_presigned_url does.
+        """
+        logger.debug(
+            "get_presigned_urls(bucket_name='%s',names=[omitted], method='%s',"
+            " expires=%s, content_type='%s', use_hostname=%s, secure=%s,"
+            " verify=%s)",
+            bucket_name,
+            method,
+            expires,
+            content_type,
+            use_hostname,
+            secure,
+            verify,
+        )
+        return self._retry(
+            "get_presigned_urls",
+            partial(self._client.get_presigned_urls, verify=verify),
+            bucket_name,
+            list(names),
+            method,
+            expires,
+            content_type,
+            use_hostname,
+            secure,
+        )
+
+    @_observed
     def list_objects(
         self,
         bucket_name: str,
         prefix: Optional[str] = None,
+        compact: bool = False,
     ) -> Iterator[StorageObject]:
+        """
+        Lists the objects below prefix. With compact set every entry is
+        converted to an ObjectInfo as it is read, so the backend objects can
+        be released right away.
+        """
         logger.debug(
-            "list_objects(bucket_name='%s',prefix='%s')",
+            "list_objects(bucket_name='%s',prefix='%s',compact=%s)",
             bucket_name,
             prefix,
+            compact,
         )
-        return self._client.list_objects(bucket_name, prefix)
+        objects = self._retry(
+            "list_objects", self._client.list_objects, bucket_name, prefix
+        )
+        return map(to_info, objects) if compact else objects
 
+    @_observed
+    def list_objects_page(
+        self,
+        bucket_name: str,
+        prefix: Optional[str] = None,
+        page_token: Optional[str] = None,
+        start_after: Optional[str] = None,
+        max_keys: Optional[int] = None,
+        delimiter: Optional[str] = None,
+        compact: bool = False,
+    ) -> ListPage:
+        """
+        Lists one page of at most max_keys objects in name order. Pass the
+        returned next_token as page_token to fetch the following page, or a
+        name as start_after to begin listing right after it. With a delimiter,
+        names sharing a prefix up to the delimiter are returned once in
+        prefixes instead of objects. With compact set the objects are
+        returned as ObjectInfo records.
+        """
+        logger.debug(
+            "list_objects_page(bucket_name='%s',prefix='%s',page_token='%s',"
+            "start_after='%s',max_keys=%s,delimiter='%s',compact=%s)",
+            bucket_name,
+            prefix,
+            page_token,
+            start_after,
+            max_keys,
+            delimiter,
+            compact,
+        )
+        if max_keys is not None and max_keys <= 0:
+            raise StorageException("max_keys must be positive")
+        page = self._retry(
+            "list_objects_page",
+            self._client.list_objects_page,
+            bucket_name,
+            prefix,
+            page_token,
+            start_after,
+            max_keys,
+            delimiter,
+        )
+        if compact:
+            return page._replace(
+                objects=[to_info(obj) for obj in page.objects]
+            )
+        return page
+
+    @_observed
     def copy_object(
         self,
         source_bucket_name: str,
@@ -129,13 +635,19 @@ class Storage:
             destination_bucket_name,
             destination_name,
         )
-        self._client.copy_object(
-            source_bucket_name,
-            source_name,
-            destination_bucket_name,
-            destination_name,
-        )
+        try:
+            self._retry(
+                "copy_object",
+                self._client.copy_object,
+                source_bucket_name,
+                source_name,
+                destination_bucket_name,
+                destination_name,
+            )
+        finally:
+            self._invalidate(destination_bucket_name, destination_name)
 
+    @_observed
     def rename_object(
         self,
         bucket_name: str,
@@ -148,12 +660,23 @@ class Storage:
             name,
             new_name,
         )
-        self._client.rename_object(
-            bucket_name,
-            name,
-            new_name,
-        )
+        try:
+            # once the source is gone an earlier attempt went through
+            self._retry(
+                "rename_object",
+                self._client.rename_object,
+                bucket_name,
+                name,
+                new_name,
+                precondition=partial(
+                    self._client.object_exists, bucket_name, name
+                ),
+            )
+        finally:
+            self._invalidate(bucket_name, name)
+            self._invalidate(bucket_name, new_name)
 
+    @_observed
     def concat_objects(
         self,
         bucket_name: str,
@@ -167,10 +690,22 @@ class Storage:
             destination_object,
             source_objects,
         )
-        return self._client.concat_objects(
-            bucket_name, destination_object, source_objects
-        )
+        try:
+            # appending to a source again would duplicate its contents
+            return self._retry(
+                "concat_objects",
+                self._client.concat_objects,
+                bucket_name,
+                destination_object,
+                source_objects,
+                precondition=lambda: destination_object not in source_objects,
+            )
+        finally:
+            self._invalidate(bucket_name, destination_object)
 
+    @_observed
     def md5_checksum(self, bucket_name: str, name: str) -> str:
         logger.debug("md5_hash(bucket_name='%s',name='%s')", bucket_name, name)
-        return self._client.md5_checksum(bucket_name, name)
+        return self._retry(
+            "md5_checksum", self._client.md5_checksum, bucket_name, name
+        )
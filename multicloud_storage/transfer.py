@@ -0,0 +1,335 @@
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from mmap import mmap
+from os import remove, replace
+from os.path import exists
+from threading import Condition, Event
+from time import perf_counter
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    TypeVar,
+)
+from uuid import uuid4
+
+from .config import to_bool, to_int
+from .exception import StorageException
+from .limiter import AdaptiveLimiter
+from .retry import is_throttled
+
+MiB = 1024 * 1024
+
+T = TypeVar("T")
+
+
+class TransferConfig:
+    """
+    TransferConfig.
+
+    Controls when put_object switches to a parallel multipart upload and how
+    the payload is split. At most max_memory bytes of parts are buffered at
+    once, so the reader blocks while the uploaders catch up.
+
+    Parallel requests start at concurrency per bucket and adapt between one
+    and max_concurrency, see AdaptiveLimiter. With limit_per_prefix every
+    prefix of a bucket gets its own limit, as S3 rates are per prefix.
+    """
+
+    def __init__(
+        self,
+        threshold: int = 64 * MiB,
+        part_size: int = 16 * MiB,
+        concurrency: int = 8,
+        max_memory: int = 256 * MiB,
+        max_concurrency: int = 64,
+        limit_per_prefix: bool = False,
+    ) -> None:
+        if part_size <= 0 or concurrency <= 0 or max_memory <= 0:
+            raise StorageException(
+                "part_size, concurrency and max_memory must be positive"
+            )
+        self.threshold = threshold
+        self.part_size = part_size
+        self.concurrency = concurrency
+        self.max_memory = max_memory
+        self.max_concurrency = max(concurrency, max_concurrency)
+        self.limit_per_prefix = limit_per_prefix
+
+    @classmethod
+    def from_config(cls, values: Dict) -> "TransferConfig":
+        default = cls()
+        return cls(
+            threshold=to_int(
+                values.get("STORAGE_MULTIPART_THRESHOLD"), default.threshold
+            ),
+            part_size=to_int(
+                values.get("STORAGE_MULTIPART_PART_SIZE"), default.part_size
+            ),
+            concurrency=to_int(
+                values.get("STORAGE_MULTIPART_CONCURRENCY"),
+                default.concurrency,
+            ),
+            max_memory=to_int(
+                values.get("STORAGE_MULTIPART_MAX_MEMORY"), default.max_memory
+            ),
+            max_concurrency=to_int(
+                values.get("STORAGE_MAX_CONCURRENCY"),
+                default.max_concurrency,
+            ),
+            limit_per_prefix=to_bool(
+                values.get("STORAGE_CONCURRENCY_PER_PREFIX"),
+                default.limit_per_prefix,
+            ),
+        )
+
+    def use_multipart(self, size: int) -> bool:
+        return size > 0 and size >= self.threshold
+
+    def part_size_for(self, size: int, max_parts: int) -> int:
+        """
+        Returns the configured part size, grown when needed so that an object
+        of the given size fits in max_parts parts.
+        """
+        return max(self.part_size, -(-size // max_parts))
+
+
+def chunked(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    chunk: List[T] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def delete_in_batches(
+    names: Iterable[str],
+    batch_size: int,
+    concurrency: int,
+    delete_batch: Callable[[List[str]], Dict[str, Any]],
+    limiter: Optional[AdaptiveLimiter] = None,
+) -> Dict[str, Any]:
+    """
+    Hands batches of names to delete_batch on a thread pool while names is
+    still being consumed, so a paginated listing and the deletions overlap.
+    At most twice the concurrency of batches are queued at any time and,
+    with a limiter, only as many as it allows are sent at once. Returns the
+    merged per-name errors of every batch.
+    """
+    errors: Dict[str, Any] = {}
+    pending: Set[Future] = set()
+
+    def _delete(batch: List[str]) -> Dict[str, Any]:
+        if limiter is None:
+            return delete_batch(batch)
+        limiter.acquire()
+        started = perf_counter()
+        batch_errors: Dict[str, Any] = {}
+        error: Optional[BaseException] = None
+        try:
+            batch_errors = delete_batch(batch)
+            return batch_errors
+        except Exception as err:
+            error = err
+            raise
+        finally:
+            # batches report throttling per name instead of raising
+            limiter.release(
+                perf_counter() - started,
+                error
+                or next(
+                    (e for e in batch_errors.values() if is_throttled(e)),
+                    None,
+                ),
+            )
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for batch in chunked(names, batch_size):
+            if len(pending) >= 2 * concurrency:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    errors.update(future.result())
+            pending.add(executor.submit(_delete, batch))
+        for future in pending:
+            errors.update(future.result())
+    return errors
+
+
+class ByteBudget:
+    """
+    Blocks callers while more than max_bytes are held. A single request larger
+    than the budget is admitted once nothing else is in flight.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self._max_bytes = max_bytes
+        self._in_flight = 0
+        self._condition = Condition()
+
+    def acquire(self, size: int) -> None:
+        with self._condition:
+            while (
+                self._in_flight > 0
+                and self._in_flight + size > self._max_bytes
+            ):
+                self._condition.wait()
+            self._in_flight += size
+
+    def release(self, size: int) -> None:
+        with self._condition:
+            self._in_flight -= size
+            self._condition.notify_all()
+
+
+def _read_part(data: Any, size: int) -> bytes:
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = data.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def upload_parts(
+    data: Any,
+    size: int,
+    part_size: int,
+    transfer_config: TransferConfig,
+    upload_part: Callable[[int, bytes], T],
+    hasher: Optional[Any] = None,
+    limiter: Optional[AdaptiveLimiter] = None,
+) -> List[T]:
+    """
+    Reads size bytes from data in part_size pieces and calls
+    upload_part(part_number, chunk) for each of them on a thread pool, as
+    many at once as the limiter allows. Part numbers start at 1 and the
+    results are returned in part order. When a hasher is given every part is
+    fed to it in order as it is read.
+    """
+    budget = ByteBudget(transfer_config.max_memory)
+    failed = Event()
+
+    def _upload(part_number: int, chunk: bytes) -> T:
+        try:
+            if limiter is None:
+                return upload_part(part_number, chunk)
+            return limiter.call(upload_part, part_number, chunk)
+        except BaseException:
+            failed.set()
+            raise
+        finally:
+            budget.release(len(chunk))
+
+    futures: List[Future] = []
+    with ThreadPoolExecutor(
+        max_workers=transfer_config.max_concurrency
+        if limiter is not None
+        else transfer_config.concurrency
+    ) as executor:
+        try:
+            remaining = size
+            while remaining > 0 and not failed.is_set():
+                part_length = min(part_size, remaining)
+                budget.acquire(part_length)
+                chunk = _read_part(data, part_length)
+                if len(chunk) != part_length:
+                    budget.release(part_length)
+                    raise StorageException(
+                        "stream ended after {0} of {1} bytes".format(
+                            size - remaining + len(chunk), size
+                        )
+                    )
+                if hasher is not None:
+                    hasher.update(chunk)
+                futures.append(
+                    executor.submit(_upload, len(futures) + 1, chunk)
+                )
+                remaining -= part_length
+            return [future.result() for future in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def _write_ranges(
+    mapped: mmap,
+    size: int,
+    part_size: int,
+    concurrency: int,
+    read_range: Callable[[int, int], Any],
+    limiter: Optional[AdaptiveLimiter],
+) -> None:
+    def _download(offset: int) -> None:
+        length = min(part_size, size - offset)
+        data = (
+            read_range(offset, length)
+            if limiter is None
+            else limiter.call(read_range, offset, length)
+        )
+        view = data.getbuffer()
+        try:
+            if len(view) != length:
+                raise StorageException(
+                    "expected {0} bytes at offset {1}, got {2}".format(
+                        length, offset, len(view)
+                    )
+                )
+            mapped[offset : offset + length] = view
+        finally:
+            view.release()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(_download, range(0, size, part_size)))
+
+
+def download_ranges(
+    path: str,
+    size: int,
+    part_size: int,
+    concurrency: int,
+    read_range: Callable[[int, int], Any],
+    limiter: Optional[AdaptiveLimiter] = None,
+) -> None:
+    """
+    Writes size bytes to path by calling read_range(offset, length) for
+    part_size ranges on a thread pool, as many at once as the limiter
+    allows. Every range is copied straight into a
+    memory map of the preallocated file at its offset. The file is written
+    next to path and only moved into place once every range has arrived.
+    """
+    temporary_path = "{0}.{1}.download".format(path, uuid4().hex)
+    try:
+        with open(temporary_path, "w+b") as outfile:
+            outfile.truncate(size)
+            if size > 0:
+                with mmap(outfile.fileno(), size) as mapped:
+                    _write_ranges(
+                        mapped,
+                        size,
+                        part_size,
+                        concurrency,
+                        read_range,
+                        limiter,
+                    )
+                    mapped.flush()
+        replace(temporary_path, path)
+    except BaseException:
+        if exists(temporary_path):
+            remove(temporary_path)
+        raise
@@ -0,0 +1,290 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+from os import makedirs, remove, replace, walk
+from os.path import (
+    commonpath,
+    dirname,
+    exists,
+    getsize,
+    join,
+    realpath,
+    relpath,
+    sep,
+)
+from threading import BoundedSemaphore, Lock
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from uuid import uuid4
+
+from .client import DEFAULT_CHUNK_SIZE
+from .exception import StorageException, TransferError
+from .log import logger
+from .object import is_dir, name as object_name
+from .storage import Storage
+from .transfer import ByteBudget, MiB
+
+# called with the object name and the number of bytes transferred for it
+ProgressCallback = Callable[[str, int], None]
+
+# a job transfers one object and returns the number of bytes it moved
+_Job = Tuple[str, int, Callable[[], int]]
+
+
+class TransferResult:
+    """
+    TransferResult.
+
+    Outcome of a bulk transfer: the objects that were transferred, the total
+    number of bytes moved and the error of every object that failed.
+    """
+
+    def __init__(self) -> None:
+        self.transferred: List[str] = []
+        self.failed: Dict[str, BaseException] = {}
+        self.bytes_transferred = 0
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+    def raise_for_errors(self) -> None:
+        if self.failed:
+            raise TransferError(self.failed)
+
+
+class TransferManager:
+    """
+    TransferManager.
+
+    Moves many objects between the local file system and a bucket on a
+    thread pool. No more than max_bytes_in_flight bytes of file contents are
+    held in memory at once; large uploads stream through the multipart engine
+    and only count their part buffers against the budget. Every other
+    transfer is a single request that waits for the bucket's adaptive
+    limiter, so no more than it allows are sent at once.
+    """
+
+    def __init__(
+        self,
+        storage: Storage,
+        concurrency: int = 16,
+        max_bytes_in_flight: int = 256 * MiB,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> None:
+        if concurrency <= 0 or max_bytes_in_flight <= 0 or chunk_size <= 0:
+            raise StorageException(
+                "concurrency, max_bytes_in_flight and chunk_size must be"
+                " positive"
+            )
+        self._storage = storage
+        self._concurrency = concurrency
+        self._max_bytes_in_flight = max_bytes_in_flight
+        self._chunk_size = chunk_size
+
+    def upload_many(
+        self,
+        bucket_name: str,
+        files: Iterable[Tuple[str, str]],
+        progress: Optional[ProgressCallback] = None,
+    ) -> TransferResult:
+        """
+        Uploads (path, object name) pairs.
+        """
+        self._check_bucket(bucket_name)
+        return self._run(
+            (
+                self._upload_job(bucket_name, path, name)
+                for path, name in files
+            ),
+            progress,
+        )
+
+    def download_many(
+        self,
+        bucket_name: str,
+        objects: Iterable[Tuple[str, str]],
+        progress: Optional[ProgressCallback] = None,
+    ) -> TransferResult:
+        """
+        Downloads (object name, path) pairs, creating missing directories.
+        """
+        self._check_bucket(bucket_name)
+        return self._run(
+            (
+                self._download_job(bucket_name, name, path)
+                for name, path in objects
+            ),
+            progress,
+        )
+
+    def upload_directory(
+        self,
+        directory: str,
+        bucket_name: str,
+        prefix: str = "",
+        progress: Optional[ProgressCallback] = None,
+    ) -> TransferResult:
+        """
+        Uploads every file below directory to prefix, keeping the relative
+        paths as the rest of the object names.
+        """
+        return self.upload_many(
+            bucket_name, _walk_files(directory, prefix), progress
+        )
+
+    def download_directory(
+        self,
+        bucket_name: str,
+        prefix: str,
+        directory: str,
+        progress: Optional[ProgressCallback] = None,
+    ) -> TransferResult:
+        """
+        Downloads every object below prefix into directory, keeping the rest
+        of the object names as relative paths. Objects whose names would
+        resolve outside of directory, e.g. through "..", fail instead.
+        """
+        self._check_bucket(bucket_name)
+        root = realpath(directory)
+        return self._run(
+            (
+                self._directory_job(
+                    bucket_name, name, root, name[len(prefix) :]
+                )
+                for name in self._list_names(bucket_name, prefix)
+            ),
+            progress,
+        )
+
+    def _check_bucket(self, bucket_name: str) -> None:
+        if not self._storage.bucket_exists(bucket_name):
+            raise StorageException(
+                "bucket {0} does not exist".format(bucket_name)
+            )
+
+    def _list_names(self, bucket_name: str, prefix: str) -> Iterator[str]:
+        # S3 lists one level at a time, so descend into directory entries
+        prefixes = [prefix]
+        while prefixes:
+            for obj in self._storage.list_objects(
+                bucket_name, prefixes.pop(), compact=True
+            ):
+                if is_dir(obj):
+                    prefixes.append(object_name(obj))
+                else:
+                    yield object_name(obj)
+
+    def _upload_job(self, bucket_name: str, path: str, name: str) -> _Job:
+        try:
+            size = getsize(path)
+        except OSError as err:
+            return name, 0, partial(_raise, err)
+        # large files stream through the multipart engine, whose part
+        # buffers are bounded by the transfer configuration
+        transfer_config = self._storage._client._transfer_config
+        streamed = transfer_config.use_multipart(size)
+
+        def _upload() -> int:
+            with open(path, "rb") as infile:
+                data = infile if streamed else BytesIO(infile.read())
+                self._storage.put_object(bucket_name, name, data, size)
+            return size
+
+        if streamed:
+            # the parts wait for the limiter on their own
+            return name, min(size, transfer_config.max_memory), _upload
+        return name, size, self._limited(bucket_name, name, _upload)
+
+    def _directory_job(
+        self, bucket_name: str, name: str, directory: str, relative: str
+    ) -> _Job:
+        path = realpath(join(directory, *relative.split("/")))
+        if path == directory or commonpath((directory, path)) != directory:
+            err = StorageException(
+                "object {0} would be written outside of {1}".format(
+                    name, directory
+                )
+            )
+            return name, 0, partial(_raise, err)
+        return self._download_job(bucket_name, name, path)
+
+    def _download_job(self, bucket_name: str, name: str, path: str) -> _Job:
+        def _download() -> int:
+            directory = dirname(path)
+            if directory:
+                makedirs(directory, exist_ok=True)
+            temporary_path = "{0}.{1}.download".format(path, uuid4().hex)
+            transferred = 0
+            try:
+                with open(temporary_path, "wb") as outfile:
+                    for chunk in self._storage.iter_object(
+                        bucket_name, name, self._chunk_size
+                    ):
+                        outfile.write(chunk)
+                        transferred += len(chunk)
+                replace(temporary_path, path)
+            except BaseException:
+                if exists(temporary_path):
+                    remove(temporary_path)
+                raise
+            return transferred
+
+        # a streaming download holds at most one chunk in memory
+        return (
+            name,
+            self._chunk_size,
+            self._limited(bucket_name, name, _download),
+        )
+
+    def _limited(
+        self, bucket_name: str, name: str, job: Callable[[], int]
+    ) -> Callable[[], int]:
+        return partial(
+            self._storage._client._limiter(bucket_name, name).call, job
+        )
+
+    def _run(
+        self,
+        jobs: Iterable[_Job],
+        progress: Optional[ProgressCallback],
+    ) -> TransferResult:
+        result = TransferResult()
+        lock = Lock()
+        budget = ByteBudget(self._max_bytes_in_flight)
+        # bounds queued jobs as well as bytes, for trees of tiny files
+        slots = BoundedSemaphore(2 * self._concurrency)
+
+        def _transfer(name: str, cost: int, job: Callable[[], int]) -> None:
+            try:
+                transferred = job()
+            except Exception as err:  # pylint: disable=broad-except
+                logger.debug("transfer of %s failed: %s", name, err)
+                with lock:
+                    result.failed[name] = err
+                return
+            finally:
+                budget.release(cost)
+                slots.release()
+            with lock:
+                result.transferred.append(name)
+                result.bytes_transferred += transferred
+            if progress is not None:
+                progress(name, transferred)
+
+        with ThreadPoolExecutor(max_workers=self._concurrency) as executor:
+            for job_name, cost, job in jobs:
+                slots.acquire()
+                budget.acquire(cost)
+                executor.submit(_transfer, job_name, cost, job)
+        return result
+
+
+def _raise(err: BaseException) -> int:
+    raise err
+
+
+def _walk_files(directory: str, prefix: str) -> Iterator[Tuple[str, str]]:
+    for root, _, filenames in walk(directory):
+        for filename in sorted(filenames):
+            path = join(root, filename)
+            yield path, prefix + relpath(path, directory).replace(sep, "/")
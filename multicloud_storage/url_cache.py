@@ -0,0 +1,63 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from time import time
+from typing import Callable, Hashable, Optional, Tuple
+
+
+class SignedUrlCache:
+    """
+    SignedUrlCache.
+
+    Signs URLs as of the start of the current window instead of the current
+    time, so every request for the same object within a window gets the same
+    URL and CDN and browser caches keep hitting. The window is capped at half
+    of the expiry, so a URL handed out is always valid for at least half of
+    the requested time. Signed URLs are kept for reuse, the least recently
+    used ones dropped beyond max_entries. A window of zero disables both.
+    """
+
+    def __init__(self, window: float = 0.0, max_entries: int = 10000) -> None:
+        self.window = window
+        self.max_entries = max_entries
+        self._urls: "OrderedDict[Tuple, str]" = OrderedDict()
+        self._lock = Lock()
+
+    def sign(
+        self,
+        key: Tuple[Hashable, ...],
+        expires: timedelta,
+        sign: Callable[[datetime], str],
+    ) -> str:
+        """
+        Returns the URL for key, calling sign(signing_time) only when it was
+        not already signed in the current window.
+        """
+        signed_at = self._signing_time(expires)
+        if signed_at is None:
+            return sign(datetime.now(timezone.utc))
+        key = key + (signed_at,)
+        with self._lock:
+            url = self._urls.get(key)
+            if url is not None:
+                self._urls.move_to_end(key)
+                return url
+        url = sign(signed_at)
+        with self._lock:
+            self._urls[key] = url
+            while len(self._urls) > self.max_entries:
+                self._urls.popitem(last=False)
+        return url
+
+    def clear(self) -> None:
+        with self._lock:
+            self._urls.clear()
+
+    def _signing_time(self, expires: timedelta) -> Optional[datetime]:
+        window = min(self.window, expires.total_seconds() / 2)
+        if window <= 0 or self.max_entries <= 0:
+            return None
+        now = time()
+        return datetime.fromtimestamp(
+            int(now - now % window), timezone.utc
+        )
@@ -0,0 +1,132 @@
+import unittest
+
+from multicloud_storage.minio import (
+    MAX_COPY_PART_SIZE,
+    MIN_PART_SIZE,
+    _plan_concat,
+)
+
+MiB = 1024 * 1024
+
+
+class PlanConcatTest(unittest.TestCase):
+    """
+    Splitting S3 concatenations into multipart upload parts, checked without
+    a backend.
+    """
+
+    def assertCovers(self, sources, parts):
+        """
+        Asserts the parts cover the sources in order, without gaps, and that
+        every part but the last meets the part minimum.
+        """
+        ranges = [r for part in parts for r in part.ranges]
+        covered = {}
+        for obj, offset, length in ranges:
+            self.assertGreater(length, 0)
+            self.assertEqual(covered.get(obj, 0), offset)
+            covered[obj] = offset + length
+        self.assertEqual(
+            [(obj, size) for obj, size in sources if size > 0],
+            list(covered.items()),
+        )
+        for part in parts[:-1]:
+            self.assertGreaterEqual(
+                sum(length for _, _, length in part.ranges), MIN_PART_SIZE
+            )
+        for part in parts:
+            if part.copy:
+                self.assertEqual(1, len(part.ranges))
+                self.assertLessEqual(part.ranges[0][2], MAX_COPY_PART_SIZE)
+
+    def test_all_small(self):
+        """
+        Asserts small sources are assembled into parts of the part minimum.
+        """
+        sources = [("shard{0}".format(i), 4 * MiB) for i in range(100)]
+        parts = _plan_concat(sources)
+        self.assertCovers(sources, parts)
+        self.assertFalse(any(part.copy for part in parts))
+        self.assertEqual(80, len(parts))
+
+    def test_all_large(self):
+        """
+        Asserts large sources are copied whole, one part each.
+        """
+        sources = [("a", 6 * MiB), ("b", 8 * MiB), ("c", 5 * MiB)]
+        parts = _plan_concat(sources)
+        self.assertCovers(sources, parts)
+        self.assertEqual(
+            [(True, [(obj, 0, size)]) for obj, size in sources], parts
+        )
+
+    def test_large_first(self):
+        """
+        Asserts a large first source is copied and a small tail uploaded.
+        """
+        sources = [("large", 8 * MiB), ("small", 1024)]
+        parts = _plan_concat(sources)
+        self.assertCovers(sources, parts)
+        self.assertEqual(
+            [(True, [("large", 0, 8 * MiB)]), (False, [("small", 0, 1024)])],
+            parts,
+        )
+
+    def test_large_last(self):
+        """
+        Asserts a small head is topped up from a large last source, whose
+        rest is copied.
+        """
+        sources = [("small", 1024), ("large", 12 * MiB)]
+        parts = _plan_concat(sources)
+        self.assertCovers(sources, parts)
+        top_up = MIN_PART_SIZE - 1024
+        self.assertEqual(
+            [
+                (False, [("small", 0, 1024), ("large", 0, top_up)]),
+                (True, [("large", top_up, 12 * MiB - top_up)]),
+            ],
+            parts,
+        )
+
+    def test_large_between_small(self):
+        """
+        Asserts a large source still leaving the part minimum after topping
+        up its predecessor is copied.
+        """
+        sources = [("head", 1024), ("large", 12 * MiB), ("tail", 1024)]
+        parts = _plan_concat(sources)
+        self.assertCovers(sources, parts)
+        self.assertTrue(any(part.copy for part in parts))
+
+    def test_single_source(self):
+        """
+        Asserts a single source makes a single part.
+        """
+        self.assertEqual(
+            [(False, [("small", 0, 1024)])], _plan_concat([("small", 1024)])
+        )
+        self.assertEqual(
+            [(True, [("large", 0, 6 * MiB)])],
+            _plan_concat([("large", 6 * MiB)]),
+        )
+        self.assertEqual([], _plan_concat([("empty", 0)]))
+
+    def test_small_tail(self):
+        """
+        Asserts a large source leaves at least the part minimum to its last
+        copied part, and the tail below it is uploaded last.
+        """
+        size = MAX_COPY_PART_SIZE + MiB
+        sources = [("large", size), ("tail", 1024)]
+        parts = _plan_concat(sources)
+        self.assertCovers(sources, parts)
+        self.assertEqual(
+            [
+                (True, [("large", 0, size - MIN_PART_SIZE)]),
+                (True, [("large", size - MIN_PART_SIZE, MIN_PART_SIZE)]),
+                (False, [("tail", 0, 1024)]),
+            ],
+            parts,
+        )
+
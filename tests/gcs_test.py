@@ -1,15 +1,35 @@
-from datetime import datetime
-from multicloud_storage.object import last_modified, name
+from datetime import datetime, timedelta
+from multicloud_storage.object import ObjectInfo, last_modified, name
+import asyncio
 import random
 import string
 import unittest
+from unittest import mock
 from hashlib import md5
 from io import BytesIO
 from json import dumps, loads
 from os import SEEK_END
+from os import makedirs
+from os.path import join
+from tempfile import TemporaryDirectory
 from typing import Tuple
 
-from multicloud_storage import GCS, Storage, StorageException
+from google.api_core.exceptions import InternalServerError
+from google.cloud.storage import Blob
+
+from multicloud_storage import (
+    AsyncStorage,
+    DiskCache,
+    MemoryCache,
+    Metrics,
+    PoolConfig,
+    RetryPolicy,
+    GCS,
+    Storage,
+    StorageException,
+    TransferConfig,
+    TransferManager,
+)
 from multicloud_storage.http import HttpMethod
 
 
@@ -48,7 +68,7 @@ class GCSTest(unittest.TestCase):
     @classmethod
     def tearDownClass(cls):
         try:
-            cls.storage.remove_bucket(cls.bucket_name)
+            cls.storage.remove_bucket(cls.bucket_name, force=True)
         except:  # pylint: disable=bare-except
             pass
 
@@ -92,6 +112,19 @@ class GCSTest(unittest.TestCase):
         self.assertTrue(self.storage.bucket_exists(self.temp_bucket_name))
         self.storage.remove_bucket(self.temp_bucket_name)
 
+    def test_bucket_exists_cache(self):
+        """
+        Asserts the bucket cache is shared and invalidated.
+        """
+        other = Storage(self.gcs)
+        self.storage.make_bucket(self.temp_bucket_name)
+        self.assertTrue(other.bucket_exists(self.temp_bucket_name))
+        other.remove_bucket(self.temp_bucket_name)
+        self.assertFalse(self.storage.bucket_exists(self.temp_bucket_name))
+        uncached = GCS(bucket_cache_ttl=0)
+        Storage(uncached).bucket_exists(self.bucket_name)
+        self.assertFalse(uncached._bucket_cache.exists(self.bucket_name))
+
     def test_make_bucket(self):
         """
         Asserts buckets can be made.
@@ -109,6 +142,48 @@ class GCSTest(unittest.TestCase):
             self.storage.make_bucket(self.bucket_name)
         self.storage.remove_bucket(self.bucket_name)
 
+    def test_remove_bucket_force(self):
+        """
+        Asserts non-empty buckets can be removed when forced.
+        """
+        self.storage.make_bucket(self.temp_bucket_name)
+        for object_name in ("a/" + random_str(), random_str()):
+            data, size = str_buffer(self.object_data)
+            self.storage.put_object(
+                self.temp_bucket_name, object_name, data, size
+            )
+        self.assertRaises(
+            StorageException,
+            self.storage.remove_bucket,
+            self.temp_bucket_name,
+        )
+        self.storage.remove_bucket(self.temp_bucket_name, force=True)
+        self.assertFalse(self.storage.bucket_exists(self.temp_bucket_name))
+
+    def test_delete_prefix(self):
+        """
+        Asserts every object under a prefix can be deleted.
+        """
+        prefix = random_str() + "/"
+        names = [prefix + random_str() for _ in range(3)]
+        names.append(prefix + "nested/" + random_str())
+        for object_name in names:
+            data, size = str_buffer(self.object_data)
+            self.storage.put_object(self.bucket_name, object_name, data, size)
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        errors = self.storage.delete_prefix(
+            self.bucket_name, prefix, concurrency=2
+        )
+        self.assertEqual({}, errors)
+        for object_name in names:
+            self.assertFalse(
+                self.storage.object_exists(self.bucket_name, object_name)
+            )
+        self.assertTrue(
+            self.storage.object_exists(self.bucket_name, self.object_name)
+        )
+
     def test_delete_object(self):
         """
         Asserts objects can be deleted.
@@ -123,6 +198,23 @@ class GCSTest(unittest.TestCase):
             self.storage.object_exists(self.bucket_name, self.object_name)
         )
 
+    def test_delete_objects(self):
+        """
+        Asserts objects can be deleted in batches.
+        """
+        names = [random_str() for _ in range(3)]
+        for object_name in names:
+            data, size = str_buffer(self.object_data)
+            self.storage.put_object(self.bucket_name, object_name, data, size)
+        errors = self.storage.delete_objects(
+            self.bucket_name, names + [random_str()]
+        )
+        self.assertEqual({}, errors)
+        for object_name in names:
+            self.assertFalse(
+                self.storage.object_exists(self.bucket_name, object_name)
+            )
+
     def test_put_object(self):
         """
         Asserts objects can be written.
@@ -133,6 +225,65 @@ class GCSTest(unittest.TestCase):
             self.storage.object_exists(self.bucket_name, self.object_name)
         )
 
+    def test_multipart_put_object(self):
+        """
+        Asserts large objects are uploaded in parallel parts.
+        """
+        storage = Storage(
+            GCS(
+                transfer_config=TransferConfig(
+                    threshold=1, part_size=5 * 1024 * 1024, concurrency=2
+                )
+            )
+        )
+        payload = bytes(random.getrandbits(8) for _ in range(1024)) * 11264
+        storage.put_object(
+            self.bucket_name, self.object_name, BytesIO(payload), len(payload)
+        )
+        data = storage.get_object(self.bucket_name, self.object_name)
+        self.assertEqual(payload, data.read())
+        self.assertEqual(
+            md5(payload).hexdigest(),
+            storage.md5_checksum(self.bucket_name, self.object_name),
+        )
+
+    def test_retry_failed_part(self):
+        """
+        Asserts a part failing with a server error is uploaded again without
+        restarting the whole upload.
+        """
+        storage = Storage(
+            GCS(
+                transfer_config=TransferConfig(
+                    threshold=1, part_size=5 * 1024 * 1024, concurrency=2
+                ),
+                retry_policy=RetryPolicy(base_delay=0.0),
+            )
+        )
+        payload = bytes(random.getrandbits(8) for _ in range(1024)) * 11264
+        upload = Blob.upload_from_string
+        failed = []
+
+        def _fail_once(blob, *args, **kwargs):
+            if not failed:
+                failed.append(blob.name)
+                raise InternalServerError("internal error")
+            return upload(blob, *args, **kwargs)
+
+        with mock.patch.object(
+            Blob, "upload_from_string", autospec=True, side_effect=_fail_once
+        ) as patched:
+            storage.put_object(
+                self.bucket_name,
+                self.object_name,
+                BytesIO(payload),
+                len(payload),
+            )
+        self.assertEqual(1, len(failed))
+        self.assertEqual(4, patched.call_count)
+        data = storage.get_object(self.bucket_name, self.object_name)
+        self.assertEqual(payload, data.read())
+
     def test_object_exists(self):
         """
         Asserts object existence can be determined.
@@ -187,6 +338,110 @@ class GCSTest(unittest.TestCase):
         data = self.storage.get_object(self.bucket_name, self.object_name)
         self.assertEqual(self.object_data, loads(data.read().decode("utf-8")))
 
+    def test_get_object_range(self):
+        """
+        Asserts a byte range of an object can be retrieved.
+        """
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        expected = dumps(self.object_data).encode()
+        part = self.storage.get_object_range(
+            self.bucket_name, self.object_name, 2, 4
+        )
+        self.assertEqual(expected[2:6], part.read())
+        tail = self.storage.get_object_range(
+            self.bucket_name, self.object_name, 2
+        )
+        self.assertEqual(expected[2:], tail.read())
+        self.assertRaises(
+            StorageException,
+            self.storage.get_object_range,
+            self.bucket_name,
+            self.object_name,
+            0,
+            0,
+        )
+
+    def test_download_to_path(self):
+        """
+        Asserts an object can be downloaded to a file in parallel ranges.
+        """
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        with TemporaryDirectory() as directory:
+            path = join(directory, self.object_name)
+            self.storage.download_to_path(
+                self.bucket_name,
+                self.object_name,
+                path,
+                concurrency=2,
+                part_size=3,
+            )
+            with open(path, "rb") as downloaded:
+                data.seek(0)
+                self.assertEqual(data.read(), downloaded.read())
+
+    def test_open_object(self):
+        """
+        Asserts an object can be read through a file-like reader.
+        """
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        with self.storage.open_object(
+            self.bucket_name, self.object_name
+        ) as reader:
+            self.assertEqual(
+                self.object_data, loads(reader.read().decode("utf-8"))
+            )
+
+    def test_iter_object(self):
+        """
+        Asserts an object can be streamed in chunks.
+        """
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        chunks = list(
+            self.storage.iter_object(
+                self.bucket_name, self.object_name, chunk_size=4
+            )
+        )
+        self.assertGreater(len(chunks), 1)
+        data.seek(0)
+        self.assertEqual(b"".join(chunks), data.read())
+
+    def test_missing_object(self):
+        """
+        Asserts reads of a missing object raise a StorageException, with
+        and without the pre-flight existence checks.
+        """
+        missing_name = random_str()
+        for optimistic in ("false", "true"):
+            with mock.patch.dict(
+                "os.environ", {"STORAGE_OPTIMISTIC": optimistic}
+            ):
+                storage = Storage(GCS())
+            self.assertEqual(optimistic == "true", storage._client._optimistic)
+            self.assertRaises(
+                StorageException,
+                storage.get_object,
+                self.bucket_name,
+                missing_name,
+            )
+            self.assertRaises(
+                StorageException,
+                storage.md5_checksum,
+                self.bucket_name,
+                missing_name,
+            )
+            self.assertRaises(
+                StorageException,
+                storage.copy_object,
+                self.bucket_name,
+                missing_name,
+                self.bucket_name,
+                random_str(),
+            )
+
     def test_copy_object(self):
         """
         Asserts an object can be copied from one place to another.
@@ -274,3 +529,323 @@ class GCSTest(unittest.TestCase):
             data.read().decode("utf-8"),
             dumps(self.object_data) + dumps(self.object_data),
         )
+
+    def test_concat_many_objects(self):
+        """
+        Asserts more than 32 objects can be concatenated.
+        """
+        source_names = [random_str() for _ in range(40)]
+        for index, source_name in enumerate(source_names):
+            data, size = str_buffer(index)
+            self.storage.put_object(self.bucket_name, source_name, data, size)
+        self.storage.concat_objects(
+            self.bucket_name, self.object_name, source_names
+        )
+        for source_name in source_names:
+            self.storage.delete_object(self.bucket_name, source_name)
+        data = self.storage.get_object(self.bucket_name, self.object_name)
+        self.assertEqual(
+            "".join(str(index) for index in range(40)),
+            data.read().decode("utf-8"),
+        )
+        self.assertEqual(
+            [self.object_name],
+            [name(obj) for obj in self.storage.list_objects(self.bucket_name)],
+        )
+
+    def test_async_storage(self):
+        """
+        Asserts objects can be written and read through the asyncio facade.
+        """
+        names = [random_str() for _ in range(5)]
+
+        async def _roundtrip():
+            async with AsyncStorage(self.storage, max_concurrency=2) as aio:
+                await aio.put_many(
+                    self.bucket_name,
+                    {name: str_buffer(name)[0] for name in names},
+                )
+                objects = await aio.get_many(self.bucket_name, names)
+                await aio.delete_objects(self.bucket_name, names)
+                return objects
+
+        objects = asyncio.run(_roundtrip())
+        self.assertEqual(
+            names, [loads(data.read().decode("utf-8")) for data in objects]
+        )
+
+    def test_transfer_manager(self):
+        """
+        Asserts directories can be uploaded to and downloaded from a prefix.
+        """
+        prefix = random_str() + "/"
+        manager = TransferManager(self.storage, concurrency=2)
+        progress = []
+        with TemporaryDirectory() as source, TemporaryDirectory() as target:
+            makedirs(join(source, "nested"))
+            for path in ("first", join("nested", "second")):
+                with open(join(source, path), "w") as outfile:
+                    outfile.write(dumps(self.object_data))
+            result = manager.upload_directory(
+                source,
+                self.bucket_name,
+                prefix,
+                progress=lambda name, size: progress.append(name),
+            )
+            result.raise_for_errors()
+            self.assertEqual(
+                sorted([prefix + "first", prefix + "nested/second"]),
+                sorted(progress),
+            )
+            result = manager.download_directory(
+                self.bucket_name, prefix, target
+            )
+            result.raise_for_errors()
+            with open(join(target, "nested", "second")) as infile:
+                self.assertEqual(self.object_data, loads(infile.read()))
+        self.storage.delete_prefix(self.bucket_name, prefix)
+
+    def test_list_objects_page(self):
+        """
+        Asserts listings can be paged, resumed and rolled up by delimiter.
+        """
+        prefix = random_str() + "/"
+        names = [prefix + "{0:02d}".format(i) for i in range(5)]
+        for object_name in names + [prefix + "dir/nested"]:
+            data, size = str_buffer(self.object_data)
+            self.storage.put_object(self.bucket_name, object_name, data, size)
+        listed = []
+        page_token = None
+        while True:
+            page = self.storage.list_objects_page(
+                self.bucket_name,
+                prefix,
+                page_token=page_token,
+                max_keys=2,
+                delimiter="/",
+            )
+            listed.extend(name(obj) for obj in page.objects)
+            self.assertLessEqual(len(page.objects) + len(page.prefixes), 2)
+            if page.prefixes:
+                self.assertEqual([prefix + "dir/"], page.prefixes)
+            page_token = page.next_token
+            if page_token is None:
+                break
+        self.assertEqual(names, listed)
+        page = self.storage.list_objects_page(
+            self.bucket_name, prefix, start_after=names[2]
+        )
+        self.assertEqual(
+            names[3:] + [prefix + "dir/nested"],
+            [name(obj) for obj in page.objects],
+        )
+        self.assertIsNone(page.next_token)
+        self.storage.delete_prefix(self.bucket_name, prefix)
+
+    def test_list_objects_compact(self):
+        """
+        Asserts compact listings return ObjectInfo records.
+        """
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        objects = [
+            obj
+            for obj in self.storage.list_objects(
+                self.bucket_name, self.object_name, compact=True
+            )
+            if name(obj) == self.object_name
+        ]
+        self.assertEqual(1, len(objects))
+        self.assertIsInstance(objects[0], ObjectInfo)
+        self.assertEqual(size, objects[0].size)
+        self.assertIsNotNone(objects[0].etag)
+        self.assertIsNotNone(last_modified(objects[0]))
+
+    def test_disk_cache(self):
+        """
+        Asserts cached reads are revalidated and dropped on overwrite.
+        """
+        with TemporaryDirectory() as directory:
+            storage = Storage(
+                self.gcs, DiskCache(directory, 1024 * 1024, revalidate=True)
+            )
+            data, size = str_buffer(self.object_data)
+            storage.put_object(self.bucket_name, self.object_name, data, size)
+            for _ in range(2):
+                result = storage.get_object(self.bucket_name, self.object_name)
+                self.assertEqual(self.object_data, loads(result.read()))
+                result.close()
+            data, size = str_buffer({"other": "data"})
+            storage.put_object(self.bucket_name, self.object_name, data, size)
+            result = storage.get_object(self.bucket_name, self.object_name)
+            self.assertEqual({"other": "data"}, loads(result.read()))
+            result.close()
+            data, size = str_buffer(self.object_data)
+            self.storage.put_object(
+                self.bucket_name, self.object_name, data, size
+            )
+            result = storage.get_object(self.bucket_name, self.object_name)
+            self.assertEqual(self.object_data, loads(result.read()))
+            result.close()
+
+            # composite objects have no md5 hash but still a generation
+            second_object_name = random_str()
+            data.seek(0)
+            storage.put_object(
+                self.bucket_name, second_object_name, data, size
+            )
+            storage.concat_objects(
+                self.bucket_name,
+                self.object_name,
+                [self.object_name, second_object_name],
+            )
+            for _ in range(2):
+                result = storage.get_object(self.bucket_name, self.object_name)
+                self.assertEqual(
+                    dumps(self.object_data) * 2, result.read().decode()
+                )
+                result.close()
+            storage.delete_object(self.bucket_name, second_object_name)
+
+    def test_memory_cache(self):
+        """
+        Asserts cached reads are dropped by writes through the same storage.
+        """
+        storage = Storage(self.gcs, memory_cache=MemoryCache(1024, 60.0))
+        data, size = str_buffer(self.object_data)
+        storage.put_object(self.bucket_name, self.object_name, data, size)
+        for _ in range(2):
+            result = storage.get_object(self.bucket_name, self.object_name)
+            self.assertEqual(self.object_data, loads(result.read()))
+        data, size = str_buffer({"other": "data"})
+        storage.put_object(self.bucket_name, self.object_name, data, size)
+        result = storage.get_object(self.bucket_name, self.object_name)
+        self.assertEqual({"other": "data"}, loads(result.read()))
+        storage.delete_object(self.bucket_name, self.object_name)
+        with self.assertRaises(StorageException):
+            storage.get_object(self.bucket_name, self.object_name)
+
+    def test_get_presigned_urls(self):
+        """
+        Asserts presigned urls can be generated in batches.
+        """
+        names = [random_str() for _ in range(3)]
+        hostname = random_str()
+        urls = self.storage.get_presigned_urls(
+            self.bucket_name,
+            names,
+            method=HttpMethod.GET,
+            use_hostname=hostname,
+        )
+        self.assertEqual(names, list(urls))
+        for object_name, url in urls.items():
+            self.assertIn(hostname, url)
+            self.assertIn(object_name, url)
+        self.assertRaises(
+            StorageException,
+            self.storage.get_presigned_urls,
+            self.bucket_name,
+            names,
+            method=HttpMethod.GET,
+            verify=True,
+        )
+
+    def test_signed_url_window(self):
+        """
+        Asserts urls signed within one window are identical.
+        """
+        storage = Storage(GCS(signed_url_window=3600.0))
+        data, size = str_buffer(self.object_data)
+        storage.put_object(self.bucket_name, self.object_name, data, size)
+        urls = [
+            storage.get_presigned_url(
+                self.bucket_name,
+                self.object_name,
+                method=HttpMethod.GET,
+                expires=timedelta(days=1),
+            )
+            for _ in range(2)
+        ]
+        self.assertEqual(urls[0], urls[1])
+
+    def test_metrics(self):
+        """
+        Asserts operations, bytes, errors and backend requests are recorded.
+        """
+        metrics = Metrics()
+        storage = Storage(GCS(), observer=metrics)
+        data, size = str_buffer(self.object_data)
+        storage.put_object(self.bucket_name, self.object_name, data, size)
+        storage.get_object(self.bucket_name, self.object_name)
+        with self.assertRaises(StorageException):
+            storage.get_object(self.bucket_name, random_str())
+        text = metrics.render()
+        self.assertIn(
+            'storage_bytes_total{{backend="GCS",operation="get_object",'
+            'direction="read"}} {0}'.format(size),
+            text,
+        )
+        self.assertIn(
+            'storage_operation_errors_total{backend="GCS",'
+            'operation="get_object",code="NotFound"} 1',
+            text,
+        )
+        self.assertIn(
+            'storage_operation_duration_seconds_count{backend="GCS",'
+            'operation="get_object"} 2',
+            text,
+        )
+        self.assertIn(
+            'storage_request_duration_seconds_count{backend="GCS"',
+            text,
+        )
+
+    def test_retry_policy(self):
+        """
+        Asserts errors that cannot go away are not retried.
+        """
+        metrics = Metrics()
+        storage = Storage(
+            GCS(retry_policy=RetryPolicy(base_delay=0.0)), observer=metrics
+        )
+        with self.assertRaises(StorageException):
+            storage.get_object(self.bucket_name, random_str())
+        with self.assertRaises(StorageException):
+            storage.make_bucket(self.bucket_name)
+        self.assertNotIn("storage_retries_total{", metrics.render())
+
+    def test_pool_config(self):
+        """
+        Asserts the session's connection pool is sized to the client's
+        concurrency and uses the configured timeouts.
+        """
+        client = GCS(transfer_config=TransferConfig(max_concurrency=16))
+        Storage(client)
+        adapter = client._gcs_client._http.get_adapter("https://")
+        self.assertEqual(16, adapter._pool_maxsize)
+
+        client = GCS(pool_config=PoolConfig(max_size=4, read_timeout=5.0))
+        storage = Storage(client)
+        adapter = client._gcs_client._http.get_adapter("https://")
+        self.assertEqual(4, adapter._pool_maxsize)
+        self.assertTrue(storage.bucket_exists(self.bucket_name))
+
+    def test_presigned_urls_without_pool(self):
+        """
+        Asserts urls are signed without a thread pool, and a single url is
+        verified on the calling thread.
+        """
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        with mock.patch(
+            "multicloud_storage.client.ThreadPoolExecutor"
+        ) as executor:
+            self.storage.get_presigned_urls(
+                self.bucket_name,
+                [random_str() for _ in range(3)],
+                method=HttpMethod.GET,
+            )
+            self.storage.get_presigned_url(
+                self.bucket_name, self.object_name, method=HttpMethod.GET
+            )
+            executor.assert_not_called()
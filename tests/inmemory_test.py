@@ -0,0 +1,571 @@
+import asyncio
+import unittest
+from unittest import mock
+from io import BufferedReader, BytesIO, RawIOBase
+from json import loads
+from os.path import exists, join
+from threading import Event, Thread
+from tempfile import TemporaryDirectory
+from time import monotonic
+from typing import Iterator, List
+
+from multicloud_storage import (
+    AdaptiveLimiter,
+    AsyncStorage,
+    DiskCache,
+    InMemory,
+    MemoryCache,
+    Metrics,
+    RetryBudget,
+    RetryPolicy,
+    Storage,
+    StorageException,
+    StorageObserver,
+    TransferConfig,
+    TransferManager,
+)
+from multicloud_storage.http import HttpMethod
+from multicloud_storage.object import ObjectInfo
+from tests.storage_suite import StorageSuite, random_str, str_buffer
+
+
+def iter_stream(content: bytes) -> BufferedReader:
+    """
+    Returns a stream over content that cannot seek.
+    """
+    return BufferedReader(_Unseekable(content))
+
+
+class _Unseekable(RawIOBase):
+    def __init__(self, content: bytes) -> None:
+        self._data = BytesIO(content)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        return self._data.readinto(buffer)
+
+
+class _Unversioned(InMemory):
+    """
+    Has objects without an etag or md5 checksum, like composite GCS
+    objects.
+    """
+
+    def stat_object(self, bucket_name: str, name: str) -> ObjectInfo:
+        return super().stat_object(bucket_name, name)._replace(etag=None)
+
+    def md5_checksum(self, bucket_name: str, name: str) -> str:
+        raise StorageException("object {0} has no md5 checksum".format(name))
+
+
+class _Paused(InMemory):
+    """
+    Holds the first get_object or iter_object after it read the object until
+    resumed.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.fetched = Event()
+        self.resume = Event()
+
+    def _pause(self) -> None:
+        if not self.fetched.is_set():
+            self.fetched.set()
+            self.resume.wait(5)
+
+    def get_object(self, bucket_name: str, name: str) -> BytesIO:
+        result = super().get_object(bucket_name, name)
+        self._pause()
+        return result
+
+    def iter_object(
+        self, bucket_name: str, name: str, chunk_size: int = 1024
+    ) -> Iterator[bytes]:
+        result = super().iter_object(bucket_name, name, chunk_size)
+        self._pause()
+        return result
+
+
+class _Tracked(InMemory):
+    """
+    Records whether the last chunk iterator was closed. It keeps a
+    reference to the iterator so only an explicit close can close it.
+    """
+
+    closed = False
+    chunks = None
+
+    def iter_object(
+        self, bucket_name: str, name: str, chunk_size: int = 1
+    ) -> Iterator[bytes]:
+        chunks = super().iter_object(bucket_name, name, chunk_size)
+        self.closed = False
+
+        def _chunks() -> Iterator[bytes]:
+            try:
+                yield from chunks
+            finally:
+                self.closed = True
+
+        self.chunks = _chunks()
+        return self.chunks
+
+
+class InMemoryTest(StorageSuite, unittest.TestCase):
+    """
+    Runs the storage suite against the InMemory backend, plus its error and
+    latency injection.
+    """
+
+    def make_client(self) -> InMemory:
+        return InMemory()
+
+    def test_presigned_urls_without_requests(self):
+        """
+        Asserts urls are signed without requests unless verified.
+        """
+        requests = sum(self.client.requests.values())
+        self.storage.get_presigned_urls(
+            self.bucket_name,
+            [random_str() for _ in range(3)],
+            method=HttpMethod.GET,
+        )
+        self.assertEqual(requests, sum(self.client.requests.values()))
+
+    def test_injected_errors(self):
+        """
+        Asserts seeded error injection fails a repeatable share of requests.
+        """
+
+        def failures(seed: int) -> List[bool]:
+            memory = InMemory(error_rate=0.5, seed=seed)
+            outcomes = []
+            for _ in range(100):
+                try:
+                    memory.bucket_exists(self.bucket_name)
+                    outcomes.append(False)
+                except StorageException:
+                    outcomes.append(True)
+            self.assertEqual(100, memory.requests["bucket_exists"])
+            return outcomes
+
+        outcomes = failures(1)
+        self.assertEqual(outcomes, failures(1))
+        self.assertTrue(10 < sum(outcomes) < 90)
+
+    def test_injected_latency(self):
+        """
+        Asserts every request waits for the injected latency.
+        """
+        memory = InMemory(latency=0.01)
+        started = monotonic()
+        for _ in range(5):
+            memory.bucket_exists(self.bucket_name)
+        self.assertGreaterEqual(monotonic() - started, 0.05)
+
+    def test_metrics(self):
+        """
+        Asserts operations, bytes, errors and backend requests are recorded.
+        """
+        metrics = Metrics()
+        storage = Storage(InMemory(), observer=metrics)
+        storage.make_bucket(self.bucket_name)
+        data, size = str_buffer(self.object_data)
+        storage.put_object(self.bucket_name, self.object_name, data, size)
+        chunks = storage.iter_object(self.bucket_name, self.object_name)
+        self.assertEqual(self.object_data, loads(b"".join(chunks)))
+        with self.assertRaises(StorageException):
+            storage.get_object(self.bucket_name, random_str())
+        text = metrics.render()
+        for line in (
+            'storage_bytes_total{{backend="InMemory",operation="put_object",'
+            'direction="write"}} {0}'.format(size),
+            'storage_bytes_total{{backend="InMemory",operation="iter_object",'
+            'direction="read"}} {0}'.format(size),
+            'storage_operation_errors_total{backend="InMemory",'
+            'operation="get_object",code="NoSuchKey"} 1',
+            'storage_operation_duration_seconds_count{backend="InMemory",'
+            'operation="put_object"} 1',
+            'storage_request_duration_seconds_count{backend="InMemory",'
+            'method="get_object",status="200"} 1',
+        ):
+            self.assertIn(line, text)
+
+        metrics.clear()
+        storage = Storage(
+            InMemory(
+                error_rate=1.0,
+                retry_policy=RetryPolicy(max_attempts=2, base_delay=0.0),
+            ),
+            observer=metrics,
+        )
+        with self.assertRaises(StorageException):
+            storage.bucket_exists(self.bucket_name)
+        text = metrics.render()
+        for line in (
+            'storage_operation_errors_total{backend="InMemory",'
+            'operation="bucket_exists",code="ServiceUnavailable"} 1',
+            'storage_retries_total{backend="InMemory",'
+            'operation="bucket_exists",code="ServiceUnavailable"} 1',
+            'storage_request_duration_seconds_count{backend="InMemory",'
+            'method="bucket_exists",status="503"} 2',
+        ):
+            self.assertIn(line, text)
+
+    def test_retry_policy(self):
+        """
+        Asserts transient errors are retried only where it is safe and
+        within the retry budget.
+        """
+        memory = InMemory(
+            error_rate=1.0,
+            retry_policy=RetryPolicy(
+                max_attempts=3, base_delay=0.0, budget=RetryBudget()
+            ),
+        )
+        storage = Storage(memory)
+        with self.assertRaises(StorageException):
+            storage.stat_object(self.bucket_name, self.object_name)
+        self.assertEqual(3, memory.requests["stat_object"])
+
+        data, size = str_buffer(self.object_data)
+        with self.assertRaises(StorageException):
+            storage.put_object(self.bucket_name, self.object_name, data, size)
+        self.assertEqual(3, memory.requests["put_object"])
+        with self.assertRaises(StorageException):
+            storage.put_object(
+                self.bucket_name,
+                self.object_name,
+                iter_stream(data.getvalue()),
+                size,
+            )
+        self.assertEqual(4, memory.requests["put_object"])
+
+        with self.assertRaises(StorageException):
+            storage.concat_objects(
+                self.bucket_name, self.object_name, [self.object_name]
+            )
+        self.assertEqual(1, memory.requests["concat_objects"])
+
+        memory.error_rate = 0.0
+        memory.make_bucket(self.bucket_name)
+        memory.error_rate = 1.0
+        with self.assertRaises(StorageException):
+            storage.rename_object(
+                self.bucket_name, self.object_name, random_str()
+            )
+        # the precondition found no source, so the rename was not repeated
+        self.assertEqual(1, memory.requests["rename_object"])
+
+        memory = InMemory(
+            error_rate=1.0,
+            retry_policy=RetryPolicy(
+                base_delay=0.0,
+                budget=RetryBudget(ratio=0.0, min_per_second=0.0),
+            ),
+        )
+        with self.assertRaises(StorageException):
+            Storage(memory).stat_object(self.bucket_name, self.object_name)
+        self.assertEqual(1, memory.requests["stat_object"])
+
+    def test_retry_part(self):
+        """
+        Asserts a failed part of a transfer is retried on its own and
+        reported to the client's observers.
+        """
+        memory = InMemory(
+            retry_policy=RetryPolicy(
+                max_attempts=3, base_delay=0.0, budget=RetryBudget()
+            )
+        )
+        observer = mock.Mock(spec=StorageObserver)
+        memory.add_observer(observer)
+        part = mock.Mock(
+            side_effect=[
+                StorageException("internal error", code="InternalError"),
+                "etag",
+            ]
+        )
+        self.assertEqual("etag", memory._retry_part(part, 1, b"chunk"))
+        part.assert_called_with(1, b"chunk")
+        self.assertEqual(2, part.call_count)
+        observer.on_retry.assert_called_once()
+        self.assertEqual(
+            ("InMemory", "upload_part", 1),
+            observer.on_retry.call_args[0][:3],
+        )
+
+        part = mock.Mock(
+            side_effect=StorageException("no such upload", code="NoSuchUpload")
+        )
+        with self.assertRaises(StorageException):
+            memory._retry_part(part)
+        self.assertEqual(1, part.call_count)
+
+    def test_adaptive_limiter(self):
+        """
+        Asserts the limit grows while it is in use, is cut when requests are
+        throttled and is shared by the requests to a bucket.
+        """
+        limiter = AdaptiveLimiter(initial=1, max_limit=4)
+        self.assertEqual(1, limiter.call(len, "a"))
+        self.assertEqual(2, limiter.limit)
+        # one request at a time does not use the raised limit
+        limiter.call(len, "a")
+        self.assertEqual(2, limiter.limit)
+
+        def _throttled() -> None:
+            raise StorageException("slow down", code="SlowDown")
+
+        with self.assertRaises(StorageException):
+            limiter.call(_throttled)
+        self.assertEqual(1, limiter.limit)
+        self.assertEqual(0, limiter.in_flight)
+        with self.assertRaises(StorageException):
+            limiter.call(_throttled)
+        self.assertEqual(1, limiter.limit)
+
+        memory = InMemory()
+        self.assertIs(
+            memory._limiter(self.bucket_name),
+            memory._limiter(self.bucket_name, "a/b"),
+        )
+        self.assertIsNot(
+            memory._limiter(self.bucket_name),
+            InMemory()._limiter(self.bucket_name),
+        )
+        memory = InMemory(
+            transfer_config=TransferConfig(
+                concurrency=2, max_concurrency=8, limit_per_prefix=True
+            )
+        )
+        limiter = memory._limiter(self.bucket_name, "a/b")
+        self.assertIs(limiter, memory._limiter(self.bucket_name, "a/c"))
+        self.assertIsNot(limiter, memory._limiter(self.bucket_name, "b"))
+        self.assertEqual(2, limiter.limit)
+        self.assertEqual(8, limiter.max_limit)
+
+    def test_disk_cache_unversioned(self):
+        """
+        Asserts objects without a version are read but never cached by a
+        revalidating disk cache.
+        """
+        memory = _Unversioned()
+        with TemporaryDirectory() as directory:
+            cache = DiskCache(directory, 1024 * 1024, revalidate=True)
+            storage = Storage(memory, cache)
+            storage.make_bucket(self.bucket_name)
+            data, size = str_buffer(self.object_data)
+            storage.put_object(self.bucket_name, self.object_name, data, size)
+            for _ in range(2):
+                result = storage.get_object(self.bucket_name, self.object_name)
+                self.assertEqual(self.object_data, loads(result.read()))
+                result.close()
+            self.assertEqual(2, memory.requests["iter_object"])
+            self.assertEqual(0, cache.size)
+
+    def test_memory_cache_concurrent_write(self):
+        """
+        Asserts a read that overlaps a write does not cache the old data.
+        """
+        memory = _Paused()
+        storage = Storage(memory, memory_cache=MemoryCache(1024, 60.0))
+        storage.make_bucket(self.bucket_name)
+        data, size = str_buffer(self.object_data)
+        storage.put_object(self.bucket_name, self.object_name, data, size)
+        results = []
+        reader = Thread(
+            target=lambda: results.append(
+                storage.get_object(self.bucket_name, self.object_name)
+            )
+        )
+        reader.start()
+        self.assertTrue(memory.fetched.wait(5))
+        data, size = str_buffer({"other": "data"})
+        storage.put_object(self.bucket_name, self.object_name, data, size)
+        memory.resume.set()
+        reader.join(5)
+        self.assertEqual(self.object_data, loads(results[0].read()))
+        result = storage.get_object(self.bucket_name, self.object_name)
+        self.assertEqual({"other": "data"}, loads(result.read()))
+
+        cache = MemoryCache(1024, 60.0)
+        generation = cache.reserve(self.bucket_name, self.object_name)
+        cache.discard_prefix(self.bucket_name, None)
+        cache.add(self.bucket_name, self.object_name, b"old", generation)
+        cache.release(self.bucket_name, self.object_name)
+        self.assertIsNone(cache.get(self.bucket_name, self.object_name))
+
+    def test_download_directory_outside(self):
+        """
+        Asserts objects whose names escape the target directory are not
+        written and fail on their own.
+        """
+        prefix = random_str() + "/"
+        escaping = [prefix + "../../escaped", prefix + "a/../../../escaped"]
+        for object_name in [prefix + "kept"] + escaping:
+            data, size = str_buffer(self.object_data)
+            self.storage.put_object(self.bucket_name, object_name, data, size)
+        with TemporaryDirectory() as parent:
+            target = join(parent, "a", "b")
+            result = TransferManager(self.storage).download_directory(
+                self.bucket_name, prefix, target
+            )
+            self.assertEqual([prefix + "kept"], result.transferred)
+            self.assertEqual(sorted(escaping), sorted(result.failed))
+            for err in result.failed.values():
+                self.assertIsInstance(err, StorageException)
+            self.assertFalse(exists(join(parent, "escaped")))
+            self.assertFalse(exists(join(parent, "a", "escaped")))
+            self.assertTrue(exists(join(target, "kept")))
+
+    def test_async_limited_fan_out(self):
+        """
+        Asserts only the requests get_many and put_many fan out wait for
+        the bucket's adaptive limiter.
+        """
+        memory = InMemory()
+        storage = Storage(memory)
+        storage.make_bucket(self.bucket_name)
+        names = [random_str() for _ in range(3)]
+
+        async def _single() -> None:
+            async with AsyncStorage(storage) as aio:
+                for object_name in names:
+                    data, size = str_buffer(object_name)
+                    await aio.put_object(
+                        self.bucket_name, object_name, data, size
+                    )
+                    await aio.get_object(self.bucket_name, object_name)
+                    await aio.stat_object(self.bucket_name, object_name)
+
+        async def _many() -> None:
+            async with AsyncStorage(storage) as aio:
+                await aio.put_many(
+                    self.bucket_name,
+                    {name: str_buffer(name)[0] for name in names},
+                )
+                await aio.get_many(self.bucket_name, names)
+
+        with mock.patch.object(
+            memory, "_limiter", wraps=memory._limiter
+        ) as limiter:
+            asyncio.run(_single())
+            limiter.assert_not_called()
+            asyncio.run(_many())
+            self.assertEqual(2 * len(names), limiter.call_count)
+
+    def test_disk_cache_concurrent_write(self):
+        """
+        Asserts a disk cache fill that overlaps a write or delete does not
+        cache the old data.
+        """
+        for overwrite in (True, False):
+            memory = _Paused()
+            with TemporaryDirectory() as directory:
+                storage = Storage(memory, DiskCache(directory, 1024 * 1024))
+                storage.make_bucket(self.bucket_name)
+                data, size = str_buffer(self.object_data)
+                storage.put_object(
+                    self.bucket_name, self.object_name, data, size
+                )
+                results = []
+                reader = Thread(
+                    target=lambda: results.append(
+                        storage.get_object(self.bucket_name, self.object_name)
+                    )
+                )
+                reader.start()
+                self.assertTrue(memory.fetched.wait(5))
+                if overwrite:
+                    data, size = str_buffer({"other": "data"})
+                    storage.put_object(
+                        self.bucket_name, self.object_name, data, size
+                    )
+                else:
+                    storage.delete_object(self.bucket_name, self.object_name)
+                memory.resume.set()
+                reader.join(5)
+                self.assertEqual(self.object_data, loads(results[0].read()))
+                results[0].close()
+                if overwrite:
+                    result = storage.get_object(
+                        self.bucket_name, self.object_name
+                    )
+                    self.assertEqual({"other": "data"}, loads(result.read()))
+                    result.close()
+                else:
+                    with self.assertRaises(StorageException):
+                        storage.get_object(self.bucket_name, self.object_name)
+
+    def test_async_iter_object_closed(self):
+        """
+        Asserts the stream is closed when a consumer stops reading early.
+        """
+
+        async def _first_chunk(storage: Storage) -> bytes:
+            async with AsyncStorage(storage) as aio:
+                async for chunk in aio.iter_object(
+                    self.bucket_name, self.object_name, chunk_size=2
+                ):
+                    return chunk
+            return b""
+
+        for observer in (None, StorageObserver()):
+            memory = _Tracked()
+            storage = Storage(memory, observer=observer)
+            storage.make_bucket(self.bucket_name)
+            data, size = str_buffer(self.object_data)
+            storage.put_object(self.bucket_name, self.object_name, data, size)
+            self.assertEqual(
+                data.getvalue()[:2], asyncio.run(_first_chunk(storage))
+            )
+            self.assertTrue(memory.closed)
+
+    def test_shared_client_observers(self):
+        """
+        Asserts storages sharing a client keep their own observers.
+        """
+        memory = InMemory()
+        first, second = Metrics(), Metrics()
+        storage = Storage(memory, observer=first)
+        Storage(memory, observer=second)
+        Storage(memory)
+        self.assertEqual((first, second), memory.observers)
+        storage.make_bucket(self.bucket_name)
+        for metrics in (first, second):
+            self.assertIn(
+                'storage_request_duration_seconds_count{backend="InMemory",'
+                'method="make_bucket",status="200"} 1',
+                metrics.render(),
+            )
+        self.assertIn("make_bucket", first.render().split("# HELP")[1])
+        self.assertNotIn("make_bucket", second.render().split("# HELP")[1])
+
+    def test_parallel_map(self):
+        """
+        Asserts a single call skips the thread pool and larger maps get a
+        pool no bigger than their calls.
+        """
+        limiter = self.client._limiter(self.bucket_name)
+        with mock.patch(
+            "multicloud_storage.client.ThreadPoolExecutor"
+        ) as executor:
+            self.assertEqual(
+                [2], self.client._parallel_map(limiter, len, ["ab"])
+            )
+            self.assertEqual([], self.client._parallel_map(limiter, len, []))
+            executor.assert_not_called()
+        self.assertEqual(
+            [1, 2, 3],
+            self.client._parallel_map(limiter, len, ["a", "ab", "abc"]),
+        )
+        with mock.patch(
+            "multicloud_storage.client.ThreadPoolExecutor"
+        ) as executor:
+            executor.return_value.__enter__.return_value.map.return_value = []
+            self.client._parallel_map(limiter, len, ["a", "ab", "abc"])
+            executor.assert_called_once_with(max_workers=3)
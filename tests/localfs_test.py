@@ -0,0 +1,116 @@
+import unittest
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from multicloud_storage import (
+    LocalFS,
+    Metrics,
+    Storage,
+    StorageException,
+)
+from multicloud_storage.http import HttpMethod
+from tests.storage_suite import (
+    StorageSuite,
+    calc_checksum,
+    random_str,
+    str_buffer,
+)
+
+
+class LocalFSTest(StorageSuite, unittest.TestCase):
+    """
+    Runs the storage suite against the LocalFS backend, in a new directory
+    for every test.
+    """
+
+    def make_client(self) -> LocalFS:
+        root = TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        return LocalFS(root.name)
+
+    def test_file_urls(self):
+        """
+        Asserts presigned urls point at the object files.
+        """
+        names = [random_str() for _ in range(3)]
+        urls = self.storage.get_presigned_urls(
+            self.bucket_name, names, method=HttpMethod.GET
+        )
+        for object_name, url in urls.items():
+            self.assertTrue(url.startswith("file://"))
+            self.assertTrue(url.endswith(object_name))
+
+    def test_path_escaping(self):
+        """
+        Asserts names cannot reach outside of the bucket directory.
+        """
+        data, size = str_buffer(self.object_data)
+        for object_name in ("../" + random_str(), "a//b", "a/./b", "/a"):
+            data.seek(0)
+            self.assertRaises(
+                StorageException,
+                self.storage.put_object,
+                self.bucket_name,
+                object_name,
+                data,
+                size,
+            )
+        for bucket_name in ("..", ".hidden", "a/b"):
+            self.assertRaises(
+                StorageException, self.storage.make_bucket, bucket_name
+            )
+
+    def test_md5_sidecar(self):
+        """
+        Asserts checksums fall back to sidecar files without xattr support.
+        """
+        data, size = str_buffer(self.object_data)
+        checksum = calc_checksum(data)
+        data.seek(0)
+        with mock.patch("os.setxattr", side_effect=OSError), mock.patch(
+            "os.getxattr", side_effect=OSError
+        ):
+            self.storage.put_object(
+                self.bucket_name, self.object_name, data, size
+            )
+            self.assertEqual(
+                checksum,
+                self.storage.md5_checksum(self.bucket_name, self.object_name),
+            )
+            self.storage.delete_object(self.bucket_name, self.object_name)
+            self.assertRaises(
+                StorageException,
+                self.storage.md5_checksum,
+                self.bucket_name,
+                self.object_name,
+            )
+
+    def test_metrics(self):
+        """
+        Asserts operations, bytes and errors are recorded. LocalFS sends no
+        backend requests, so none are.
+        """
+        metrics = Metrics()
+        storage = Storage(self.client, observer=metrics)
+        data, size = str_buffer(self.object_data)
+        storage.put_object(self.bucket_name, self.object_name, data, size)
+        storage.get_object(self.bucket_name, self.object_name)
+        with self.assertRaises(StorageException):
+            storage.get_object(self.bucket_name, random_str())
+        text = metrics.render()
+        self.assertIn(
+            'storage_bytes_total{{backend="LocalFS",operation="get_object",'
+            'direction="read"}} {0}'.format(size),
+            text,
+        )
+        self.assertIn(
+            'storage_operation_errors_total{backend="LocalFS",'
+            'operation="get_object",code="ENOENT"} 1',
+            text,
+        )
+        self.assertIn(
+            'storage_operation_duration_seconds_count{backend="LocalFS",'
+            'operation="get_object"} 2',
+            text,
+        )
+        self.assertNotIn("storage_request_duration_seconds_count{", text)
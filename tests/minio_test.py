@@ -1,15 +1,36 @@
-from multicloud_storage.object import last_modified, name
+from multicloud_storage.object import ObjectInfo, last_modified, name
+import asyncio
+from datetime import timedelta
 import random
 import string
 import unittest
+from unittest import mock
 from io import BytesIO
 from json import dumps, loads
 from os import SEEK_END
+from os import makedirs
+from os.path import join
+from tempfile import TemporaryDirectory
 from typing import Tuple
 from hashlib import md5
 
-from multicloud_storage import S3, Storage, StorageException
+from minio.error import ServerError
+
+from multicloud_storage import (
+    AsyncStorage,
+    DiskCache,
+    MemoryCache,
+    Metrics,
+    PoolConfig,
+    RetryPolicy,
+    S3,
+    Storage,
+    StorageException,
+    TransferConfig,
+    TransferManager,
+)
 from multicloud_storage.http import HttpMethod
+from multicloud_storage.minio import MIN_PART_SIZE, _plan_concat
 
 
 def random_str() -> str:
@@ -47,7 +68,7 @@ class S3Test(unittest.TestCase):
     @classmethod
     def tearDownClass(cls):
         try:
-            cls.storage.remove_bucket(cls.bucket_name)
+            cls.storage.remove_bucket(cls.bucket_name, force=True)
         except:  # pylint: disable=bare-except
             pass
 
@@ -85,6 +106,19 @@ class S3Test(unittest.TestCase):
         self.assertTrue(self.storage.bucket_exists(self.temp_bucket_name))
         self.storage.remove_bucket(self.temp_bucket_name)
 
+    def test_bucket_exists_cache(self):
+        """
+        Asserts the bucket cache is shared and invalidated.
+        """
+        other = Storage(self.minio)
+        self.storage.make_bucket(self.temp_bucket_name)
+        self.assertTrue(other.bucket_exists(self.temp_bucket_name))
+        other.remove_bucket(self.temp_bucket_name)
+        self.assertFalse(self.storage.bucket_exists(self.temp_bucket_name))
+        uncached = S3(bucket_cache_ttl=0)
+        Storage(uncached).bucket_exists(self.bucket_name)
+        self.assertFalse(uncached._bucket_cache.exists(self.bucket_name))
+
     def test_make_bucket(self):
         """
         Asserts buckets can be made.
@@ -102,6 +136,48 @@ class S3Test(unittest.TestCase):
             self.storage.make_bucket(self.bucket_name)
         self.storage.remove_bucket(self.bucket_name)
 
+    def test_remove_bucket_force(self):
+        """
+        Asserts non-empty buckets can be removed when forced.
+        """
+        self.storage.make_bucket(self.temp_bucket_name)
+        for object_name in ("a/" + random_str(), random_str()):
+            data, size = str_buffer(self.object_data)
+            self.storage.put_object(
+                self.temp_bucket_name, object_name, data, size
+            )
+        self.assertRaises(
+            StorageException,
+            self.storage.remove_bucket,
+            self.temp_bucket_name,
+        )
+        self.storage.remove_bucket(self.temp_bucket_name, force=True)
+        self.assertFalse(self.storage.bucket_exists(self.temp_bucket_name))
+
+    def test_delete_prefix(self):
+        """
+        Asserts every object under a prefix can be deleted.
+        """
+        prefix = random_str() + "/"
+        names = [prefix + random_str() for _ in range(3)]
+        names.append(prefix + "nested/" + random_str())
+        for object_name in names:
+            data, size = str_buffer(self.object_data)
+            self.storage.put_object(self.bucket_name, object_name, data, size)
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        errors = self.storage.delete_prefix(
+            self.bucket_name, prefix, concurrency=2
+        )
+        self.assertEqual({}, errors)
+        for object_name in names:
+            self.assertFalse(
+                self.storage.object_exists(self.bucket_name, object_name)
+            )
+        self.assertTrue(
+            self.storage.object_exists(self.bucket_name, self.object_name)
+        )
+
     def test_delete_object(self):
         """
         Asserts objects can be deleted.
@@ -116,6 +192,23 @@ class S3Test(unittest.TestCase):
             self.storage.object_exists(self.bucket_name, self.object_name)
         )
 
+    def test_delete_objects(self):
+        """
+        Asserts objects can be deleted in batches.
+        """
+        names = [random_str() for _ in range(3)]
+        for object_name in names:
+            data, size = str_buffer(self.object_data)
+            self.storage.put_object(self.bucket_name, object_name, data, size)
+        errors = self.storage.delete_objects(
+            self.bucket_name, names + [random_str()]
+        )
+        self.assertEqual({}, errors)
+        for object_name in names:
+            self.assertFalse(
+                self.storage.object_exists(self.bucket_name, object_name)
+            )
+
     def test_put_object(self):
         """
         Asserts objects can be written.
@@ -126,6 +219,24 @@ class S3Test(unittest.TestCase):
             self.storage.object_exists(self.bucket_name, self.object_name)
         )
 
+    def test_multipart_put_object(self):
+        """
+        Asserts large objects are uploaded in parallel parts.
+        """
+        storage = Storage(
+            S3(
+                transfer_config=TransferConfig(
+                    threshold=1, part_size=5 * 1024 * 1024, concurrency=2
+                )
+            )
+        )
+        payload = bytes(random.getrandbits(8) for _ in range(1024)) * 11264
+        storage.put_object(
+            self.bucket_name, self.object_name, BytesIO(payload), len(payload)
+        )
+        data = storage.get_object(self.bucket_name, self.object_name)
+        self.assertEqual(payload, data.read())
+
     def test_object_exists(self):
         """
         Asserts object existence can be determined.
@@ -191,6 +302,110 @@ class S3Test(unittest.TestCase):
         data = self.storage.get_object(self.bucket_name, self.object_name)
         self.assertEqual(self.object_data, loads(data.read().decode("utf-8")))
 
+    def test_get_object_range(self):
+        """
+        Asserts a byte range of an object can be retrieved.
+        """
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        expected = dumps(self.object_data).encode()
+        part = self.storage.get_object_range(
+            self.bucket_name, self.object_name, 2, 4
+        )
+        self.assertEqual(expected[2:6], part.read())
+        tail = self.storage.get_object_range(
+            self.bucket_name, self.object_name, 2
+        )
+        self.assertEqual(expected[2:], tail.read())
+        self.assertRaises(
+            StorageException,
+            self.storage.get_object_range,
+            self.bucket_name,
+            self.object_name,
+            0,
+            0,
+        )
+
+    def test_download_to_path(self):
+        """
+        Asserts an object can be downloaded to a file in parallel ranges.
+        """
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        with TemporaryDirectory() as directory:
+            path = join(directory, self.object_name)
+            self.storage.download_to_path(
+                self.bucket_name,
+                self.object_name,
+                path,
+                concurrency=2,
+                part_size=3,
+            )
+            with open(path, "rb") as downloaded:
+                data.seek(0)
+                self.assertEqual(data.read(), downloaded.read())
+
+    def test_open_object(self):
+        """
+        Asserts an object can be read through a file-like reader.
+        """
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        with self.storage.open_object(
+            self.bucket_name, self.object_name
+        ) as reader:
+            self.assertEqual(
+                self.object_data, loads(reader.read().decode("utf-8"))
+            )
+
+    def test_iter_object(self):
+        """
+        Asserts an object can be streamed in chunks.
+        """
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        chunks = list(
+            self.storage.iter_object(
+                self.bucket_name, self.object_name, chunk_size=4
+            )
+        )
+        self.assertGreater(len(chunks), 1)
+        data.seek(0)
+        self.assertEqual(b"".join(chunks), data.read())
+
+    def test_missing_object(self):
+        """
+        Asserts reads of a missing object raise a StorageException, with
+        and without the pre-flight existence checks.
+        """
+        missing_name = random_str()
+        for optimistic in ("false", "true"):
+            with mock.patch.dict(
+                "os.environ", {"STORAGE_OPTIMISTIC": optimistic}
+            ):
+                storage = Storage(S3())
+            self.assertEqual(optimistic == "true", storage._client._optimistic)
+            self.assertRaises(
+                StorageException,
+                storage.get_object,
+                self.bucket_name,
+                missing_name,
+            )
+            self.assertRaises(
+                StorageException,
+                storage.md5_checksum,
+                self.bucket_name,
+                missing_name,
+            )
+            self.assertRaises(
+                StorageException,
+                storage.copy_object,
+                self.bucket_name,
+                missing_name,
+                self.bucket_name,
+                random_str(),
+            )
+
     def test_copy_object(self):
         """
         Asserts an object can be copied from one place to another.
@@ -279,3 +494,385 @@ class S3Test(unittest.TestCase):
             data.read().decode("utf-8"),
             dumps(self.object_data) + dumps(self.object_data),
         )
+
+    def test_concat_large_objects(self):
+        """
+        Asserts sources above the part minimum are concatenated server side.
+        """
+        large = bytes(random.getrandbits(8) for _ in range(1024)) * 12288
+        small = dumps(self.object_data).encode()
+        second_object_name = random_str()
+        self.storage.put_object(
+            self.bucket_name, self.object_name, BytesIO(small), len(small)
+        )
+        self.storage.put_object(
+            self.bucket_name, second_object_name, BytesIO(large), len(large)
+        )
+        # what is left of the large source after topping up the first part
+        # is still large enough to be copied
+        self.assertTrue(
+            any(
+                part.copy
+                for part in _plan_concat(
+                    [
+                        (self.object_name, len(small)),
+                        (second_object_name, len(large)),
+                        (self.object_name, len(small)),
+                    ]
+                )
+            )
+        )
+        with mock.patch.object(
+            self.minio._minio_client,
+            "_upload_part_copy",
+            wraps=self.minio._minio_client._upload_part_copy,
+        ) as upload_part_copy:
+            self.storage.concat_objects(
+                self.bucket_name,
+                self.object_name,
+                [self.object_name, second_object_name, self.object_name],
+            )
+        upload_part_copy.assert_called_once()
+        self.storage.delete_object(self.bucket_name, second_object_name)
+        data = self.storage.get_object(self.bucket_name, self.object_name)
+        self.assertEqual(small + large + small, data.read())
+
+    def test_retry_failed_part(self):
+        """
+        Asserts a part failing with a server error is uploaded again without
+        restarting the whole upload.
+        """
+        minio = S3(
+            transfer_config=TransferConfig(
+                threshold=MIN_PART_SIZE, part_size=MIN_PART_SIZE
+            ),
+            retry_policy=RetryPolicy(base_delay=0.0),
+        )
+        storage = Storage(minio)
+        content = bytes(random.getrandbits(8) for _ in range(1024)) * 12288
+        upload_part = minio._minio_client._upload_part
+        failed = []
+
+        def _fail_once(bucket_name, name, chunk, headers, upload_id, number):
+            if number == 2 and not failed:
+                failed.append(number)
+                raise ServerError("internal error", 500)
+            return upload_part(
+                bucket_name, name, chunk, headers, upload_id, number
+            )
+
+        with mock.patch.object(
+            minio._minio_client, "_upload_part", side_effect=_fail_once
+        ) as patched:
+            storage.put_object(
+                self.bucket_name,
+                self.object_name,
+                BytesIO(content),
+                len(content),
+            )
+        self.assertEqual([2], failed)
+        self.assertEqual(4, patched.call_count)
+        data = storage.get_object(self.bucket_name, self.object_name)
+        self.assertEqual(content, data.read())
+
+    def test_concat_small_objects(self):
+        """
+        Asserts many small sources are uploaded in parts rather than joined
+        into a single upload.
+        """
+        shard = bytes(random.getrandbits(8) for _ in range(1024)) * 2048
+        names = [random_str() for _ in range(4)]
+        for shard_name in names:
+            self.storage.put_object(
+                self.bucket_name, shard_name, BytesIO(shard), len(shard)
+            )
+        with mock.patch.object(
+            self.minio, "put_object", wraps=self.minio.put_object
+        ) as put_object:
+            self.storage.concat_objects(
+                self.bucket_name, self.object_name, names
+            )
+        put_object.assert_not_called()
+        self.storage.delete_objects(self.bucket_name, names)
+        data = self.storage.get_object(self.bucket_name, self.object_name)
+        self.assertEqual(shard * len(names), data.read())
+
+    def test_async_storage(self):
+        """
+        Asserts objects can be written and read through the asyncio facade.
+        """
+        names = [random_str() for _ in range(5)]
+
+        async def _roundtrip():
+            async with AsyncStorage(self.storage, max_concurrency=2) as aio:
+                await aio.put_many(
+                    self.bucket_name,
+                    {name: str_buffer(name)[0] for name in names},
+                )
+                objects = await aio.get_many(self.bucket_name, names)
+                await aio.delete_objects(self.bucket_name, names)
+                return objects
+
+        objects = asyncio.run(_roundtrip())
+        self.assertEqual(
+            names, [loads(data.read().decode("utf-8")) for data in objects]
+        )
+
+    def test_transfer_manager(self):
+        """
+        Asserts directories can be uploaded to and downloaded from a prefix.
+        """
+        prefix = random_str() + "/"
+        manager = TransferManager(self.storage, concurrency=2)
+        progress = []
+        with TemporaryDirectory() as source, TemporaryDirectory() as target:
+            makedirs(join(source, "nested"))
+            for path in ("first", join("nested", "second")):
+                with open(join(source, path), "w") as outfile:
+                    outfile.write(dumps(self.object_data))
+            result = manager.upload_directory(
+                source,
+                self.bucket_name,
+                prefix,
+                progress=lambda name, size: progress.append(name),
+            )
+            result.raise_for_errors()
+            self.assertEqual(
+                sorted([prefix + "first", prefix + "nested/second"]),
+                sorted(progress),
+            )
+            result = manager.download_directory(
+                self.bucket_name, prefix, target
+            )
+            result.raise_for_errors()
+            with open(join(target, "nested", "second")) as infile:
+                self.assertEqual(self.object_data, loads(infile.read()))
+        self.storage.delete_prefix(self.bucket_name, prefix)
+
+    def test_list_objects_page(self):
+        """
+        Asserts listings can be paged, resumed and rolled up by delimiter.
+        """
+        prefix = random_str() + "/"
+        names = [prefix + "{0:02d}".format(i) for i in range(5)]
+        for object_name in names + [prefix + "dir/nested"]:
+            data, size = str_buffer(self.object_data)
+            self.storage.put_object(self.bucket_name, object_name, data, size)
+        listed = []
+        page_token = None
+        while True:
+            page = self.storage.list_objects_page(
+                self.bucket_name,
+                prefix,
+                page_token=page_token,
+                max_keys=2,
+                delimiter="/",
+            )
+            listed.extend(name(obj) for obj in page.objects)
+            self.assertLessEqual(len(page.objects) + len(page.prefixes), 2)
+            if page.prefixes:
+                self.assertEqual([prefix + "dir/"], page.prefixes)
+            page_token = page.next_token
+            if page_token is None:
+                break
+        self.assertEqual(names, listed)
+        page = self.storage.list_objects_page(
+            self.bucket_name, prefix, start_after=names[2]
+        )
+        self.assertEqual(
+            names[3:] + [prefix + "dir/nested"],
+            [name(obj) for obj in page.objects],
+        )
+        self.assertIsNone(page.next_token)
+        self.storage.delete_prefix(self.bucket_name, prefix)
+
+    def test_list_objects_compact(self):
+        """
+        Asserts compact listings return ObjectInfo records.
+        """
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        objects = [
+            obj
+            for obj in self.storage.list_objects(
+                self.bucket_name, self.object_name, compact=True
+            )
+            if name(obj) == self.object_name
+        ]
+        self.assertEqual(1, len(objects))
+        self.assertIsInstance(objects[0], ObjectInfo)
+        self.assertEqual(size, objects[0].size)
+        self.assertIsNotNone(objects[0].etag)
+        self.assertIsNotNone(last_modified(objects[0]))
+
+    def test_disk_cache(self):
+        """
+        Asserts cached reads are revalidated and dropped on overwrite.
+        """
+        with TemporaryDirectory() as directory:
+            storage = Storage(
+                self.minio, DiskCache(directory, 1024 * 1024, revalidate=True)
+            )
+            data, size = str_buffer(self.object_data)
+            storage.put_object(self.bucket_name, self.object_name, data, size)
+            for _ in range(2):
+                result = storage.get_object(self.bucket_name, self.object_name)
+                self.assertEqual(self.object_data, loads(result.read()))
+                result.close()
+            data, size = str_buffer({"other": "data"})
+            storage.put_object(self.bucket_name, self.object_name, data, size)
+            result = storage.get_object(self.bucket_name, self.object_name)
+            self.assertEqual({"other": "data"}, loads(result.read()))
+            result.close()
+            data, size = str_buffer(self.object_data)
+            self.storage.put_object(
+                self.bucket_name, self.object_name, data, size
+            )
+            result = storage.get_object(self.bucket_name, self.object_name)
+            self.assertEqual(self.object_data, loads(result.read()))
+            result.close()
+
+    def test_memory_cache(self):
+        """
+        Asserts cached reads are dropped by writes through the same storage.
+        """
+        storage = Storage(self.minio, memory_cache=MemoryCache(1024, 60.0))
+        data, size = str_buffer(self.object_data)
+        storage.put_object(self.bucket_name, self.object_name, data, size)
+        for _ in range(2):
+            result = storage.get_object(self.bucket_name, self.object_name)
+            self.assertEqual(self.object_data, loads(result.read()))
+        data, size = str_buffer({"other": "data"})
+        storage.put_object(self.bucket_name, self.object_name, data, size)
+        result = storage.get_object(self.bucket_name, self.object_name)
+        self.assertEqual({"other": "data"}, loads(result.read()))
+        storage.delete_object(self.bucket_name, self.object_name)
+        with self.assertRaises(StorageException):
+            storage.get_object(self.bucket_name, self.object_name)
+
+    def test_get_presigned_urls(self):
+        """
+        Asserts presigned urls can be generated in batches.
+        """
+        names = [random_str() for _ in range(3)]
+        hostname = random_str()
+        urls = self.storage.get_presigned_urls(
+            self.bucket_name,
+            names,
+            method=HttpMethod.GET,
+            use_hostname=hostname,
+        )
+        self.assertEqual(names, list(urls))
+        for object_name, url in urls.items():
+            self.assertIn(hostname, url)
+            self.assertIn(object_name, url)
+        self.assertRaises(
+            StorageException,
+            self.storage.get_presigned_urls,
+            self.bucket_name,
+            names,
+            method=HttpMethod.GET,
+            verify=True,
+        )
+
+    def test_signed_url_window(self):
+        """
+        Asserts urls signed within one window are identical.
+        """
+        storage = Storage(S3(signed_url_window=3600.0))
+        data, size = str_buffer(self.object_data)
+        storage.put_object(self.bucket_name, self.object_name, data, size)
+        urls = [
+            storage.get_presigned_url(
+                self.bucket_name,
+                self.object_name,
+                method=HttpMethod.GET,
+                expires=timedelta(days=1),
+            )
+            for _ in range(2)
+        ]
+        self.assertEqual(urls[0], urls[1])
+
+    def test_metrics(self):
+        """
+        Asserts operations, bytes, errors and backend requests are recorded.
+        """
+        metrics = Metrics()
+        storage = Storage(S3(), observer=metrics)
+        data, size = str_buffer(self.object_data)
+        storage.put_object(self.bucket_name, self.object_name, data, size)
+        storage.get_object(self.bucket_name, self.object_name)
+        with self.assertRaises(StorageException):
+            storage.get_object(self.bucket_name, random_str())
+        text = metrics.render()
+        self.assertIn(
+            'storage_bytes_total{{backend="S3",operation="get_object",'
+            'direction="read"}} {0}'.format(size),
+            text,
+        )
+        self.assertIn(
+            'storage_operation_errors_total{backend="S3",'
+            'operation="get_object",code="NoSuchKey"} 1',
+            text,
+        )
+        self.assertIn(
+            'storage_operation_duration_seconds_count{backend="S3",'
+            'operation="get_object"} 2',
+            text,
+        )
+        self.assertIn(
+            'storage_request_duration_seconds_count{backend="S3"',
+            text,
+        )
+
+    def test_retry_policy(self):
+        """
+        Asserts errors that cannot go away are not retried.
+        """
+        metrics = Metrics()
+        storage = Storage(
+            S3(retry_policy=RetryPolicy(base_delay=0.0)), observer=metrics
+        )
+        with self.assertRaises(StorageException):
+            storage.get_object(self.bucket_name, random_str())
+        with self.assertRaises(StorageException):
+            storage.make_bucket(self.bucket_name)
+        self.assertNotIn("storage_retries_total{", metrics.render())
+
+    def test_pool_config(self):
+        """
+        Asserts the connection pool is sized to the client's concurrency
+        and leaves error responses to the retry policy.
+        """
+        client = S3(transfer_config=TransferConfig(max_concurrency=16))
+        Storage(client)
+        pool = client._minio_client._http.connection_pool_kw
+        self.assertEqual(16, pool["maxsize"])
+        self.assertEqual(0, pool["retries"].status)
+
+        client = S3(pool_config=PoolConfig(max_size=4, read_timeout=5.0))
+        storage = Storage(client)
+        pool = client._minio_client._http.connection_pool_kw
+        self.assertEqual(4, pool["maxsize"])
+        self.assertEqual(5.0, pool["timeout"].read_timeout)
+        self.assertTrue(storage.bucket_exists(self.bucket_name))
+
+    def test_presigned_urls_without_pool(self):
+        """
+        Asserts urls are signed without a thread pool, and a single url is
+        verified on the calling thread.
+        """
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        with mock.patch(
+            "multicloud_storage.client.ThreadPoolExecutor"
+        ) as executor:
+            self.storage.get_presigned_urls(
+                self.bucket_name,
+                [random_str() for _ in range(3)],
+                method=HttpMethod.GET,
+            )
+            self.storage.get_presigned_url(
+                self.bucket_name, self.object_name, method=HttpMethod.GET
+            )
+            executor.assert_not_called()
@@ -0,0 +1,603 @@
+"""
+Backend independent cases run against every StorageClient that needs no
+external service. A test module subclasses StorageSuite together with
+unittest.TestCase and provides the client in make_client.
+"""
+from multicloud_storage.object import ObjectInfo, last_modified, name
+import asyncio
+import random
+import string
+from hashlib import md5
+from io import BytesIO
+from json import dumps, loads
+from os import SEEK_END
+from os import makedirs
+from os.path import exists, join
+from tempfile import TemporaryDirectory
+from typing import List, Tuple
+
+from multicloud_storage import (
+    AsyncStorage,
+    DiskCache,
+    MemoryCache,
+    Storage,
+    StorageException,
+    TransferManager,
+)
+from multicloud_storage.client import StorageClient
+from multicloud_storage.http import HttpMethod
+
+
+def random_str() -> str:
+    letters = string.ascii_lowercase
+    return "".join(random.choice(letters) for i in range(10))
+
+
+def str_buffer(json_object: object) -> Tuple[BytesIO, int]:
+    data = BytesIO()
+    data.write(dumps(json_object).encode())
+    data.seek(0, SEEK_END)
+    num_bytes = data.tell()
+    data.seek(0)
+    return data, num_bytes
+
+
+def calc_checksum(data: BytesIO) -> str:
+    md5_hash = md5(data.read())
+    return md5_hash.hexdigest()
+
+
+class StorageSuite:
+    """
+    StorageSuite.
+    The client code should be able to work with any pre-configured abstraction-
+    implementation combination. Every test gets a new client and bucket.
+    """
+
+    object_data = {"test": "test"}
+
+    def make_client(self) -> StorageClient:
+        raise NotImplementedError
+
+    def setUp(self) -> None:
+        self.client = self.make_client()
+        self.storage = Storage(self.client)
+        self.bucket_name = random_str()
+        self.temp_bucket_name = random_str()
+        self.object_name = random_str()
+        self.storage.make_bucket(self.bucket_name)
+
+    def tearDown(self) -> None:
+        for bucket_name in (self.bucket_name, self.temp_bucket_name):
+            try:
+                self.storage.remove_bucket(bucket_name, force=True)
+            except:  # pylint: disable=bare-except
+                pass
+
+    def test_is_abstract(self):
+        self.assertEqual(Storage, type(self.storage))
+        self.assertNotEqual(Storage, type(self.client))
+
+    def test_bucket_exists(self):
+        """
+        Asserts that buckets exist.
+        """
+        self.assertFalse(self.storage.bucket_exists(self.temp_bucket_name))
+        self.storage.make_bucket(self.temp_bucket_name)
+        self.assertTrue(self.storage.bucket_exists(self.temp_bucket_name))
+        self.storage.remove_bucket(self.temp_bucket_name)
+
+    def test_make_bucket(self):
+        """
+        Asserts buckets can be made.
+        """
+        self.storage.make_bucket(self.temp_bucket_name)
+        self.assertRaises(
+            StorageException, self.storage.make_bucket, self.temp_bucket_name
+        )
+
+    def test_remove_bucket(self):
+        """
+        Asserts buckets can be deleted.
+        """
+        if not self.storage.bucket_exists(self.bucket_name):
+            self.storage.make_bucket(self.bucket_name)
+        self.storage.remove_bucket(self.bucket_name)
+
+    def test_remove_bucket_force(self):
+        """
+        Asserts non-empty buckets can be removed when forced.
+        """
+        self.storage.make_bucket(self.temp_bucket_name)
+        for object_name in ("a/" + random_str(), random_str()):
+            data, size = str_buffer(self.object_data)
+            self.storage.put_object(
+                self.temp_bucket_name, object_name, data, size
+            )
+        self.assertRaises(
+            StorageException,
+            self.storage.remove_bucket,
+            self.temp_bucket_name,
+        )
+        self.storage.remove_bucket(self.temp_bucket_name, force=True)
+        self.assertFalse(self.storage.bucket_exists(self.temp_bucket_name))
+
+    def test_delete_prefix(self):
+        """
+        Asserts every object under a prefix can be deleted.
+        """
+        prefix = random_str() + "/"
+        names = [prefix + random_str() for _ in range(3)]
+        names.append(prefix + "nested/" + random_str())
+        for object_name in names:
+            data, size = str_buffer(self.object_data)
+            self.storage.put_object(self.bucket_name, object_name, data, size)
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        errors = self.storage.delete_prefix(
+            self.bucket_name, prefix, concurrency=2
+        )
+        self.assertEqual({}, errors)
+        for object_name in names:
+            self.assertFalse(
+                self.storage.object_exists(self.bucket_name, object_name)
+            )
+        self.assertTrue(
+            self.storage.object_exists(self.bucket_name, self.object_name)
+        )
+
+    def test_delete_object(self):
+        """
+        Asserts objects can be deleted.
+        """
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        self.assertTrue(
+            self.storage.object_exists(self.bucket_name, self.object_name)
+        )
+        self.storage.delete_object(self.bucket_name, self.object_name)
+        self.assertFalse(
+            self.storage.object_exists(self.bucket_name, self.object_name)
+        )
+
+    def test_delete_objects(self):
+        """
+        Asserts objects can be deleted in batches.
+        """
+        names = [random_str() for _ in range(3)]
+        for object_name in names:
+            data, size = str_buffer(self.object_data)
+            self.storage.put_object(self.bucket_name, object_name, data, size)
+        errors = self.storage.delete_objects(
+            self.bucket_name, names + [random_str()]
+        )
+        self.assertEqual({}, errors)
+        for object_name in names:
+            self.assertFalse(
+                self.storage.object_exists(self.bucket_name, object_name)
+            )
+
+    def test_put_object(self):
+        """
+        Asserts objects can be written.
+        """
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        self.assertTrue(
+            self.storage.object_exists(self.bucket_name, self.object_name)
+        )
+
+    def test_object_exists(self):
+        """
+        Asserts object existence can be determined.
+        """
+        self.assertFalse(
+            self.storage.object_exists(self.bucket_name, self.object_name)
+        )
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        self.assertTrue(
+            self.storage.object_exists(self.bucket_name, self.object_name)
+        )
+
+    def test_get_object(self):
+        """
+        Asserts an object can be retrieved from the storage implementation.
+        """
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        data = self.storage.get_object(self.bucket_name, self.object_name)
+        self.assertEqual(self.object_data, loads(data.read().decode("utf-8")))
+
+    def test_get_object_range(self):
+        """
+        Asserts a byte range of an object can be retrieved.
+        """
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        expected = dumps(self.object_data).encode()
+        part = self.storage.get_object_range(
+            self.bucket_name, self.object_name, 2, 4
+        )
+        self.assertEqual(expected[2:6], part.read())
+        tail = self.storage.get_object_range(
+            self.bucket_name, self.object_name, 2
+        )
+        self.assertEqual(expected[2:], tail.read())
+        self.assertRaises(
+            StorageException,
+            self.storage.get_object_range,
+            self.bucket_name,
+            self.object_name,
+            0,
+            0,
+        )
+
+    def test_download_to_path(self):
+        """
+        Asserts an object can be downloaded to a file in parallel ranges.
+        """
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        with TemporaryDirectory() as directory:
+            path = join(directory, self.object_name)
+            self.storage.download_to_path(
+                self.bucket_name,
+                self.object_name,
+                path,
+                concurrency=2,
+                part_size=3,
+            )
+            with open(path, "rb") as downloaded:
+                data.seek(0)
+                self.assertEqual(data.read(), downloaded.read())
+
+    def test_download_overwritten(self):
+        """
+        Asserts a download fails when the object is overwritten while its
+        ranges are read, instead of mixing both versions.
+        """
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        get_object_range = self.client.get_object_range
+
+        def _overwrite(*args):
+            if not overwritten:
+                overwritten.append(True)
+                data, size = str_buffer({"other": "data"})
+                self.client.put_object(
+                    self.bucket_name, self.object_name, data, size
+                )
+            return get_object_range(*args)
+
+        overwritten: List[bool] = []
+        self.client.get_object_range = _overwrite
+        with TemporaryDirectory() as directory:
+            path = join(directory, self.object_name)
+            with self.assertRaises(StorageException) as raised:
+                self.storage.download_to_path(
+                    self.bucket_name,
+                    self.object_name,
+                    path,
+                    concurrency=1,
+                    part_size=3,
+                )
+            self.assertEqual("PreconditionFailed", raised.exception.code)
+            self.assertFalse(exists(path))
+
+    def test_open_object(self):
+        """
+        Asserts an object can be read through a file-like reader.
+        """
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        with self.storage.open_object(
+            self.bucket_name, self.object_name
+        ) as reader:
+            self.assertEqual(
+                self.object_data, loads(reader.read().decode("utf-8"))
+            )
+
+    def test_iter_object(self):
+        """
+        Asserts an object can be streamed in chunks.
+        """
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        chunks = list(
+            self.storage.iter_object(
+                self.bucket_name, self.object_name, chunk_size=4
+            )
+        )
+        self.assertGreater(len(chunks), 1)
+        data.seek(0)
+        self.assertEqual(b"".join(chunks), data.read())
+
+    def test_missing_object(self):
+        """
+        Asserts reads of a missing object raise a StorageException.
+        """
+        missing_name = random_str()
+        self.assertRaises(
+            StorageException,
+            self.storage.get_object,
+            self.bucket_name,
+            missing_name,
+        )
+        self.assertRaises(
+            StorageException,
+            self.storage.md5_checksum,
+            self.bucket_name,
+            missing_name,
+        )
+        self.assertRaises(
+            StorageException,
+            self.storage.copy_object,
+            self.bucket_name,
+            missing_name,
+            self.bucket_name,
+            random_str(),
+        )
+
+    def test_copy_object(self):
+        """
+        Asserts an object can be copied from one place to another.
+        """
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        new_object_name = random_str()
+        self.storage.copy_object(
+            self.bucket_name,
+            self.object_name,
+            self.bucket_name,
+            new_object_name,
+        )
+        self.assertTrue(
+            self.storage.object_exists(self.bucket_name, new_object_name)
+        )
+        new_data = self.storage.get_object(self.bucket_name, new_object_name)
+        data.seek(0)
+        self.assertEqual(new_data.read(), data.read())
+        self.storage.delete_object(self.bucket_name, new_object_name)
+
+    def test_rename_object(self):
+        """
+        Asserts an object can be renamed.
+        """
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        new_object_name = random_str()
+        self.storage.rename_object(
+            self.bucket_name, self.object_name, new_object_name
+        )
+        self.assertFalse(
+            self.storage.object_exists(self.bucket_name, self.object_name)
+        )
+        self.assertTrue(
+            self.storage.object_exists(self.bucket_name, new_object_name)
+        )
+
+    def test_md5_hash(self):
+        """
+        Asserts it is possible to retrieve an md5 hash.
+        """
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        self.storage.md5_checksum(self.bucket_name, self.object_name)
+        checksum = self.storage.md5_checksum(
+            self.bucket_name, self.object_name
+        )
+        self.assertGreater(len(checksum), 0)
+        data.seek(0)
+        self.assertEqual(calc_checksum(data), checksum)
+
+    def test_list_objects(self):
+        """
+        Asserts it is possible to list objects.
+        """
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        objects = self.storage.list_objects(self.bucket_name)
+        retrieved_object = next(objects)
+        self.assertEqual(len(str(self.object_data)), retrieved_object.size)
+        self.assertNotEqual(None, last_modified(retrieved_object))
+        self.assertEqual(self.object_name, name(retrieved_object))
+
+    def test_concat_objects(self):
+        """
+        Asserts it is possible to concat objects.
+        """
+        second_object_name = random_str()
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        data.seek(0)
+        self.storage.put_object(
+            self.bucket_name, second_object_name, data, size
+        )
+        self.storage.concat_objects(
+            self.bucket_name,
+            self.object_name,
+            [self.object_name, second_object_name],
+        )
+        self.storage.delete_object(self.bucket_name, second_object_name)
+
+        self.storage.get_object(self.bucket_name, self.object_name)
+        data = self.storage.get_object(self.bucket_name, self.object_name)
+        self.assertEqual(
+            data.read().decode("utf-8"),
+            dumps(self.object_data) + dumps(self.object_data),
+        )
+
+    def test_async_storage(self):
+        """
+        Asserts objects can be written and read through the asyncio facade.
+        """
+        names = [random_str() for _ in range(5)]
+
+        async def _roundtrip():
+            async with AsyncStorage(self.storage, max_concurrency=2) as aio:
+                await aio.put_many(
+                    self.bucket_name,
+                    {name: str_buffer(name)[0] for name in names},
+                )
+                objects = await aio.get_many(self.bucket_name, names)
+                await aio.delete_objects(self.bucket_name, names)
+                return objects
+
+        objects = asyncio.run(_roundtrip())
+        self.assertEqual(
+            names, [loads(data.read().decode("utf-8")) for data in objects]
+        )
+
+    def test_transfer_manager(self):
+        """
+        Asserts directories can be uploaded to and downloaded from a prefix.
+        """
+        prefix = random_str() + "/"
+        manager = TransferManager(self.storage, concurrency=2)
+        progress = []
+        with TemporaryDirectory() as source, TemporaryDirectory() as target:
+            makedirs(join(source, "nested"))
+            for path in ("first", join("nested", "second")):
+                with open(join(source, path), "w") as outfile:
+                    outfile.write(dumps(self.object_data))
+            result = manager.upload_directory(
+                source,
+                self.bucket_name,
+                prefix,
+                progress=lambda name, size: progress.append(name),
+            )
+            result.raise_for_errors()
+            self.assertEqual(
+                sorted([prefix + "first", prefix + "nested/second"]),
+                sorted(progress),
+            )
+            result = manager.download_directory(
+                self.bucket_name, prefix, target
+            )
+            result.raise_for_errors()
+            with open(join(target, "nested", "second")) as infile:
+                self.assertEqual(self.object_data, loads(infile.read()))
+        self.storage.delete_prefix(self.bucket_name, prefix)
+
+    def test_list_objects_page(self):
+        """
+        Asserts listings can be paged, resumed and rolled up by delimiter.
+        """
+        prefix = random_str() + "/"
+        names = [prefix + "{0:02d}".format(i) for i in range(5)]
+        for object_name in names + [prefix + "dir/nested"]:
+            data, size = str_buffer(self.object_data)
+            self.storage.put_object(self.bucket_name, object_name, data, size)
+        listed = []
+        page_token = None
+        while True:
+            page = self.storage.list_objects_page(
+                self.bucket_name,
+                prefix,
+                page_token=page_token,
+                max_keys=2,
+                delimiter="/",
+            )
+            listed.extend(name(obj) for obj in page.objects)
+            self.assertLessEqual(len(page.objects) + len(page.prefixes), 2)
+            if page.prefixes:
+                self.assertEqual([prefix + "dir/"], page.prefixes)
+            page_token = page.next_token
+            if page_token is None:
+                break
+        self.assertEqual(names, listed)
+        page = self.storage.list_objects_page(
+            self.bucket_name, prefix, start_after=names[2]
+        )
+        self.assertEqual(
+            names[3:] + [prefix + "dir/nested"],
+            [name(obj) for obj in page.objects],
+        )
+        self.assertIsNone(page.next_token)
+        self.storage.delete_prefix(self.bucket_name, prefix)
+
+    def test_list_objects_compact(self):
+        """
+        Asserts compact listings return ObjectInfo records.
+        """
+        data, size = str_buffer(self.object_data)
+        self.storage.put_object(self.bucket_name, self.object_name, data, size)
+        objects = [
+            obj
+            for obj in self.storage.list_objects(
+                self.bucket_name, self.object_name, compact=True
+            )
+            if name(obj) == self.object_name
+        ]
+        self.assertEqual(1, len(objects))
+        self.assertIsInstance(objects[0], ObjectInfo)
+        self.assertEqual(size, objects[0].size)
+        self.assertIsNotNone(objects[0].etag)
+        self.assertIsNotNone(last_modified(objects[0]))
+
+    def test_disk_cache(self):
+        """
+        Asserts cached reads are revalidated and dropped on overwrite.
+        """
+        with TemporaryDirectory() as directory:
+            storage = Storage(
+                self.client, DiskCache(directory, 1024 * 1024, revalidate=True)
+            )
+            data, size = str_buffer(self.object_data)
+            storage.put_object(self.bucket_name, self.object_name, data, size)
+            for _ in range(2):
+                result = storage.get_object(self.bucket_name, self.object_name)
+                self.assertEqual(self.object_data, loads(result.read()))
+                with result.getbuffer() as view:
+                    self.assertEqual(result.getvalue(), bytes(view))
+                result.close()
+            data, size = str_buffer({"other": "data"})
+            storage.put_object(self.bucket_name, self.object_name, data, size)
+            result = storage.get_object(self.bucket_name, self.object_name)
+            self.assertEqual({"other": "data"}, loads(result.read()))
+            result.close()
+            data, size = str_buffer(self.object_data)
+            self.storage.put_object(
+                self.bucket_name, self.object_name, data, size
+            )
+            result = storage.get_object(self.bucket_name, self.object_name)
+            self.assertEqual(self.object_data, loads(result.read()))
+            result.close()
+
+    def test_memory_cache(self):
+        """
+        Asserts cached reads are dropped by writes through the same storage.
+        """
+        storage = Storage(self.client, memory_cache=MemoryCache(1024, 60.0))
+        data, size = str_buffer(self.object_data)
+        storage.put_object(self.bucket_name, self.object_name, data, size)
+        for _ in range(2):
+            result = storage.get_object(self.bucket_name, self.object_name)
+            self.assertEqual(self.object_data, loads(result.read()))
+        data, size = str_buffer({"other": "data"})
+        storage.put_object(self.bucket_name, self.object_name, data, size)
+        result = storage.get_object(self.bucket_name, self.object_name)
+        self.assertEqual({"other": "data"}, loads(result.read()))
+        storage.delete_object(self.bucket_name, self.object_name)
+        with self.assertRaises(StorageException):
+            storage.get_object(self.bucket_name, self.object_name)
+
+
+    def test_get_presigned_urls(self):
+        """
+        Asserts urls can be generated in batches and verified.
+        """
+        names = [random_str() for _ in range(3)]
+        urls = self.storage.get_presigned_urls(
+            self.bucket_name, names, method=HttpMethod.GET
+        )
+        self.assertEqual(names, list(urls))
+        self.assertRaises(
+            StorageException,
+            self.storage.get_presigned_urls,
+            self.bucket_name,
+            names,
+            method=HttpMethod.GET,
+            verify=True,
+        )